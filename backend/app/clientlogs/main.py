@@ -19,6 +19,8 @@ import uuid
 import os
 from dotenv import load_dotenv
 
+from publish_accounting import PublishAccounting
+
 # Load environment variables
 load_dotenv()
 
@@ -28,6 +30,12 @@ MOSQUITTO_ADMIN_PASSWORD = os.getenv("MOSQUITTO_ADMIN_PASSWORD", "bunker")
 MOSQUITTO_IP = os.getenv("MOSQUITTO_IP", "localhost")
 MOSQUITTO_PORT = os.getenv("MOSQUITTO_PORT", "1883")
 
+# Publish accounting: width of one rate bucket, longest window kept, and how many
+# clients (and usernames) are tracked before the longest idle one is dropped
+PUBLISH_ACCOUNTING_BUCKET_SECONDS = int(os.getenv("PUBLISH_ACCOUNTING_BUCKET_SECONDS", "10"))
+PUBLISH_ACCOUNTING_WINDOW_SECONDS = int(os.getenv("PUBLISH_ACCOUNTING_WINDOW_SECONDS", "900"))
+PUBLISH_ACCOUNTING_MAX_CLIENTS = int(os.getenv("PUBLISH_ACCOUNTING_MAX_CLIENTS", "10000"))
+
 # Base command for mosquitto_ctrl
 MOSQUITTO_BASE_COMMAND = [
     "mosquitto_ctrl",
@@ -163,6 +171,11 @@ app.add_middleware(TrustedHostMiddleware, allowed_hosts=ALLOWED_HOSTS)
 
 # Initialize MQTT monitor
 mqtt_monitor = MQTTMonitor()
+publish_accounting = PublishAccounting(
+    bucket_seconds=PUBLISH_ACCOUNTING_BUCKET_SECONDS,
+    window_seconds=PUBLISH_ACCOUNTING_WINDOW_SECONDS,
+    max_keys=PUBLISH_ACCOUNTING_MAX_CLIENTS
+)
 
 def execute_mosquitto_command(command: list) -> None:
     """Execute a mosquitto_ctrl command with the base configuration"""
@@ -204,6 +217,16 @@ async def get_connected_clients():
     print(f"Current connected clients: {len(mqtt_monitor.connected_clients)}")
     return {"clients": [client.dict() for client in mqtt_monitor.connected_clients.values()]}
 
+@app.get("/api/v1/top-talkers")
+async def get_top_talkers(by: str = "client", window: int = 60, sort: str = "messages", limit: int = 10):
+    """Clients (by=client) or usernames (by=username) that published the most in the last `window` seconds"""
+    try:
+        result = publish_accounting.top_talkers(by=by, window=window, sort=sort, limit=max(1, min(limit, 100)))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    result["accounting"] = publish_accounting.stats()
+    return result
+
 def monitor_mosquitto_logs():
     print("Starting mosquitto log monitoring...")
     process = subprocess.Popen(
@@ -218,9 +241,16 @@ def monitor_mosquitto_logs():
         line = process.stdout.readline()
         if line:
             line = line.strip()
+            # With log_type all most lines are publishes; account them before the connection parsers
+            if publish_accounting.process_line(line):
+                continue
             event = mqtt_monitor.parse_connection_log(line)
-            if not event:
+            if event:
+                publish_accounting.set_username(event.client_id, event.username)
+            else:
                 event = mqtt_monitor.parse_disconnection_log(line)
+                if event:
+                    publish_accounting.forget_client(event.client_id)
 
 if __name__ == "__main__":
     # Start log monitoring in a separate thread
@@ -0,0 +1,202 @@
+# Copyright (c) 2025 BunkerM
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# You may not use this file except in compliance with the License.
+# http://www.apache.org/licenses/LICENSE-2.0
+# Distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND.
+#
+import heapq
+import re
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from typing import Dict, Optional
+
+# "1700000000: Received PUBLISH from sensor-1 (d0, q1, r0, m3, 'site/temp', ... (12 bytes))"
+PUBLISH_PATTERN = re.compile(
+    r"^(\d+): Received PUBLISH from (\S+) \(d\d, q(\d), r(\d), m\d+, '(.*)', \.\.\. \((\d+) bytes\)\)$"
+)
+_PUBLISH_MARKER = " Received PUBLISH from "
+
+
+class SlidingCounter:
+    """Messages and bytes of one client or user in a ring of fixed-width time buckets.
+
+    Slots are only cleared when the key publishes again, so an idle key
+    costs nothing; reads skip slots that have fallen out of the window.
+    """
+
+    __slots__ = ("messages", "bytes", "last_bucket", "last_seen", "total_messages", "total_bytes", "username")
+
+    def __init__(self, slots: int):
+        self.messages = array('I', [0]) * slots
+        self.bytes = array('Q', [0]) * slots
+        self.last_bucket = -1
+        self.last_seen = 0
+        self.total_messages = 0
+        self.total_bytes = 0
+        self.username: Optional[str] = None
+
+    def add(self, bucket: int, size: int, timestamp: int):
+        slots = len(self.messages)
+        if bucket > self.last_bucket:
+            # Clear the slots of buckets skipped since the last publish
+            for skipped in range(max(self.last_bucket + 1, bucket - slots + 1), bucket + 1):
+                self.messages[skipped % slots] = 0
+                self.bytes[skipped % slots] = 0
+            self.last_bucket = bucket
+        elif self.last_bucket - bucket >= slots:
+            return  # older than the whole ring
+        self.messages[bucket % slots] += 1
+        self.bytes[bucket % slots] += size
+        self.total_messages += 1
+        self.total_bytes += size
+        self.last_seen = max(self.last_seen, timestamp)
+
+    def window(self, now_bucket: int, buckets: int) -> tuple:
+        """(messages, bytes) of the `buckets` most recent buckets up to `now_bucket`"""
+        slots = len(self.messages)
+        # Log timestamps can run ahead of `now`; never reach past the newest bucket
+        now_bucket = max(now_bucket, self.last_bucket)
+        count = min(buckets, slots) - (now_bucket - self.last_bucket)
+        if count <= 0:
+            return 0, 0
+        end = self.last_bucket % slots + 1
+        start = end - count
+        if start >= 0:
+            return sum(self.messages[start:end]), sum(self.bytes[start:end])
+        return (sum(self.messages[start:]) + sum(self.messages[:end]),
+                sum(self.bytes[start:]) + sum(self.bytes[:end]))
+
+
+class PublishAccounting:
+    """Per-client and per-username publish rates from the broker's log stream.
+
+    Keys are kept in least-recently-published order and capped at
+    `max_keys` per table, so memory stays bounded however many clients come
+    and go; the key idle the longest is evicted first.
+    """
+
+    def __init__(self, bucket_seconds: int = 10, window_seconds: int = 900, max_keys: int = 10000):
+        self.bucket_seconds = bucket_seconds
+        self.slots = max(1, window_seconds // bucket_seconds)
+        self.max_keys = max_keys
+        self.clients: "OrderedDict[str, SlidingCounter]" = OrderedDict()
+        self.users: "OrderedDict[str, SlidingCounter]" = OrderedDict()
+        self.usernames: Dict[str, str] = {}
+        self.publishes = 0
+        self.evicted = 0
+        self._lock = threading.Lock()
+
+    @property
+    def max_window(self) -> int:
+        return self.slots * self.bucket_seconds
+
+    def set_username(self, client_id: str, username: Optional[str]):
+        """Attribute later publishes of `client_id` to `username`, as seen in its connection log line"""
+        with self._lock:
+            if username:
+                self.usernames[client_id] = username
+            else:
+                self.usernames.pop(client_id, None)
+
+    def forget_client(self, client_id: str):
+        with self._lock:
+            self.usernames.pop(client_id, None)
+
+    def _counter(self, table: "OrderedDict[str, SlidingCounter]", key: str) -> SlidingCounter:
+        counter = table.get(key)
+        if counter is None:
+            if len(table) >= self.max_keys:
+                table.popitem(last=False)
+                self.evicted += 1
+            counter = table[key] = SlidingCounter(self.slots)
+        else:
+            table.move_to_end(key)
+        return counter
+
+    def record(self, client_id: str, size: int, timestamp: Optional[int] = None):
+        timestamp = int(time.time()) if timestamp is None else timestamp
+        bucket = timestamp // self.bucket_seconds
+        with self._lock:
+            self.publishes += 1
+            username = self.usernames.get(client_id)
+            counter = self._counter(self.clients, client_id)
+            counter.username = username
+            counter.add(bucket, size, timestamp)
+            if username is not None:
+                self._counter(self.users, username).add(bucket, size, timestamp)
+
+    def process_line(self, line: str) -> bool:
+        """Account a `Received PUBLISH` log line; returns False for any other line"""
+        if _PUBLISH_MARKER not in line:
+            return False
+        match = PUBLISH_PATTERN.match(line)
+        if match is None:
+            return False
+        self.record(match.group(2), int(match.group(6)), int(match.group(1)))
+        return True
+
+    def top_talkers(self, by: str = "client", window: int = 60, sort: str = "messages",
+                    limit: int = 10, now: Optional[float] = None) -> Dict:
+        """The `limit` clients or usernames with the most messages or bytes in the last `window` seconds"""
+        if by not in ("client", "username"):
+            raise ValueError("by must be 'client' or 'username'")
+        if sort not in ("messages", "bytes"):
+            raise ValueError("sort must be 'messages' or 'bytes'")
+        if not 0 < window <= self.max_window:
+            raise ValueError(f"window must be between 1 and {self.max_window} seconds")
+        now = time.time() if now is None else now
+        now_bucket = int(now) // self.bucket_seconds
+        buckets = -(-window // self.bucket_seconds)
+        seconds = buckets * self.bucket_seconds
+
+        with self._lock:
+            table = self.clients if by == "client" else self.users
+            rows = []
+            total_messages = total_bytes = 0
+            for key, counter in table.items():
+                messages, size = counter.window(now_bucket, buckets)
+                if messages:
+                    total_messages += messages
+                    total_bytes += size
+                    rows.append((messages, size, key, counter))
+
+        talkers = []
+        top = heapq.nlargest(limit, rows, key=lambda row: row[0] if sort == "messages" else row[1])
+        for messages, size, key, counter in top:
+            talker = {
+                by: key,
+                "messages": messages,
+                "bytes": size,
+                "messages_per_second": round(messages / seconds, 3),
+                "bytes_per_second": round(size / seconds, 3),
+                "message_share": round(messages / total_messages, 4),
+                "byte_share": round(size / total_bytes, 4) if total_bytes else 0.0,
+                "last_seen": counter.last_seen,
+            }
+            if by == "client":
+                talker["username"] = counter.username
+            talkers.append(talker)
+        return {
+            "by": by,
+            "window_seconds": seconds,
+            "sort": sort,
+            "active": len(rows),
+            "total_messages": total_messages,
+            "total_bytes": total_bytes,
+            "talkers": talkers,
+        }
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "publishes": self.publishes,
+                "tracked_clients": len(self.clients),
+                "tracked_usernames": len(self.users),
+                "max_keys": self.max_keys,
+                "evicted": self.evicted,
+                "bucket_seconds": self.bucket_seconds,
+                "max_window_seconds": self.max_window,
+            }
@@ -0,0 +1,257 @@
+# Copyright (c) 2025 BunkerM
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# You may not use this file except in compliance with the License.
+# http://www.apache.org/licenses/LICENSE-2.0
+# Distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND.
+#
+# firebase_auth.py
+"""Firebase ID token verification shared by the backend services.
+
+`verify_id_token()` replaces `firebase_admin.auth.verify_id_token()`. Tokens
+are checked locally against Google's public signing keys, which are held in
+memory and refreshed by a background thread before the key set's
+Cache-Control max-age runs out. A verified token is cached under its SHA-256
+until its `exp`, so the repeated requests of a dashboard session cost a hash
+and a dict lookup.
+
+Environment:
+
+    FIREBASE_PROJECT_ID         project the tokens must be issued for; defaults
+                                to the project_id in FIREBASE_CREDENTIALS_PATH
+    FIREBASE_JWKS_PATH          verify against this JWKS file instead of
+                                fetching Google's keys; re-read when it changes
+    FIREBASE_TOKEN_CACHE_SIZE   verified tokens kept in memory (default 10000)
+
+Failures raise firebase_admin's InvalidIdTokenError or ExpiredIdTokenError,
+like the call it replaces. Revocation is not checked, as before.
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+import urllib.request
+from typing import Dict, Optional, Tuple
+
+import jwt
+from firebase_admin import auth
+
+logger = logging.getLogger(__name__)
+
+GOOGLE_JWKS_URL = "https://www.googleapis.com/service_accounts/v1/jwk/securetoken@system.gserviceaccount.com"
+_MAX_AGE = re.compile(r"max-age=(\d+)")
+
+
+def parse_jwks(data) -> Dict[str, object]:
+    """RSA public keys of a JWKS document, by key id"""
+    keys = {}
+    for jwk in json.loads(data).get("keys", []):
+        if jwk.get("kty") == "RSA" and jwk.get("kid"):
+            keys[jwk["kid"]] = jwt.algorithms.RSAAlgorithm.from_jwk(jwk)
+    if not keys:
+        raise ValueError("JWKS contains no RSA keys")
+    return keys
+
+
+class FirebaseTokenVerifier:
+    """Verifies Firebase ID tokens with in-memory signing keys and a cache of verified tokens"""
+
+    def __init__(self, project_id: str, jwks_path: Optional[str] = None, jwks_url: str = GOOGLE_JWKS_URL,
+                 max_tokens: int = 10000, clock_skew: int = 0, min_refresh_interval: float = 30.0,
+                 timeout: float = 10.0):
+        self.project_id = project_id
+        self.issuer = f"https://securetoken.google.com/{project_id}"
+        self.jwks_path = jwks_path
+        self.jwks_url = jwks_url
+        self.max_tokens = max_tokens
+        self.clock_skew = clock_skew
+        self.min_refresh_interval = min_refresh_interval
+        self.timeout = timeout
+
+        self._keys: Dict[str, object] = {}
+        self._refresh_at = 0.0  # when the background thread fetches the keys again
+        self._keys_mtime: Optional[float] = None
+        self._last_fetch: Optional[float] = None  # monotonic time of the last fetch attempt
+        self._keys_lock = threading.Lock()
+        self._refresher: Optional[threading.Thread] = None
+
+        # sha256(token) -> (exp, claims)
+        self._tokens: Dict[bytes, Tuple[int, Dict]] = {}
+        self._tokens_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.key_fetches = 0
+        self.key_fetch_failures = 0
+
+    def verify(self, token: str) -> Dict:
+        """Decoded claims of a valid ID token, with `uid` set to its subject"""
+        if not isinstance(token, str) or not token:
+            raise auth.InvalidIdTokenError("ID token must be a non-empty string")
+        digest = hashlib.sha256(token.encode()).digest()
+        now = time.time()
+        cached = self._tokens.get(digest)
+        if cached is not None:
+            if now < cached[0]:
+                self.hits += 1
+                return dict(cached[1])
+            with self._tokens_lock:
+                self._tokens.pop(digest, None)
+            raise auth.ExpiredIdTokenError("Token expired", None)
+
+        self.misses += 1
+        claims = self._decode(token, now)
+        with self._tokens_lock:
+            if len(self._tokens) >= self.max_tokens:
+                self._evict(now)
+            self._tokens[digest] = (claims["exp"], claims)
+        return dict(claims)
+
+    def _evict(self, now: float):
+        for digest in [digest for digest, (exp, _) in self._tokens.items() if exp <= now]:
+            del self._tokens[digest]
+        # Still full of live tokens: drop the oldest
+        while len(self._tokens) >= self.max_tokens:
+            del self._tokens[next(iter(self._tokens))]
+
+    def _decode(self, token: str, now: float) -> Dict:
+        try:
+            header = jwt.get_unverified_header(token)
+        except jwt.InvalidTokenError as e:
+            raise auth.InvalidIdTokenError(f"Malformed ID token: {e}", cause=e)
+        if header.get("alg") != "RS256":
+            raise auth.InvalidIdTokenError(f"ID token has incorrect algorithm {header.get('alg')!r}")
+        key = self._signing_key(header.get("kid"))
+        if key is None:
+            raise auth.InvalidIdTokenError("ID token is not signed by a known Firebase key")
+
+        try:
+            claims = jwt.decode(
+                token, key, algorithms=["RS256"], audience=self.project_id, issuer=self.issuer,
+                leeway=self.clock_skew, options={"require": ["exp", "iat", "sub"]}
+            )
+        except jwt.ExpiredSignatureError as e:
+            raise auth.ExpiredIdTokenError("Token expired", e)
+        except jwt.InvalidTokenError as e:
+            raise auth.InvalidIdTokenError(f"Invalid ID token: {e}", cause=e)
+
+        subject = claims["sub"]
+        if not isinstance(subject, str) or not subject or len(subject) > 128:
+            raise auth.InvalidIdTokenError("ID token has an invalid subject")
+        if claims.get("auth_time", 0) > now + self.clock_skew:
+            raise auth.InvalidIdTokenError("ID token has an authentication time in the future")
+        claims["uid"] = subject
+        return claims
+
+    def _signing_key(self, kid: Optional[str]):
+        if kid is None:
+            return None
+        if self.jwks_path:
+            self._load_file()
+            return self._keys.get(kid)
+        if not self._keys:
+            self._fetch()
+            self._start_refresher()
+        key = self._keys.get(kid)
+        if key is None:
+            # Google may have started signing with a key published after the last fetch
+            self._fetch()
+            key = self._keys.get(kid)
+        return key
+
+    def _load_file(self):
+        try:
+            mtime = os.stat(self.jwks_path).st_mtime
+            if mtime == self._keys_mtime:
+                return
+            with self._keys_lock:
+                self._keys_mtime = mtime  # a broken file is reported once per change
+                with open(self.jwks_path, "rb") as f:
+                    self._keys = parse_jwks(f.read())
+            logger.info(f"Loaded {len(self._keys)} Firebase signing keys from {self.jwks_path}")
+        except (OSError, ValueError) as e:
+            logger.error(f"Failed to load Firebase signing keys from {self.jwks_path}: {e}")
+
+    def _fetch(self) -> bool:
+        """Fetch Google's keys, at most once per `min_refresh_interval`"""
+        with self._keys_lock:
+            if self._last_fetch is not None and time.monotonic() - self._last_fetch < self.min_refresh_interval:
+                return False
+            self._last_fetch = time.monotonic()
+            try:
+                with urllib.request.urlopen(self.jwks_url, timeout=self.timeout) as response:
+                    keys = parse_jwks(response.read())
+                    match = _MAX_AGE.search(response.headers.get("Cache-Control", ""))
+            except Exception as e:
+                # Keep the keys we have: Google publishes new keys well before retiring old ones
+                self.key_fetch_failures += 1
+                self._refresh_at = time.time() + self.min_refresh_interval
+                logger.error(f"Failed to fetch Firebase signing keys: {e}")
+                return False
+            max_age = int(match.group(1)) if match else 3600
+            self._keys = keys
+            self._refresh_at = time.time() + max(max_age * 0.9, self.min_refresh_interval)
+            self.key_fetches += 1
+            return True
+
+    def _start_refresher(self):
+        with self._keys_lock:
+            if self._refresher is not None:
+                return
+            self._refresher = threading.Thread(target=self._refresh_loop, name="firebase-keys", daemon=True)
+            self._refresher.start()
+
+    def _refresh_loop(self):
+        while True:
+            time.sleep(max(self._refresh_at - time.time(), 1.0))
+            if time.time() >= self._refresh_at:
+                self._fetch()
+
+    def stats(self) -> Dict:
+        return {
+            "cached_tokens": len(self._tokens),
+            "hits": self.hits,
+            "misses": self.misses,
+            "keys": len(self._keys),
+            "keys_source": self.jwks_path or self.jwks_url,
+            "key_fetches": self.key_fetches,
+            "key_fetch_failures": self.key_fetch_failures,
+            "keys_refresh_at": None if self.jwks_path else self._refresh_at,
+        }
+
+
+_verifier: Optional[FirebaseTokenVerifier] = None
+_verifier_lock = threading.Lock()
+
+
+def default_project_id() -> str:
+    project_id = os.getenv("FIREBASE_PROJECT_ID")
+    if project_id:
+        return project_id
+    credentials_path = os.getenv("FIREBASE_CREDENTIALS_PATH")
+    if credentials_path and os.path.exists(credentials_path):
+        with open(credentials_path) as f:
+            project_id = json.load(f).get("project_id")
+    if not project_id:
+        raise ValueError("Set FIREBASE_PROJECT_ID or FIREBASE_CREDENTIALS_PATH to verify Firebase ID tokens")
+    return project_id
+
+
+def get_verifier() -> FirebaseTokenVerifier:
+    """The process-wide verifier, configured from the environment on first use"""
+    global _verifier
+    if _verifier is None:
+        with _verifier_lock:
+            if _verifier is None:
+                _verifier = FirebaseTokenVerifier(
+                    default_project_id(),
+                    jwks_path=os.getenv("FIREBASE_JWKS_PATH") or None,
+                    max_tokens=int(os.getenv("FIREBASE_TOKEN_CACHE_SIZE", "10000")),
+                )
+    return _verifier
+
+
+def verify_id_token(token: str) -> Dict:
+    return get_verifier().verify(token)
@@ -16,6 +16,7 @@ from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from pydantic import BaseModel
 import firebase_admin
 from firebase_admin import auth
+from firebase_auth import verify_id_token
 
 # Configure logging
 logger = logging.getLogger(__name__)
@@ -101,7 +102,7 @@ async def verify_firebase_token(
     """Verify Firebase ID token and return user info"""
     try:
         token = credentials.credentials
-        decoded_token = auth.verify_id_token(token)
+        decoded_token = verify_id_token(token)
         custom_claims = decoded_token.get('custom_claims', {})
         user_role = custom_claims.get('role', 'user')
         
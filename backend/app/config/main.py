@@ -16,6 +16,7 @@ from datetime import datetime
 import uvicorn
 import firebase_admin
 from firebase_admin import credentials, auth
+from firebase_auth import verify_id_token
 
 # Import routers
 from mosquitto_config import router as mosquitto_config_router
@@ -74,7 +75,7 @@ async def verify_firebase_token(
 ) -> dict:
     try:
         token = credentials.credentials
-        decoded_token = auth.verify_id_token(token)
+        decoded_token = verify_id_token(token)
         user_role = decoded_token.get('role', 'user')
         
         logger.info(f"Authenticated user: {decoded_token.get('email', 'unknown')}")
@@ -17,6 +17,7 @@ from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from pydantic import BaseModel
 import firebase_admin
 from firebase_admin import credentials, auth
+from firebase_auth import verify_id_token
 
 # Router setup
 router = APIRouter(tags=["mosquitto_config"])
@@ -45,7 +46,7 @@ async def verify_firebase_token(
 ) -> dict:
     try:
         token = credentials.credentials
-        decoded_token = auth.verify_id_token(token)
+        decoded_token = verify_id_token(token)
         user_role = decoded_token.get('role', 'user')
         
         logger.info(f"Authenticated user: {decoded_token.get('email', 'unknown')}")
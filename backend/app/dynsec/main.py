@@ -14,6 +14,7 @@ from fastapi.middleware.trustedhost import TrustedHostMiddleware
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 import firebase_admin
 from firebase_admin import credentials, auth
+from firebase_auth import verify_id_token
 
 """ from slowapi import Limiter, _rate_limit_exceeded_handler
 from slowapi.util import get_remote_address
@@ -105,7 +106,7 @@ async def verify_firebase_token(
 ) -> dict:
     try:
         token = credentials.credentials
-        decoded_token = auth.verify_id_token(token)
+        decoded_token = verify_id_token(token)
         user_role = decoded_token.get('role', 'user')
         
         logger.info(f"Authenticated user: {decoded_token.get('email', 'unknown')}")
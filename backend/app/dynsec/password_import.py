@@ -20,7 +20,8 @@ from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from datetime import datetime
 from typing import Optional, Dict, Any, List
 import firebase_admin
-from firebase_admin import auth, exceptions as firebase_exceptions
+from firebase_admin import auth
+from firebase_auth import verify_id_token
 
 # Router setup
 router = APIRouter(tags=["password_import"])
@@ -53,7 +54,7 @@ async def get_current_user(
                 detail="Invalid authentication scheme"
             )
         
-        decoded_token = auth.verify_id_token(credentials.credentials)
+        decoded_token = verify_id_token(credentials.credentials)
         user_role = decoded_token.get('role', 'user')
         
         return {
@@ -65,13 +66,13 @@ async def get_current_user(
             'can_manage': user_role in ['admin', 'moderator']
         }
         
-    except firebase_exceptions.InvalidIdTokenError:
+    except auth.InvalidIdTokenError:
         logger.error("Invalid Firebase ID token provided")
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Invalid authentication token"
         )
-    except firebase_exceptions.ExpiredIdTokenError:
+    except auth.ExpiredIdTokenError:
         logger.error("Expired Firebase ID token provided")
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
@@ -0,0 +1,403 @@
+# Copyright (c) 2025 BunkerM
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# You may not use this file except in compliance with the License.
+# http://www.apache.org/licenses/LICENSE-2.0
+# Distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND.
+#
+# alert_rules.py
+"""Threshold alert rules evaluated against the monitor's in-memory state.
+
+Two kinds of rule are supported:
+
+    bytes_sent_15min > 5M for 2m
+    connected_clients drops 20% in 5m
+
+Every rule is reduced to the condition `x > key` on a series `x`: the
+metric itself, or its relative change over a window, multiplied by -1 for
+`<`, `<=` and `drops`. Rules on the same series are kept sorted by key, so
+the rules breached at a value are a prefix of that list, found by bisection.
+A tick only visits rules whose side of the threshold changed since the
+previous tick, plus the few rules that are pending or waiting to resolve;
+series whose value did not change are skipped entirely.
+"""
+import json
+import logging
+import math
+import re
+import threading
+import time
+import urllib.request
+from bisect import bisect_left
+from collections import deque
+from typing import Callable, Deque, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+_UNITS = {"": 1, "k": 1e3, "K": 1e3, "M": 1e6, "G": 1e9}
+_DURATIONS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+_METRIC = r"(?P<metric>[A-Za-z0-9_$/.-]+)"
+_DURATION = r"\d+[smhd]"
+_FOR = rf"(?:\s+for\s+(?P<for>{_DURATION}))?"
+_THRESHOLD_RULE = re.compile(
+    rf"^{_METRIC}\s*(?P<op>>=|<=|>|<)\s*(?P<value>-?\d+(?:\.\d+)?)(?P<unit>[kKMG]?){_FOR}$"
+)
+_CHANGE_RULE = re.compile(
+    rf"^{_METRIC}\s+(?P<direction>drops|rises)\s+(?:by\s+)?(?P<percent>\d+(?:\.\d+)?)%\s+in\s+(?P<window>{_DURATION}){_FOR}$"
+)
+
+
+def parse_duration(text: str) -> int:
+    return int(text[:-1]) * _DURATIONS[text[-1]]
+
+
+def parse_rule_expression(expression: str) -> Dict:
+    """Parse a rule expression into its metric, condition and optional `for` duration.
+
+    Raises ValueError when the expression matches neither rule form.
+    """
+    text = " ".join(expression.split())
+    match = _THRESHOLD_RULE.match(text)
+    if match:
+        return {
+            "metric": match["metric"],
+            "kind": "threshold",
+            "op": match["op"],
+            "threshold": float(match["value"]) * _UNITS[match["unit"]],
+            "window": None,
+            "for_seconds": parse_duration(match["for"]) if match["for"] else 0,
+        }
+    match = _CHANGE_RULE.match(text)
+    if match:
+        window = parse_duration(match["window"])
+        if window <= 0:
+            raise ValueError("Change window must be positive")
+        return {
+            "metric": match["metric"],
+            "kind": "change",
+            "op": match["direction"],
+            "threshold": float(match["percent"]),
+            "window": window,
+            "for_seconds": parse_duration(match["for"]) if match["for"] else 0,
+        }
+    raise ValueError(
+        "Invalid rule expression. Use '<metric> <op> <value>[k|M|G] [for <duration>]' "
+        "or '<metric> drops|rises <percent>% in <duration> [for <duration>]'"
+    )
+
+
+class AlertRule:
+    """A compiled rule and its evaluation state ("ok", "pending" or "firing")"""
+
+    __slots__ = ("id", "name", "expression", "metric", "kind", "op", "threshold", "window",
+                 "for_seconds", "hysteresis", "webhook_url", "sign", "key", "clear_key",
+                 "state", "since", "index")
+
+    def __init__(self, rule_id: int, name: str, expression: str, hysteresis: float = 0.1,
+                 webhook_url: Optional[str] = None, for_seconds: Optional[int] = None,
+                 state: str = "ok", since: Optional[float] = None):
+        parsed = parse_rule_expression(expression)
+        self.id = rule_id
+        self.name = name
+        self.expression = expression
+        self.metric = parsed["metric"]
+        self.kind = parsed["kind"]
+        self.op = parsed["op"]
+        self.threshold = parsed["threshold"]
+        self.window = parsed["window"]
+        self.for_seconds = parsed["for_seconds"] if for_seconds is None else for_seconds
+        self.hysteresis = hysteresis
+        self.webhook_url = webhook_url
+        self.state = state if state in ("ok", "firing") else "ok"
+        self.since = since
+        self.index = 0
+
+        # Normalize to `sign * series > key`; `>=` becomes `>` on the next float down
+        if self.kind == "change":
+            self.sign = -1.0 if self.op == "drops" else 1.0
+            self.key = math.nextafter(self.threshold / 100, -math.inf)
+        elif self.op in (">", ">="):
+            self.sign = 1.0
+            self.key = self.threshold if self.op == ">" else math.nextafter(self.threshold, -math.inf)
+        else:
+            self.sign = -1.0
+            self.key = -self.threshold if self.op == "<" else math.nextafter(-self.threshold, -math.inf)
+        # A firing rule resolves only once the series is back past the threshold by this margin
+        self.clear_key = self.key - self.hysteresis * abs(self.key)
+
+    @property
+    def series(self) -> Tuple[str, Optional[int], float]:
+        return self.metric, self.window, self.sign
+
+    def describe(self) -> Dict:
+        return {
+            "id": self.id,
+            "name": self.name,
+            "expression": self.expression,
+            "metric": self.metric,
+            "for_seconds": self.for_seconds,
+            "hysteresis": self.hysteresis,
+            "webhook_url": self.webhook_url,
+            "state": self.state,
+            "since": self.since,
+        }
+
+
+class _RuleGroup:
+    """Rules on one signed series, sorted by key, and how many of them the series breaches"""
+
+    __slots__ = ("metric", "window", "sign", "rules", "keys", "breached", "value", "last", "pending",
+                 "clearing", "history", "rescan")
+
+    def __init__(self, metric: str, window: Optional[int], sign: float, rules: List[AlertRule]):
+        self.metric = metric
+        self.window = window
+        self.sign = sign
+        self.rules = sorted(rules, key=lambda r: r.key)
+        self.keys = [rule.key for rule in self.rules]
+        for index, rule in enumerate(self.rules):
+            rule.index = index
+        self.breached = 0  # rules[:breached] have key < x
+        self.value: Optional[float] = None
+        self.last: Optional[float] = None
+        self.pending: Dict[int, AlertRule] = {}
+        self.clearing: Dict[int, AlertRule] = {}
+        # (timestamp, value) steps of the metric, enough to know its value `window` seconds ago
+        self.history: Deque[Tuple[float, float]] = deque()
+        self.rescan = True  # the first evaluation visits every rule
+
+    def series_value(self, value: float, now: float) -> Optional[float]:
+        """The signed series value x, or None while it is undefined"""
+        if self.window is None:
+            return self.sign * value
+        history = self.history
+        if not history or history[-1][1] != value:
+            history.append((now, value))
+        cutoff = now - self.window
+        while len(history) > 1 and history[1][0] <= cutoff:
+            history.popleft()
+        reference = history[0][1]
+        if history[0][0] > cutoff or reference == 0:
+            return None  # not enough history yet, or no relative change from zero
+        return self.sign * (value - reference) / abs(reference)
+
+
+class AlertEngine:
+    """Evaluates a set of alert rules once per collector tick"""
+
+    def __init__(self, rules: Iterable[AlertRule] = ()):
+        self.rules: Dict[int, AlertRule] = {rule.id: rule for rule in rules}
+        self.groups: List[_RuleGroup] = []
+        self.metrics: frozenset = frozenset()
+        self.last_evaluated: Optional[float] = None
+        self._lock = threading.Lock()
+        self._rebuild()
+
+    def _rebuild(self):
+        previous = {(group.metric, group.window, group.sign): group for group in self.groups}
+        by_series: Dict[Tuple, List[AlertRule]] = {}
+        for rule in self.rules.values():
+            by_series.setdefault(rule.series, []).append(rule)
+        self.groups = []
+        for series, rules in by_series.items():
+            group = _RuleGroup(*series, rules)
+            if series in previous:
+                group.history = previous[series].history  # keep the change reference across rule edits
+            self.groups.append(group)
+        self.metrics = frozenset(group.metric for group in self.groups)
+
+    def add(self, rule: AlertRule):
+        with self._lock:
+            self.rules[rule.id] = rule
+            self._rebuild()
+
+    def remove(self, rule_id: int) -> Optional[AlertRule]:
+        with self._lock:
+            rule = self.rules.pop(rule_id, None)
+            if rule is not None:
+                self._rebuild()
+            return rule
+
+    def evaluate(self, values: Dict[str, float], now: Optional[float] = None) -> List[Dict]:
+        """Check the rules against current metric values; returns "firing" and "resolved" events"""
+        now = time.time() if now is None else now
+        events: List[Dict] = []
+        with self._lock:
+            for group in self.groups:
+                value = values.get(group.metric)
+                if value is None:
+                    continue
+                # An unchanged metric leaves x unchanged too, unless a change window is still sliding
+                if (value == group.value and not group.pending and not group.rescan
+                        and (group.window is None or len(group.history) == 1)):
+                    continue
+                group.value = value
+                x = group.series_value(value, now)
+                if x is None or (x == group.last and not group.pending and not group.rescan):
+                    continue
+                group.last = x
+                breached = bisect_left(group.keys, x)
+                # Rules between the old and new breach counts crossed their threshold
+                if group.rescan:
+                    group.rescan = False
+                    low, high = 0, len(group.rules)
+                else:
+                    low, high = sorted((group.breached, breached))
+                group.breached = breached
+                visit = group.rules[low:high]
+                visit += [
+                    rule for rule in (*group.pending.values(), *group.clearing.values())
+                    if not low <= rule.index < high
+                ]
+                for rule in visit:
+                    self._step(group, rule, rule.index < breached, x, now, events)
+            self.last_evaluated = now
+        return events
+
+    def _step(self, group: _RuleGroup, rule: AlertRule, breached: bool, x: float,
+              now: float, events: List[Dict]):
+        if breached:
+            group.clearing.pop(rule.id, None)
+            if rule.state == "ok":
+                rule.state, rule.since = "pending", now
+            if rule.state == "pending":
+                if now - rule.since >= rule.for_seconds:
+                    group.pending.pop(rule.id, None)
+                    rule.state, rule.since = "firing", now
+                    events.append(self._event(rule, "firing", x, now, now))
+                else:
+                    group.pending[rule.id] = rule
+        elif rule.state == "pending":
+            group.pending.pop(rule.id, None)
+            rule.state, rule.since = "ok", now
+        elif rule.state == "firing":
+            if x <= rule.clear_key:
+                group.clearing.pop(rule.id, None)
+                events.append(self._event(rule, "resolved", x, now, rule.since))
+                rule.state, rule.since = "ok", now
+            else:
+                group.clearing[rule.id] = rule
+
+    @staticmethod
+    def _event(rule: AlertRule, status: str, x: float, now: float, firing_since: float) -> Dict:
+        value = rule.sign * x
+        return {
+            "rule_id": rule.id,
+            "name": rule.name,
+            "expression": rule.expression,
+            "status": status,
+            # Change rules report the change in percent
+            "value": round(value * 100, 3) if rule.kind == "change" else value,
+            "at": int(now),
+            "firing_since": int(firing_since) if firing_since else None,
+            "webhook_url": rule.webhook_url,
+        }
+
+    def firing(self) -> List[Dict]:
+        with self._lock:
+            return [rule.describe() for rule in self.rules.values() if rule.state == "firing"]
+
+    def list_rules(self) -> List[Dict]:
+        with self._lock:
+            return [rule.describe() for rule in sorted(self.rules.values(), key=lambda r: r.id)]
+
+
+class WebhookNotifier:
+    """Delivers alert events to webhooks in batches, retrying failed deliveries.
+
+    Events are queued per URL by the evaluation tick and sent by `flush()`,
+    which runs on a worker thread. Each URL gets at most one POST per flush,
+    a JSON body `{"alerts": [...]}`; a failed batch is retried with
+    exponential backoff and dropped after `max_attempts`. Events queued
+    beyond `max_queue` per URL push out the oldest ones.
+    """
+
+    def __init__(self, default_urls: Iterable[str] = (), batch_size: int = 100, max_attempts: int = 5,
+                 backoff: float = 5.0, max_backoff: float = 300.0, timeout: float = 5.0,
+                 max_queue: int = 1000, post: Optional[Callable[[str, bytes, float], None]] = None):
+        self.default_urls = [url for url in default_urls if url]
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.max_queue = max_queue
+        self._post = post or self._http_post
+        self._queues: Dict[str, Deque[Dict]] = {}
+        # url -> (attempts so far, monotonic time of the next attempt, batch)
+        self._retries: Dict[str, Tuple[int, float, List[Dict]]] = {}
+        self._lock = threading.Lock()
+        self.sent = 0
+        self.failed_attempts = 0
+        self.dropped = 0
+
+    def enqueue(self, events: Iterable[Dict], broker: Optional[str] = None):
+        with self._lock:
+            for event in events:
+                event = dict(event)
+                rule_url = event.pop("webhook_url", None)
+                if broker is not None:
+                    event["broker"] = broker
+                for url in ([rule_url] if rule_url else self.default_urls):
+                    queue = self._queues.setdefault(url, deque(maxlen=self.max_queue))
+                    if len(queue) == queue.maxlen:
+                        self.dropped += 1
+                    queue.append(event)
+
+    @staticmethod
+    def _http_post(url: str, body: bytes, timeout: float):
+        request = urllib.request.Request(
+            url, data=body, method="POST",
+            headers={"Content-Type": "application/json", "User-Agent": "bunkerm-monitor"}
+        )
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            response.read()
+
+    def flush(self) -> int:
+        """Send one batch per URL that is due; returns the number of events delivered"""
+        now = time.monotonic()
+        batches = []
+        with self._lock:
+            for url in set(self._queues) | set(self._retries):
+                retry = self._retries.get(url)
+                if retry is not None:
+                    if retry[1] <= now:
+                        batches.append((url, retry[0], retry[2]))
+                    continue
+                queue = self._queues.get(url)
+                if queue:
+                    batch = [queue.popleft() for _ in range(min(len(queue), self.batch_size))]
+                    batches.append((url, 0, batch))
+
+        delivered = 0
+        for url, attempts, batch in batches:
+            try:
+                self._post(url, json.dumps({"alerts": batch}, separators=(',', ':')).encode(), self.timeout)
+            except Exception as e:
+                attempts += 1
+                with self._lock:
+                    self.failed_attempts += 1
+                    if attempts >= self.max_attempts:
+                        self._retries.pop(url, None)
+                        self.dropped += len(batch)
+                        logger.error(f"Dropping {len(batch)} alert events for {url} after {attempts} attempts: {e}")
+                    else:
+                        delay = min(self.backoff * 2 ** (attempts - 1), self.max_backoff)
+                        self._retries[url] = (attempts, now + delay, batch)
+                        logger.warning(f"Alert webhook {url} failed ({e}), retrying in {delay:.0f}s")
+                continue
+            with self._lock:
+                self._retries.pop(url, None)
+                self.sent += len(batch)
+            delivered += len(batch)
+        return delivered
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "queued": sum(len(queue) for queue in self._queues.values()),
+                "retrying": {url: attempts for url, (attempts, _, _) in self._retries.items()},
+                "sent": self.sent,
+                "failed_attempts": self.failed_attempts,
+                "dropped": self.dropped,
+            }
@@ -0,0 +1,218 @@
+# Copyright (c) 2025 BunkerM
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# You may not use this file except in compliance with the License.
+# http://www.apache.org/licenses/LICENSE-2.0
+# Distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND.
+#
+# anomaly_detection.py
+import math
+import threading
+from array import array
+from typing import Dict, Iterable, List, Optional
+
+
+class EwmaModel:
+    """Exponentially weighted mean and variance, updated in O(1) per sample"""
+
+    __slots__ = ("alpha", "mean", "variance", "count")
+
+    def __init__(self, alpha: float):
+        self.alpha = alpha
+        self.mean = 0.0
+        self.variance = 0.0
+        self.count = 0
+
+    def update(self, value: float):
+        if not self.count:
+            self.mean = value
+        else:
+            diff = value - self.mean
+            increment = self.alpha * diff
+            self.mean += increment
+            self.variance = (1 - self.alpha) * (self.variance + diff * increment)
+        self.count += 1
+
+
+class SeasonalBaseline:
+    """Per-slot EWMA mean and variance over a repeating period.
+
+    With the defaults every hour of the week has its own baseline, so a
+    Monday morning is compared with previous Monday mornings.
+    """
+
+    def __init__(self, period: int = 7 * 86400, slot_seconds: int = 3600, alpha: float = 0.05):
+        self.period = period
+        self.slot_seconds = slot_seconds
+        self.alpha = alpha
+        slots = period // slot_seconds
+        self.mean = array('d', [0.0]) * slots
+        self.variance = array('d', [0.0]) * slots
+        self.count = array('q', [0]) * slots
+
+    def slot(self, timestamp: float) -> int:
+        return int(timestamp % self.period) // self.slot_seconds
+
+    def update(self, slot: int, value: float):
+        if not self.count[slot]:
+            self.mean[slot] = value
+        else:
+            diff = value - self.mean[slot]
+            increment = self.alpha * diff
+            self.mean[slot] += increment
+            self.variance[slot] = (1 - self.alpha) * (self.variance[slot] + diff * increment)
+        self.count[slot] += 1
+
+
+class SeriesDetector:
+    """Flags samples of one series that deviate from both of its baselines.
+
+    A sample is anomalous when it is more than `threshold` standard
+    deviations from the recent EWMA and, once the slot has enough history,
+    also more than `seasonal_threshold` from the seasonal baseline, so
+    regular daily ramps stop being reported after the first week. Standard
+    deviations are floored at `relative_floor` of the mean (and
+    `absolute_floor`) so flat series don't turn every small step into an
+    anomaly. Anomalous samples are kept out of the seasonal baseline.
+    Consecutive anomalous samples form one episode.
+    """
+
+    def __init__(self, metric: str, alpha: float = 2 / 31, threshold: float = 4.0,
+                 seasonal_threshold: float = 4.0, warmup: int = 30, seasonal_warmup: int = 60,
+                 relative_floor: float = 0.05, absolute_floor: float = 1.0,
+                 seasonal: Optional[SeasonalBaseline] = None):
+        self.metric = metric
+        self.threshold = threshold
+        self.seasonal_threshold = seasonal_threshold
+        self.warmup = warmup
+        self.seasonal_warmup = seasonal_warmup
+        self.relative_floor = relative_floor
+        self.absolute_floor = absolute_floor
+        self.ewma = EwmaModel(alpha)
+        self.seasonal = seasonal or SeasonalBaseline()
+        self.episode: Optional[Dict] = None
+        self.last: Optional[Dict] = None
+
+    def _score(self, value: float, mean: float, variance: float) -> float:
+        floor = max(self.absolute_floor, self.relative_floor * abs(mean))
+        return (value - mean) / max(math.sqrt(max(variance, 0.0)), floor)
+
+    def observe(self, value: float, timestamp: float) -> List[Dict]:
+        """Score and learn one sample; returns episodes that started or ended"""
+        slot = self.seasonal.slot(timestamp)
+        warm = self.ewma.count >= self.warmup
+        seasonal_warm = self.seasonal.count[slot] >= self.seasonal_warmup
+        score = self._score(value, self.ewma.mean, self.ewma.variance)
+        seasonal_score = self._score(value, self.seasonal.mean[slot], self.seasonal.variance[slot])
+        anomalous = warm and abs(score) >= self.threshold and (
+            not seasonal_warm or abs(seasonal_score) >= self.seasonal_threshold
+        )
+        self.last = {
+            "value": value,
+            "expected": self.seasonal.mean[slot] if seasonal_warm else self.ewma.mean,
+            "score": round(score, 3),
+            "seasonal_score": round(seasonal_score, 3) if seasonal_warm else None,
+            "anomalous": anomalous,
+        }
+
+        self.ewma.update(value)
+        if not anomalous:
+            self.seasonal.update(slot, value)
+
+        changed = []
+        if anomalous:
+            # Rank by the score of the baseline that confirmed the anomaly
+            effective = seasonal_score if seasonal_warm else score
+            if self.episode is None:
+                self.episode = {
+                    "metric": self.metric,
+                    "kind": "spike" if score > 0 else "drop",
+                    "started_at": int(timestamp),
+                    "ended_at": None,
+                    "value": value,
+                    "expected": self.last["expected"],
+                    "peak_score": round(effective, 3),
+                    "samples": 1,
+                }
+                changed.append(dict(self.episode))
+            else:
+                self.episode["samples"] += 1
+                if abs(effective) > abs(self.episode["peak_score"]):
+                    self.episode.update(value=value, expected=self.last["expected"], peak_score=round(effective, 3))
+        elif self.episode is not None:
+            self.episode["ended_at"] = int(timestamp)
+            changed.append(self.episode)
+            self.episode = None
+        return changed
+
+    def state(self) -> Dict:
+        return {
+            "alpha": self.ewma.alpha,
+            "mean": self.ewma.mean,
+            "variance": self.ewma.variance,
+            "count": self.ewma.count,
+            "seasonal_mean": list(self.seasonal.mean),
+            "seasonal_variance": list(self.seasonal.variance),
+            "seasonal_count": list(self.seasonal.count),
+        }
+
+    def load_state(self, state: Dict):
+        slots = len(self.seasonal.mean)
+        if len(state.get("seasonal_mean", ())) != slots:
+            return  # saved with a different seasonal layout; start over
+        self.ewma.mean = state["mean"]
+        self.ewma.variance = state["variance"]
+        self.ewma.count = state["count"]
+        self.seasonal.mean = array('d', state["seasonal_mean"])
+        self.seasonal.variance = array('d', state["seasonal_variance"])
+        self.seasonal.count = array('q', state["seasonal_count"])
+
+
+class AnomalyMonitor:
+    """Detectors for a fixed set of series, fed one sample per series per tick"""
+
+    def __init__(self, metrics: Iterable[str], **detector_options):
+        self.detectors = {metric: SeriesDetector(metric, **detector_options) for metric in metrics}
+        self.last_observed: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def observe(self, samples: Dict[str, float], timestamp: float) -> List[Dict]:
+        """Feed the latest value of each series; returns episodes that started or ended"""
+        changed = []
+        with self._lock:
+            for metric, value in samples.items():
+                detector = self.detectors.get(metric)
+                if detector is not None:
+                    changed += detector.observe(float(value), timestamp)
+            self.last_observed = timestamp
+        return changed
+
+    def active(self) -> List[Dict]:
+        with self._lock:
+            return [dict(d.episode) for d in self.detectors.values() if d.episode is not None]
+
+    def summary(self) -> Dict:
+        with self._lock:
+            return {
+                "last_observed": self.last_observed,
+                "series": {
+                    metric: {
+                        "samples": detector.ewma.count,
+                        "warm": detector.ewma.count >= detector.warmup,
+                        "ewma_mean": round(detector.ewma.mean, 3),
+                        "ewma_std": round(math.sqrt(max(detector.ewma.variance, 0.0)), 3),
+                        "last": detector.last,
+                    }
+                    for metric, detector in self.detectors.items()
+                },
+            }
+
+    def state(self) -> Dict:
+        with self._lock:
+            return {metric: detector.state() for metric, detector in self.detectors.items()}
+
+    def load_state(self, state: Dict):
+        with self._lock:
+            for metric, detector_state in state.items():
+                if metric in self.detectors:
+                    self.detectors[metric].load_state(detector_state)
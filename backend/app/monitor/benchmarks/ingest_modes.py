@@ -0,0 +1,239 @@
+# Copyright (c) 2025 BunkerM
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# You may not use this file except in compliance with the License.
+# http://www.apache.org/licenses/LICENSE-2.0
+# Distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND.
+#
+# ingest_modes.py
+"""Compare sustained ingest throughput of the monitor's MQTT ingest modes.
+
+A minimal in-process broker accepts one subscriber and streams a prebuilt
+burst of QoS 0 PUBLISH packets at it as fast as the socket allows, so the
+measured rate is bounded by the client side only. Each mode feeds the same
+trackers the monitor uses:
+
+  thread   paho loop_start() thread, per-message record calls (default mode)
+  asyncio  AsyncioMQTTIngest on the event loop, batched record calls
+
+While ingesting, a probe task measures event loop lag, which is what
+FastAPI request handling sees.
+
+Run from backend/app/monitor:
+
+    python benchmarks/ingest_modes.py --messages 200000 --topics 1000
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from paho.mqtt import client as mqtt_client  # noqa: E402
+
+from mqtt_ingest import AsyncioMQTTIngest, MessageBatch  # noqa: E402
+from payload_stats import PayloadSizeStats  # noqa: E402
+from topic_stats import TopTopicsTracker  # noqa: E402
+from topic_tree import TopicTree  # noqa: E402
+
+
+def encode_length(length: int) -> bytes:
+    encoded = bytearray()
+    while True:
+        byte, length = length % 128, length // 128
+        encoded.append(byte | 0x80 if length else byte)
+        if not length:
+            return bytes(encoded)
+
+
+def publish_packet(topic: str, payload: bytes) -> bytes:
+    topic_bytes = topic.encode()
+    body = len(topic_bytes).to_bytes(2, "big") + topic_bytes + payload
+    return b"\x30" + encode_length(len(body)) + body
+
+
+def read_packet(sock: socket.socket) -> bytes:
+    header = sock.recv(1)
+    if not header:
+        raise ConnectionError("subscriber closed")
+    multiplier, length = 1, 0
+    while True:
+        byte = sock.recv(1)[0]
+        length += (byte & 0x7F) * multiplier
+        multiplier *= 128
+        if not byte & 0x80:
+            break
+    body = b""
+    while len(body) < length:
+        body += sock.recv(length - len(body))
+    return header + body
+
+
+class BurstBroker(threading.Thread):
+    """Accepts one client, acknowledges CONNECT/SUBSCRIBE, then sends `burst`"""
+
+    def __init__(self, burst: bytes):
+        super().__init__(daemon=True)
+        self.burst = burst
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.bind(("127.0.0.1", 0))
+        self.server.listen(1)
+        self.port = self.server.getsockname()[1]
+
+    def run(self):
+        conn, _ = self.server.accept()
+        try:
+            read_packet(conn)  # CONNECT
+            conn.sendall(b"\x20\x02\x00\x00")
+            subscribe = read_packet(conn)
+            packet_id = subscribe[2:4] if subscribe[1] < 128 else subscribe[3:5]
+            conn.sendall(b"\x90\x03" + packet_id + b"\x00")
+            conn.sendall(self.burst)
+            while True:
+                packet = read_packet(conn)
+                if packet[0] == 0xC0:  # PINGREQ
+                    conn.sendall(b"\xd0\x00")
+        except (ConnectionError, OSError, IndexError):
+            pass
+        finally:
+            conn.close()
+            self.server.close()
+
+
+class Sink:
+    """The monitor's per-message trackers, fed per message or per batch"""
+
+    def __init__(self):
+        self.top_topics = TopTopicsTracker(capacity=100)
+        self.topic_tree = TopicTree()
+        self.payload_sizes = PayloadSizeStats(["site/0", "site/1"])
+        self.count_lock = threading.Lock()
+        self.messages = 0
+        self.done = threading.Event()
+        self.expected = 0
+
+    def record(self, topic: str, payload_size: int):
+        with self.count_lock:
+            self.messages += 1
+        self.top_topics.record(topic, payload_size)
+        self.topic_tree.record(topic, payload_size)
+        self.payload_sizes.record(topic, payload_size)
+        if self.messages >= self.expected:
+            self.done.set()
+
+    def record_batch(self, batch: MessageBatch):
+        with self.count_lock:
+            self.messages += batch.messages
+        totals = {topic: (entry[0], entry[1]) for topic, entry in batch.topics.items()}
+        self.top_topics.record_batch(totals)
+        self.topic_tree.record_batch(totals)
+        self.payload_sizes.record_batch({topic: entry[2] for topic, entry in batch.topics.items()})
+        if self.messages >= self.expected:
+            self.done.set()
+
+
+async def measure_loop_lag(stop: asyncio.Event, interval: float = 0.005):
+    lags = []
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        # A sleep that spans shutdown measures teardown, not ingest
+        if not stop.is_set():
+            lags.append((time.perf_counter() - started - interval) * 1000)
+    return lags
+
+
+async def run_mode(mode: str, burst: bytes, messages: int, batch_interval: float) -> dict:
+    broker = BurstBroker(burst)
+    broker.start()
+    sink = Sink()
+    sink.expected = messages
+    loop = asyncio.get_running_loop()
+
+    def on_connect(client, userdata, flags, rc, properties=None):
+        client.subscribe("#", 0)
+
+    client = mqtt_client.Client(mqtt_client.CallbackAPIVersion.VERSION2)
+    client.on_connect = on_connect
+    stop = asyncio.Event()
+    lag_task = asyncio.create_task(measure_loop_lag(stop))
+    started = time.perf_counter()
+    cpu_started = time.process_time()
+
+    if mode == "thread":
+        client.on_message = lambda c, u, msg: sink.record(msg.topic, len(msg.payload))
+        client.connect("127.0.0.1", broker.port, 60)
+        client.loop_start()
+        await loop.run_in_executor(None, sink.done.wait)
+        elapsed = time.perf_counter() - started
+        cpu = time.process_time() - cpu_started
+        stop.set()
+        client.loop_stop()
+    else:
+        ingest = AsyncioMQTTIngest(
+            client, "127.0.0.1", broker.port,
+            on_message=lambda c, u, msg: ingest.add(msg.topic, len(msg.payload)),
+            on_batch=sink.record_batch,
+            batch_interval=batch_interval
+        )
+        await ingest.start()
+        while ingest.messages_read < messages:
+            await asyncio.sleep(0.01)
+        ingest.flush()
+        elapsed = time.perf_counter() - started
+        cpu = time.process_time() - cpu_started
+        stop.set()
+        await ingest.stop()
+
+    lags = sorted(await lag_task)
+    client.disconnect()
+    return {
+        "mode": mode,
+        "messages": sink.messages,
+        "seconds": round(elapsed, 3),
+        "messages_per_second": round(sink.messages / elapsed),
+        "cpu_seconds": round(cpu, 3),
+        "loop_lag_p50_ms": round(statistics.median(lags), 3) if lags else None,
+        "loop_lag_p99_ms": round(lags[int(len(lags) * 0.99)], 3) if lags else None,
+        "loop_lag_max_ms": round(lags[-1], 3) if lags else None,
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=200_000)
+    parser.add_argument("--topics", type=int, default=1000)
+    parser.add_argument("--payload-size", type=int, default=64)
+    parser.add_argument("--batch-interval", type=float, default=0.1)
+    parser.add_argument("--modes", default="thread,asyncio")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    payload = os.urandom(args.payload_size)
+    packets = [
+        publish_packet(f"site/{i % 10}/device/{i}/telemetry", payload)
+        for i in range(args.topics)
+    ]
+    burst = b"".join(packets[i % args.topics] for i in range(args.messages))
+
+    results = []
+    for mode in args.modes.split(","):
+        results.append(await run_mode(mode.strip(), burst, args.messages, args.batch_interval))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    columns = list(results[0])
+    print("  ".join(f"{column:>20}" for column in columns))
+    for result in results:
+        print("  ".join(f"{str(result[column]):>20}" for column in columns))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
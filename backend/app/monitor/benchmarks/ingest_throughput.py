@@ -0,0 +1,389 @@
+# Copyright (c) 2025 BunkerM
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# You may not use this file except in compliance with the License.
+# http://www.apache.org/licenses/LICENSE-2.0
+# Distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND.
+#
+# ingest_throughput.py
+"""End-to-end ingest throughput of the monitor service against a real broker.
+
+Starts a private Mosquitto and a monitor process (`main.py`) pointed at it,
+then for every combination of publish rate, topic cardinality and payload
+size drives QoS 0 traffic from asyncio publishers for `--duration` seconds.
+Once a second it samples:
+
+  cpu / rss    of the monitor process (psutil)
+  lag          messages the broker received ($SYS/broker/publish/messages/received,
+               published every second) minus messages the monitor counted
+               (bunkerm_monitor_messages_received on /metrics)
+
+and it times `/metrics` and, when `--id-token` is given, `/api/v1/stats`.
+Results are written as JSON so runs can be compared over time.
+
+The monitor needs FIREBASE_CREDENTIALS_PATH in the environment to start; its
+history database goes to a temporary directory. Run from backend/app/monitor:
+
+    python benchmarks/ingest_throughput.py --rates 1000,5000,20000 --topics 100,10000 \\
+        --payload-sizes 64,1024 --duration 30 --output results.json
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import platform
+import re
+import secrets
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+import psutil
+from paho.mqtt import client as mqtt_client
+
+MONITOR_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+COMMON_DIR = os.path.join(os.path.dirname(MONITOR_DIR), "common")
+_MONITOR_RECEIVED = re.compile(r"^bunkerm_monitor_messages_received_total(?:\{[^}]*\})? (\S+)$", re.M)
+
+
+def encode_length(length: int) -> bytes:
+    encoded = bytearray()
+    while True:
+        byte, length = length % 128, length // 128
+        encoded.append(byte | 0x80 if length else byte)
+        if not length:
+            return bytes(encoded)
+
+
+def connect_packet(client_id: str) -> bytes:
+    client_id_bytes = client_id.encode()
+    # Protocol "MQTT" level 4 (3.1.1), clean session, 60s keepalive
+    body = b"\x00\x04MQTT\x04\x02\x00\x3c" + len(client_id_bytes).to_bytes(2, "big") + client_id_bytes
+    return b"\x10" + encode_length(len(body)) + body
+
+
+def publish_packet(topic: str, payload: bytes) -> bytes:
+    topic_bytes = topic.encode()
+    body = len(topic_bytes).to_bytes(2, "big") + topic_bytes + payload
+    return b"\x30" + encode_length(len(body)) + body
+
+
+def free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for(check, timeout: float, what: str):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if check():
+                return
+        except OSError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"Timed out waiting for {what}")
+
+
+def start_mosquitto(binary: str, port: int, workdir: str) -> subprocess.Popen:
+    config = os.path.join(workdir, "mosquitto.conf")
+    with open(config, "w") as f:
+        f.write(
+            f"listener {port} 127.0.0.1\n"
+            "allow_anonymous true\n"
+            "persistence false\n"
+            "sys_interval 1\n"
+            "max_queued_messages 100000\n"
+            "log_type error\n"
+        )
+    process = subprocess.Popen([binary, "-c", config], stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    wait_for(lambda: socket.create_connection(("127.0.0.1", port), timeout=1).close() is None,
+             10, "mosquitto to listen")
+    return process
+
+
+def start_monitor(broker_port: int, app_port: int, metrics_token: str, workdir: str,
+                  extra_env: dict) -> subprocess.Popen:
+    env = {
+        **os.environ,
+        "MOSQUITTO_IP": "127.0.0.1",
+        "MOSQUITTO_PORT": str(broker_port),
+        "APP_HOST": "127.0.0.1",
+        "APP_PORT": str(app_port),
+        "ALLOWED_HOSTS": "127.0.0.1,localhost",
+        "METRICS_TOKEN": metrics_token,
+        "MONITOR_DATA_DIR": os.path.join(workdir, "data"),
+        "LATENCY_PROBE_INTERVAL": "0",
+        "PYTHONPATH": os.pathsep.join(filter(None, [COMMON_DIR, os.environ.get("PYTHONPATH")])),
+        **extra_env,
+    }
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(MONITOR_DIR, "main.py")],
+        cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=open(os.path.join(workdir, "monitor.err"), "wb")
+    )
+
+    def healthy():
+        if process.poll() is not None:
+            raise RuntimeError(f"Monitor exited with {process.returncode}; see {workdir}/monitor.err")
+        with urllib.request.urlopen(f"http://127.0.0.1:{app_port}/health", timeout=1) as response:
+            return json.loads(response.read()).get("mqtt_connected")
+
+    wait_for(healthy, 60, "the monitor to connect to the broker")
+    return process
+
+
+class SysWatcher:
+    """Latest broker-side message counters from $SYS"""
+
+    TOPICS = ("$SYS/broker/publish/messages/received", "$SYS/broker/messages/received")
+
+    def __init__(self, port: int):
+        self.values = {}
+        self.client = mqtt_client.Client(mqtt_client.CallbackAPIVersion.VERSION2, client_id="bench-sys")
+        self.client.on_connect = lambda client, userdata, flags, rc, properties=None: [
+            client.subscribe(topic, 0) for topic in self.TOPICS
+        ]
+        self.client.on_message = self._on_message
+        self.client.connect("127.0.0.1", port, 60)
+        self.client.loop_start()
+
+    def _on_message(self, client, userdata, msg):
+        try:
+            self.values[msg.topic] = int(msg.payload)
+        except ValueError:
+            pass
+
+    def get(self, topic: str) -> int:
+        return self.values.get(topic, 0)
+
+    def stop(self):
+        self.client.loop_stop()
+        self.client.disconnect()
+
+
+class MonitorClient:
+    def __init__(self, app_port: int, metrics_token: str, id_token: str = None):
+        self.base = f"http://127.0.0.1:{app_port}"
+        self.metrics_token = metrics_token
+        self.id_token = id_token
+
+    def _get(self, path: str, token: str) -> tuple:
+        request = urllib.request.Request(self.base + path, headers={"Authorization": f"Bearer {token}"})
+        started = time.perf_counter()
+        with urllib.request.urlopen(request, timeout=10) as response:
+            body = response.read()
+        return (time.perf_counter() - started) * 1000, body
+
+    def metrics(self) -> tuple:
+        """(latency ms, messages received by the monitor)"""
+        latency, body = self._get("/metrics", self.metrics_token)
+        received = sum(float(value) for value in _MONITOR_RECEIVED.findall(body.decode()))
+        return latency, int(received)
+
+    def stats_latency(self) -> float:
+        return self._get("/api/v1/stats", self.id_token)[0]
+
+
+async def publisher(port: int, client_id: str, rate: float, packets: list, stop: asyncio.Event,
+                    counter: list, tick: float = 0.01):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(connect_packet(client_id))
+    await writer.drain()
+    await reader.readexactly(4)  # CONNACK
+    cycle = itertools.cycle(packets)
+    started = time.perf_counter()
+    sent = 0
+    while not stop.is_set():
+        due = int(rate * (time.perf_counter() - started)) - sent
+        if due > 0:
+            writer.write(b"".join(next(cycle) for _ in range(due)))
+            await writer.drain()
+            sent += due
+            counter[0] += due
+        await asyncio.sleep(tick)
+    writer.write(b"\xe0\x00")  # DISCONNECT
+    await writer.drain()
+    writer.close()
+
+
+def percentile(values: list, fraction: float):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(len(ordered) * fraction))], 3)
+
+
+async def run_scenario(args, broker_port: int, monitor: MonitorClient, process: psutil.Process,
+                       watcher: SysWatcher, rate: int, topics: int, payload_size: int) -> dict:
+    payload = os.urandom(payload_size)
+    all_packets = [publish_packet(f"bench/{i % 100}/device/{i}/telemetry", payload) for i in range(topics)]
+    publishers = min(args.publishers, topics)
+
+    received_topic = SysWatcher.TOPICS[0]
+    broker_start = watcher.get(received_topic)
+    _, monitor_start = await asyncio.to_thread(monitor.metrics)
+    process.cpu_percent(None)
+
+    stop = asyncio.Event()
+    sent = [0]
+    tasks = [
+        asyncio.create_task(publisher(
+            broker_port, f"bench-pub-{index}", rate / publishers,
+            all_packets[index::publishers], stop, sent
+        ))
+        for index in range(publishers)
+    ]
+
+    samples = []
+    metrics_latencies = []
+    stats_latencies = []
+    errors = 0
+    started = time.perf_counter()
+    next_stats = started
+    while time.perf_counter() - started < args.duration:
+        await asyncio.sleep(1)
+        try:
+            latency, monitor_received = await asyncio.to_thread(monitor.metrics)
+            metrics_latencies.append(latency)
+            if monitor.id_token and time.perf_counter() >= next_stats:
+                next_stats += args.stats_interval
+                stats_latencies.append(await asyncio.to_thread(monitor.stats_latency))
+        except (OSError, urllib.error.URLError):
+            errors += 1
+            continue
+        broker_received = watcher.get(received_topic) - broker_start
+        samples.append({
+            "t": round(time.perf_counter() - started, 2),
+            "sent": sent[0],
+            "broker_received": broker_received,
+            "monitor_received": monitor_received - monitor_start,
+            "lag": broker_received - (monitor_received - monitor_start),
+            "cpu_percent": process.cpu_percent(None),
+            "rss_mb": round(process.memory_info().rss / 2 ** 20, 1),
+        })
+
+    stop.set()
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - started
+
+    # Let the monitor drain, then see whether it caught up with the broker
+    await asyncio.sleep(args.drain)
+    _, monitor_final = await asyncio.to_thread(monitor.metrics)
+    broker_final = watcher.get(received_topic) - broker_start
+    monitor_final -= monitor_start
+
+    lags = [sample["lag"] for sample in samples]
+    cpu = [sample["cpu_percent"] for sample in samples]
+    return {
+        "rate": rate,
+        "topics": topics,
+        "payload_size": payload_size,
+        "publishers": publishers,
+        "seconds": round(elapsed, 3),
+        "sent": sent[0],
+        "achieved_rate": round(sent[0] / elapsed),
+        "broker_received": broker_final,
+        "monitor_received": monitor_final,
+        "monitor_rate": round(samples[-1]["monitor_received"] / samples[-1]["t"]) if samples else None,
+        "lag_p50": percentile(lags, 0.5),
+        "lag_max": max(lags) if lags else None,
+        "lag_after_drain": broker_final - monitor_final,
+        "cpu_percent_avg": round(statistics.mean(cpu), 1) if cpu else None,
+        "cpu_percent_max": max(cpu) if cpu else None,
+        "rss_mb_max": max(sample["rss_mb"] for sample in samples) if samples else None,
+        "metrics_latency_ms_p50": percentile(metrics_latencies, 0.5),
+        "metrics_latency_ms_p99": percentile(metrics_latencies, 0.99),
+        "stats_latency_ms_p50": percentile(stats_latencies, 0.5),
+        "stats_latency_ms_p95": percentile(stats_latencies, 0.95),
+        "stats_latency_ms_max": max(stats_latencies) if stats_latencies else None,
+        "errors": errors,
+        "samples": samples if args.samples else None,
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rates", default="1000,5000,20000", help="total publish rates, messages per second")
+    parser.add_argument("--topics", default="1000", help="topic cardinalities")
+    parser.add_argument("--payload-sizes", default="64", help="payload sizes in bytes")
+    parser.add_argument("--publishers", type=int, default=8, help="concurrent publisher connections")
+    parser.add_argument("--duration", type=float, default=30, help="seconds of load per scenario")
+    parser.add_argument("--drain", type=float, default=3, help="seconds to wait after load before the final count")
+    parser.add_argument("--stats-interval", type=float, default=2.5,
+                        help="seconds between /api/v1/stats requests (the endpoint allows 30/minute)")
+    parser.add_argument("--id-token", default=os.getenv("BENCH_ID_TOKEN"),
+                        help="Firebase ID token with stats access; /api/v1/stats is not timed without it")
+    parser.add_argument("--ingest-mode", default=os.getenv("MQTT_INGEST_MODE", "thread"), help="thread or asyncio")
+    parser.add_argument("--mosquitto", default="mosquitto", help="mosquitto binary")
+    parser.add_argument("--samples", action="store_true", help="include the per-second samples")
+    parser.add_argument("--output", help="write JSON results to this file instead of stdout")
+    args = parser.parse_args()
+
+    rates = [int(value) for value in args.rates.split(",")]
+    topic_counts = [int(value) for value in args.topics.split(",")]
+    payload_sizes = [int(value) for value in args.payload_sizes.split(",")]
+
+    started_at = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+    with tempfile.TemporaryDirectory(prefix="bunkerm-bench-") as workdir:
+        os.makedirs(os.path.join(workdir, "data"))
+        broker_port, app_port = free_port(), free_port()
+        metrics_token = secrets.token_hex(16)
+        broker = start_mosquitto(args.mosquitto, broker_port, workdir)
+        monitor_process = None
+        watcher = None
+        try:
+            monitor_process = start_monitor(
+                broker_port, app_port, metrics_token, workdir, {"MQTT_INGEST_MODE": args.ingest_mode}
+            )
+            watcher = SysWatcher(broker_port)
+            monitor = MonitorClient(app_port, metrics_token, args.id_token)
+            process = psutil.Process(monitor_process.pid)
+            scenarios = []
+            for rate, topics, payload_size in itertools.product(rates, topic_counts, payload_sizes):
+                result = await run_scenario(args, broker_port, monitor, process, watcher, rate, topics, payload_size)
+                scenarios.append(result)
+                print(f"rate={rate} topics={topics} payload={payload_size}: "
+                      f"monitor {result['monitor_rate']} msg/s, lag max {result['lag_max']}, "
+                      f"cpu {result['cpu_percent_avg']}%, rss {result['rss_mb_max']} MB", file=sys.stderr)
+        finally:
+            if watcher is not None:
+                watcher.stop()
+            for child in (monitor_process, broker):
+                if child is not None:
+                    child.terminate()
+                    try:
+                        child.wait(timeout=10)
+                    except subprocess.TimeoutExpired:
+                        child.kill()
+
+    report = {
+        "started_at": started_at,
+        "host": {
+            "platform": platform.platform(),
+            "python": platform.python_version(),
+            "cpu_count": os.cpu_count(),
+        },
+        "config": {
+            "ingest_mode": args.ingest_mode,
+            "publishers": args.publishers,
+            "duration": args.duration,
+            "stats_timed": bool(args.id_token),
+        },
+        "scenarios": scenarios,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
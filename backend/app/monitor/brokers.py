@@ -0,0 +1,77 @@
+# Copyright (c) 2025 BunkerM
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# You may not use this file except in compliance with the License.
+# http://www.apache.org/licenses/LICENSE-2.0
+# Distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND.
+#
+# brokers.py
+import os
+import re
+from typing import List, NamedTuple, Optional
+
+_NAME = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+class BrokerTarget(NamedTuple):
+    """One broker the monitor connects to"""
+    name: str
+    host: str
+    port: int
+    username: Optional[str]
+    password: Optional[str]
+    db_path: str
+    counter_file: str
+
+
+def _target(name: str, host: str, port: int, username: Optional[str], password: Optional[str],
+            data_dir: str, primary: bool) -> BrokerTarget:
+    if not _NAME.match(name):
+        raise ValueError(f"Invalid broker name '{name}': use letters, digits, '-' and '_'")
+    # The first broker keeps the single-broker file names so existing history carries over
+    suffix = "" if primary else f"-{name}"
+    return BrokerTarget(
+        name, host, port, username, password,
+        db_path=os.path.join(data_dir, f"historical_data{suffix}.db"),
+        counter_file=f"message_counts{suffix}.json"
+    )
+
+
+def parse_broker_targets(spec: str, default_host: str, default_port: int,
+                         default_username: Optional[str], default_password: Optional[str],
+                         data_dir: str = "/app/monitor/data") -> List[BrokerTarget]:
+    """Parse a comma-separated broker list such as `site-a=10.0.0.5:1900,site-b=user:pw@10.0.1.5`.
+
+    Each entry is `name=[username[:password]@]host[:port]`; omitted parts
+    fall back to the defaults. An empty spec yields a single broker named
+    "default" at the default address.
+    """
+    entries = [entry.strip() for entry in spec.split(",") if entry.strip()]
+    if not entries:
+        return [_target("default", default_host, default_port, default_username, default_password,
+                        data_dir, primary=True)]
+
+    targets = []
+    for index, entry in enumerate(entries):
+        name, sep, address = entry.partition("=")
+        if not sep or not address:
+            # Entries may carry credentials, so errors name the position instead
+            raise ValueError(f"Invalid broker entry #{index + 1}: expected name=host[:port]")
+        username, password = default_username, default_password
+        if "@" in address:
+            userinfo, address = address.rsplit("@", 1)
+            username, has_password, secret = userinfo.partition(":")
+            if has_password:
+                password = secret
+        host, has_port, port = address.rpartition(":") if ":" in address else (address, "", "")
+        try:
+            port = int(port) if has_port else default_port
+        except ValueError:
+            raise ValueError(f"Invalid port for broker '{name}'")
+        targets.append(_target(name.strip(), host, port, username, password, data_dir, primary=index == 0))
+
+    names = [target.name for target in targets]
+    duplicates = sorted({name for name in names if names.count(name) > 1})
+    if duplicates:
+        raise ValueError(f"Duplicate broker names: {', '.join(duplicates)}")
+    return targets
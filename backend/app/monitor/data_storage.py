@@ -3,28 +3,194 @@ import sqlite3
 from datetime import datetime, timedelta, timezone
 import os
 import json
+import queue
+import asyncio
 import threading
-from typing import Dict, List, Any
+import time
+import heapq
+from bisect import bisect_left, bisect_right
+from itertools import groupby
+from concurrent.futures import Future
+from typing import Callable, Dict, Iterator, List, Any, Tuple
 from contextlib import contextmanager
+from urllib.request import pathname2url
+from timeseries_codec import decode_timestamps, decode_values, encode_timestamps, encode_values
+from instrumentation import LatencyHistogram
+
+class StorageWriter:
+    """Writer thread that applies write requests for one or more databases.
+
+    Each database gets a persistent connection owned by the thread. Queued
+    requests are drained in batches and committed with one transaction per
+    database, so any number of `HistoricalDataStorage` instances can share
+    a single thread.
+    """
+
+    def __init__(self, max_batch: int = 64):
+        self.max_batch = max_batch
+        # Time requests spend queued, and per-database transaction durations
+        self.queue_wait = LatencyHistogram()
+        self.commit_latency = LatencyHistogram()
+        self._queue: "queue.Queue" = queue.Queue()
+        self._thread = threading.Thread(target=self._loop, name="storage-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, storage: "HistoricalDataStorage", write: Callable[[sqlite3.Cursor], Any]) -> Future:
+        """Queue `write(cursor)` against `storage`'s database"""
+        future = Future()
+        self._queue.put((storage, write, future, time.perf_counter_ns()))
+        return future
+
+    def _loop(self):
+        connections: Dict[str, sqlite3.Connection] = {}
+        running = True
+        while running:
+            batch = [self._queue.get()]
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if None in batch:
+                running = False
+                batch = [item for item in batch if item is not None]
+
+            dequeued = time.perf_counter_ns()
+            by_database: Dict[str, List] = {}
+            for storage, write, future, queued in batch:
+                self.queue_wait.record(dequeued - queued)
+                by_database.setdefault(storage.db_path, []).append((storage, write, future))
+            for db_path, requests in by_database.items():
+                conn = connections.get(db_path)
+                if conn is None:
+                    try:
+                        conn = requests[0][0]._connect()
+                    except Exception as e:
+                        for _, _, future in requests:
+                            if future.set_running_or_notify_cancel():
+                                future.set_exception(e)
+                        continue
+                    conn.isolation_level = None  # transactions are managed explicitly below
+                    connections[db_path] = conn
+                with self.commit_latency.time():
+                    self._commit(conn, requests)
+        for conn in connections.values():
+            conn.close()
+
+    @staticmethod
+    def _commit(conn: sqlite3.Connection, requests: List):
+        cursor = conn.cursor()
+        completed = []
+        try:
+            cursor.execute("BEGIN")
+            for _, write, future in requests:
+                if not future.set_running_or_notify_cancel():
+                    continue
+                # A savepoint per request keeps one failing write from undoing the rest
+                cursor.execute("SAVEPOINT write_request")
+                try:
+                    result = write(cursor)
+                    cursor.execute("RELEASE write_request")
+                    completed.append((future, result))
+                except Exception as e:
+                    future.set_exception(e)
+                    if not conn.in_transaction:
+                        # SQLite aborted the whole transaction (IOERR, FULL, NOMEM...)
+                        raise sqlite3.OperationalError(f"Write batch aborted: {e}") from e
+                    cursor.execute("ROLLBACK TO write_request")
+                    cursor.execute("RELEASE write_request")
+            cursor.execute("COMMIT")
+        except Exception as e:
+            if conn.in_transaction:
+                conn.rollback()
+            # Nothing in the batch was committed: fail every request not yet
+            # resolved, including the ones the batch never reached
+            for _, _, future in requests:
+                if future.running() or (not future.done() and future.set_running_or_notify_cancel()):
+                    future.set_exception(e)
+            completed = []
+        for future, result in completed:
+            future.set_result(result)
+
+    def summary(self) -> Dict:
+        return {
+            "queued": self._queue.qsize(),
+            "queue_wait": self.queue_wait.summary(),
+            "commit": self.commit_latency.summary(),
+        }
+
+    def close(self):
+        """Stop the thread after pending writes and close its connections"""
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+
 
 class HistoricalDataStorage:
-    def __init__(self, db_path="/app/monitor/data/historical_data.db"):
+    """SQLite-backed monitor history.
+
+    All writes are executed by a `StorageWriter` thread that owns a
+    persistent connection and commits queued requests in batches; pass a
+    shared `writer` to keep one thread for several databases. Reads use a small
+    pool of persistent read-only connections, which WAL mode lets run
+    concurrently with the writer. Use `aio` from async code.
+    """
+
+    # Seconds between raw samples written by the background collector
+    RAW_RESOLUTION = 180
+
+    # Rollup tiers and their nominal bucket width in seconds, finest first
+    ROLLUP_TIERS = {"hour": 3600, "day": 86400, "month": 30 * 86400}
+
+    # Metrics with a raw tier in hourly_stats
+    RAW_METRICS = ("bytes_received", "bytes_sent")
+
+    # Raw samples older than `compress_after` move into compressed chunks of this many seconds
+    CHUNK_SECONDS = 7200
+
+    DEFAULT_RETENTION_DAYS = {
+        "raw": 7,
+        "hour": 90,
+        "day": 730,
+        "month": 3650,
+        "daily_messages": 730,
+        "anomalies": 90,
+        "alerts": 90,
+        "connections": 365,
+    }
+
+    def __init__(self, db_path="/app/monitor/data/historical_data.db", read_pool_size=4, max_write_batch=64,
+                 retention_days: Dict[str, int] = None, raw_resolution: int = None,
+                 writer: StorageWriter = None, compress_after: int = None):
         self.db_path = db_path
-        self.lock = threading.RLock()
+        # Age in seconds after which raw samples are compressed; None keeps them as rows
+        self.compress_after = compress_after
+        # Seconds between raw byte rate samples, as configured in the collector
+        self.raw_resolution = raw_resolution or self.RAW_RESOLUTION
+        self.read_pool_size = read_pool_size
+        self.max_write_batch = max_write_batch
+        self.retention_days = {**self.DEFAULT_RETENTION_DAYS, **(retention_days or {})}
         os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
         self._init_db()
+
+        self._readers: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._readers_created = 0
+        self._readers_lock = threading.Lock()
+
+        # A writer passed in is shared with other databases and closed by its owner
+        self._owns_writer = writer is None
+        self._writer = writer or StorageWriter(max_write_batch)
+        # Time a read connection is held, and a write's wait for its commit
+        self.read_latency = LatencyHistogram()
+        self.write_latency = LatencyHistogram()
+        self.aio = AsyncHistoricalDataStorage(self)
     
     @contextmanager
-    def get_connection(self):
+    def get_connection(self, read_only: bool = False):
         """Context manager for database connections with proper cleanup"""
         conn = None
         try:
-            conn = sqlite3.connect(self.db_path, timeout=30)
-            # Enable WAL mode for better concurrency
-            conn.execute('PRAGMA journal_mode=WAL;')
-            conn.execute('PRAGMA synchronous=NORMAL;')
-            conn.execute('PRAGMA cache_size=1000;')
-            conn.execute('PRAGMA temp_store=memory;')
+            conn = self._connect(read_only)
             yield conn
         except Exception as e:
             if conn:
@@ -34,151 +200,681 @@ class HistoricalDataStorage:
             if conn:
                 conn.close()
 
+    def _connect(self, read_only: bool = False) -> sqlite3.Connection:
+        if read_only:
+            uri = f"file:{pathname2url(os.path.abspath(self.db_path))}?mode=ro"
+            conn = sqlite3.connect(uri, uri=True, timeout=30, check_same_thread=False)
+        else:
+            conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+            # Only takes effect on a new database: lets compress_raw_history() hand freed pages back
+            conn.execute('PRAGMA auto_vacuum=INCREMENTAL;')
+            # Enable WAL mode for better concurrency
+            conn.execute('PRAGMA journal_mode=WAL;')
+            conn.execute('PRAGMA synchronous=NORMAL;')
+        conn.execute('PRAGMA cache_size=1000;')
+        conn.execute('PRAGMA temp_store=memory;')
+        return conn
+
+    @contextmanager
+    def _read_connection(self):
+        """Borrow a persistent read-only connection from the pool"""
+        try:
+            conn = self._readers.get_nowait()
+        except queue.Empty:
+            with self._readers_lock:
+                create = self._readers_created < self.read_pool_size
+                if create:
+                    self._readers_created += 1
+            conn = self._connect(read_only=True) if create else self._readers.get()
+        started = time.perf_counter_ns()
+        try:
+            yield conn
+        finally:
+            self.read_latency.record(time.perf_counter_ns() - started)
+            # End the implicit read transaction so the next borrower sees fresh data
+            conn.rollback()
+            self._readers.put(conn)
+
+    def _submit_write(self, write: Callable[[sqlite3.Cursor], Any]) -> Future:
+        """Queue `write(cursor)` for the writer thread"""
+        return self._writer.submit(self, write)
+
+    def _write(self, write: Callable[[sqlite3.Cursor], Any]) -> Any:
+        """Run `write(cursor)` on the writer thread and wait for its batch to commit"""
+        with self.write_latency.time():
+            return self._submit_write(write).result()
+
+    def latency_summary(self) -> Dict:
+        return {
+            "read": self.read_latency.summary(),
+            "write": self.write_latency.summary(),
+            "writer": self._writer.summary(),
+        }
+
+    def close(self):
+        """Stop an owned writer after pending writes and close pooled connections"""
+        if self._owns_writer:
+            self._writer.close()
+        while True:
+            try:
+                self._readers.get_nowait().close()
+            except queue.Empty:
+                break
+
     def _init_db(self):
         """Initialize database with proper schema validation"""
-        with self.lock:
-            with self.get_connection() as conn:
-                cursor = conn.cursor()
-                
-                # 1. First create the stats table with all columns
-                cursor.execute("""
-                    CREATE TABLE IF NOT EXISTS stats (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        data_type TEXT NOT NULL,
-                        json_data TEXT NOT NULL,
-                        timestamp TEXT,
-                        created_at DATETIME DEFAULT CURRENT_TIMESTAMP
-                    )
-                """)
-                
-                # 2. Verify the table has the created_at column
-                cursor.execute("PRAGMA table_info(stats)")
-                columns = [col[1] for col in cursor.fetchall()]
-                
-                # 3. Add column if it doesn't exist
-                if 'created_at' not in columns:
-                    print("Adding missing created_at column to stats table")
-                    cursor.execute("ALTER TABLE stats ADD COLUMN created_at DATETIME DEFAULT CURRENT_TIMESTAMP")
-                
-                # 4. Now create indexes safely
-                cursor.execute("CREATE INDEX IF NOT EXISTS idx_data_type ON stats(data_type)")
-                cursor.execute("CREATE INDEX IF NOT EXISTS idx_timestamp ON stats(timestamp)")
-                cursor.execute("CREATE INDEX IF NOT EXISTS idx_data_type_timestamp ON stats(data_type, timestamp)")
-                cursor.execute("CREATE INDEX IF NOT EXISTS idx_created_at ON stats(created_at)")
-                
-                # 5. Create daily_message_counts table
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            
+            # 1. First create the stats table with all columns
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS stats (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    data_type TEXT NOT NULL,
+                    json_data TEXT NOT NULL,
+                    timestamp TEXT,
+                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+            
+            # 2. Verify the table has the created_at column
+            cursor.execute("PRAGMA table_info(stats)")
+            columns = [col[1] for col in cursor.fetchall()]
+            
+            # 3. Add column if it doesn't exist
+            if 'created_at' not in columns:
+                print("Adding missing created_at column to stats table")
+                cursor.execute("ALTER TABLE stats ADD COLUMN created_at DATETIME DEFAULT CURRENT_TIMESTAMP")
+            
+            # 4. Now create indexes safely
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_data_type ON stats(data_type)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_timestamp ON stats(timestamp)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_data_type_timestamp ON stats(data_type, timestamp)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_created_at ON stats(created_at)")
+            
+            # 5. Create daily_message_counts table
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS daily_message_counts (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    date TEXT UNIQUE NOT NULL,
+                    count INTEGER NOT NULL DEFAULT 0,
+                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+            
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_message_date ON daily_message_counts(date)")
+
+            # 6. Key/value table for monitor bookkeeping (e.g. last applied flush sequence)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS monitor_state (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+
+            # 7. Per topic prefix traffic snapshots (deltas since the previous snapshot),
+            #    keyed by epoch seconds; older databases stored ISO-8601 text
+            cursor.execute("PRAGMA table_info(topic_traffic)")
+            legacy_topic_traffic = any(col[1] == 'timestamp' and col[2] == 'TEXT' for col in cursor.fetchall())
+            if legacy_topic_traffic:
+                cursor.execute("DROP INDEX IF EXISTS idx_topic_traffic_prefix_timestamp")
+                cursor.execute("DROP INDEX IF EXISTS idx_topic_traffic_timestamp")
+                cursor.execute("ALTER TABLE topic_traffic RENAME TO topic_traffic_legacy")
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS topic_traffic (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    timestamp INTEGER NOT NULL,
+                    prefix TEXT NOT NULL,
+                    depth INTEGER NOT NULL,
+                    messages INTEGER NOT NULL,
+                    bytes INTEGER NOT NULL
+                )
+            """)
+            if legacy_topic_traffic:
                 cursor.execute("""
-                    CREATE TABLE IF NOT EXISTS daily_message_counts (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        date TEXT UNIQUE NOT NULL,
-                        count INTEGER NOT NULL DEFAULT 0,
-                        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                        updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
-                    )
+                    INSERT INTO topic_traffic (timestamp, prefix, depth, messages, bytes)
+                    SELECT CAST(strftime('%s', timestamp) AS INTEGER), prefix, depth, messages, bytes
+                    FROM topic_traffic_legacy WHERE strftime('%s', timestamp) IS NOT NULL
                 """)
-                
-                cursor.execute("CREATE INDEX IF NOT EXISTS idx_message_date ON daily_message_counts(date)")
-                
-                conn.commit()
+                print(f"Migrated {cursor.rowcount} topic traffic rows to epoch timestamps")
+                cursor.execute("DROP TABLE topic_traffic_legacy")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_topic_traffic_prefix_timestamp ON topic_traffic(prefix, timestamp)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_topic_traffic_timestamp ON topic_traffic(timestamp)")
+
+            # 8. Typed byte rate samples keyed by epoch seconds (replaces 'hourly' json_data rows)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS hourly_stats (
+                    timestamp INTEGER PRIMARY KEY,
+                    bytes_received REAL NOT NULL,
+                    bytes_sent REAL NOT NULL
+                )
+            """)
+
+            # 9. Move legacy json_data rows into the typed tables
+            self._migrate_legacy_rows(cursor)
+
+            # 10. Hourly/daily/monthly rollups of every metric (min/max/sum over `samples`)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS metric_rollups (
+                    tier TEXT NOT NULL,
+                    metric TEXT NOT NULL,
+                    bucket_start INTEGER NOT NULL,
+                    samples INTEGER NOT NULL,
+                    min REAL NOT NULL,
+                    max REAL NOT NULL,
+                    sum REAL NOT NULL,
+                    PRIMARY KEY (tier, metric, bucket_start)
+                ) WITHOUT ROWID
+            """)
+            cursor.execute("SELECT 1 FROM metric_rollups LIMIT 1")
+            if cursor.fetchone() is None:
+                self._backfill_rollups(cursor)
+
+            # 11. Raw samples compressed per CHUNK_SECONDS window (see timeseries_codec)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS raw_chunks (
+                    chunk_start INTEGER PRIMARY KEY,
+                    chunk_end INTEGER NOT NULL,
+                    samples INTEGER NOT NULL,
+                    timestamps BLOB NOT NULL,
+                    bytes_received BLOB NOT NULL,
+                    bytes_sent BLOB NOT NULL
+                )
+            """)
+
+            # 12. Anomaly episodes flagged by the collector's detectors
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS anomalies (
+                    metric TEXT NOT NULL,
+                    started_at INTEGER NOT NULL,
+                    ended_at INTEGER,
+                    kind TEXT NOT NULL,
+                    value REAL NOT NULL,
+                    expected REAL NOT NULL,
+                    peak_score REAL NOT NULL,
+                    samples INTEGER NOT NULL,
+                    PRIMARY KEY (metric, started_at)
+                )
+            """)
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_anomalies_started_at ON anomalies(started_at)")
+
+            # 13. User-defined alert rules, with the state each was last evaluated to
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS alert_rules (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    name TEXT NOT NULL,
+                    expression TEXT NOT NULL,
+                    for_seconds INTEGER,
+                    hysteresis REAL NOT NULL,
+                    webhook_url TEXT,
+                    state TEXT NOT NULL DEFAULT 'ok',
+                    state_since INTEGER,
+                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+
+            # 14. Alert firing/resolved transitions
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS alert_events (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    rule_id INTEGER NOT NULL,
+                    name TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    value REAL NOT NULL,
+                    at INTEGER NOT NULL
+                )
+            """)
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_alert_events_at ON alert_events(at)")
+
+            # 15. Hourly client connection activity (rebuilt from broker logs by log_backfill)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS connection_history (
+                    timestamp INTEGER PRIMARY KEY,
+                    connects INTEGER NOT NULL,
+                    disconnects INTEGER NOT NULL,
+                    unique_clients INTEGER NOT NULL
+                )
+            """)
+
+            conn.commit()
+
+    def _migrate_legacy_rows(self, cursor):
+        """Copy legacy JSON rows from `stats` into the typed tables and drop them"""
+        cursor.execute("SELECT id, data_type, json_data FROM stats WHERE data_type IN ('hourly', 'daily_messages')")
+        rows = cursor.fetchall()
+        if not rows:
+            return
+
+        hourly, daily = [], []
+        for _, data_type, json_data in rows:
+            try:
+                item = json.loads(json_data)
+                if data_type == 'hourly':
+                    hourly.append((
+                        int(self._parse_timestamp(item['timestamp']).timestamp()),
+                        float(item['bytes_received']),
+                        float(item['bytes_sent'])
+                    ))
+                else:
+                    daily.append((item['date'], int(item['count'])))
+            except (json.JSONDecodeError, KeyError, TypeError, ValueError) as e:
+                print(f"Skipping unreadable legacy {data_type} row: {e}")
+
+        cursor.executemany(
+            "INSERT OR REPLACE INTO hourly_stats (timestamp, bytes_received, bytes_sent) VALUES (?, ?, ?)",
+            hourly
+        )
+        cursor.executemany(
+            "INSERT OR IGNORE INTO daily_message_counts (date, count) VALUES (?, ?)",
+            daily
+        )
+        cursor.execute("DELETE FROM stats WHERE data_type IN ('hourly', 'daily_messages')")
+        print(f"Migrated {len(hourly)} hourly and {len(daily)} daily message rows to typed tables")
     
+    def _backfill_rollups(self, cursor):
+        """Build rollups from raw samples stored before rollups existed"""
+        bucket_exprs = {
+            "hour": "(timestamp / 3600) * 3600",
+            "day": "(timestamp / 86400) * 86400",
+            "month": "CAST(strftime('%s', timestamp, 'unixepoch', 'start of month') AS INTEGER)",
+        }
+        for tier, bucket_expr in bucket_exprs.items():
+            for metric in self.RAW_METRICS:
+                cursor.execute(f"""
+                    INSERT INTO metric_rollups (tier, metric, bucket_start, samples, min, max, sum)
+                    SELECT ?, ?, {bucket_expr} AS bucket, COUNT(*), MIN({metric}), MAX({metric}), SUM({metric})
+                    FROM hourly_stats GROUP BY bucket
+                """, (tier, metric))
+
+    @staticmethod
+    def _bucket_start(tier: str, timestamp: int) -> int:
+        if tier == "month":
+            day = datetime.fromtimestamp(timestamp, timezone.utc)
+            return int(datetime(day.year, day.month, 1, tzinfo=timezone.utc).timestamp())
+        width = HistoricalDataStorage.ROLLUP_TIERS[tier]
+        return timestamp - timestamp % width
+
+    def _rollup(self, cursor, timestamp: int, samples: Dict[str, float]):
+        """Fold samples into the bucket of every rollup tier (runs on the writer thread)"""
+        cursor.executemany(
+            """INSERT INTO metric_rollups (tier, metric, bucket_start, samples, min, max, sum)
+               VALUES (?, ?, ?, 1, ?, ?, ?)
+               ON CONFLICT(tier, metric, bucket_start) DO UPDATE SET
+                   samples = samples + 1,
+                   min = min(min, excluded.min),
+                   max = max(max, excluded.max),
+                   sum = sum + excluded.sum""",
+            [
+                (tier, metric, self._bucket_start(tier, timestamp), value, value, value)
+                for tier in self.ROLLUP_TIERS
+                for metric, value in samples.items()
+            ]
+        )
+
+    def add_metric_samples(self, samples: Dict[str, float], timestamp: int = None):
+        """Record one sample per metric into the rollup tiers"""
+        timestamp = int(time.time()) if timestamp is None else timestamp
+        try:
+            self._write(lambda cursor: self._rollup(cursor, timestamp, samples))
+        except Exception as e:
+            print(f"Error adding metric samples: {e}")
+
+    def apply_retention(self):
+        """Delete data older than the configured retention of each tier"""
+        def write(cursor):
+            now = int(time.time())
+            cursor.execute(
+                "DELETE FROM hourly_stats WHERE timestamp < ?",
+                (now - self.retention_days["raw"] * 86400,)
+            )
+            cursor.execute(
+                "DELETE FROM raw_chunks WHERE chunk_end < ?",
+                (now - self.retention_days["raw"] * 86400,)
+            )
+            for tier in self.ROLLUP_TIERS:
+                cursor.execute(
+                    "DELETE FROM metric_rollups WHERE tier = ? AND bucket_start < ?",
+                    (tier, now - self.retention_days[tier] * 86400)
+                )
+            cursor.execute(
+                "DELETE FROM anomalies WHERE started_at < ?",
+                (now - self.retention_days["anomalies"] * 86400,)
+            )
+            cursor.execute(
+                "DELETE FROM alert_events WHERE at < ?",
+                (now - self.retention_days["alerts"] * 86400,)
+            )
+            cursor.execute(
+                "DELETE FROM connection_history WHERE timestamp < ?",
+                (now - self.retention_days["connections"] * 86400,)
+            )
+            cutoff_date = (datetime.now(timezone.utc) - timedelta(days=self.retention_days["daily_messages"])).strftime('%Y-%m-%d')
+            cursor.execute("DELETE FROM daily_message_counts WHERE date < ?", (cutoff_date,))
+
+        try:
+            self._write(write)
+        except Exception as e:
+            print(f"Error applying retention: {e}")
+
+    def compress_raw_history(self, max_windows: int = 24) -> int:
+        """Move raw samples of closed windows older than `compress_after` into raw_chunks.
+
+        Each transaction compresses at most `max_windows` windows, so the
+        writer is never held for long after an upgrade leaves days of rows
+        to convert. Returns the number of samples compressed.
+        """
+        if not self.compress_after:
+            return 0
+        cutoff = int(time.time()) - self.compress_after
+        cutoff -= cutoff % self.CHUNK_SECONDS
+
+        def write(cursor):
+            cursor.execute("SELECT MIN(timestamp) FROM hourly_stats")
+            first = cursor.fetchone()[0]
+            if first is None or first >= cutoff:
+                return 0
+            batch_end = min(cutoff, first - first % self.CHUNK_SECONDS + max_windows * self.CHUNK_SECONDS)
+            cursor.execute(
+                "SELECT timestamp, bytes_received, bytes_sent FROM hourly_stats WHERE timestamp < ? ORDER BY timestamp",
+                (batch_end,)
+            )
+            rows = cursor.fetchall()
+            for chunk_start, window in groupby(rows, key=lambda row: row[0] - row[0] % self.CHUNK_SECONDS):
+                samples = {row[0]: row[1:] for row in window}
+                cursor.execute(
+                    "SELECT samples, timestamps, bytes_received, bytes_sent FROM raw_chunks WHERE chunk_start = ?",
+                    (chunk_start,)
+                )
+                existing = cursor.fetchone()
+                if existing:
+                    # Late samples for a compressed window: merge, newer rows win
+                    count, timestamps, *blobs = existing
+                    merged = dict(zip(decode_timestamps(timestamps),
+                                      zip(*(decode_values(blob, count) for blob in blobs))))
+                    merged.update(samples)
+                    samples = merged
+                timestamps = sorted(samples)
+                cursor.execute(
+                    """INSERT OR REPLACE INTO raw_chunks
+                       (chunk_start, chunk_end, samples, timestamps, bytes_received, bytes_sent)
+                       VALUES (?, ?, ?, ?, ?, ?)""",
+                    (chunk_start, timestamps[-1], len(timestamps), encode_timestamps(timestamps),
+                     encode_values([samples[t][0] for t in timestamps]),
+                     encode_values([samples[t][1] for t in timestamps]))
+                )
+            cursor.execute("DELETE FROM hourly_stats WHERE timestamp < ?", (batch_end,))
+            return len(rows)
+
+        compressed = 0
+        try:
+            while True:
+                moved = self._write(write)
+                if not moved:
+                    break
+                compressed += moved
+            if compressed:
+                self._write(self._release_free_pages)
+            return compressed
+        except Exception as e:
+            print(f"Error compressing raw history: {e}")
+            return compressed
+
+    @staticmethod
+    def _release_free_pages(cursor):
+        """Shrink the file by its free pages if the database uses incremental auto_vacuum"""
+        if cursor.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            return
+        # sqlite3 steps the pragma once per execute, and each step frees one page
+        free_pages = cursor.execute("PRAGMA freelist_count").fetchone()[0]
+        for _ in range(free_pages):
+            cursor.execute("PRAGMA incremental_vacuum")
+
+    def _raw_rows(self, conn: sqlite3.Connection, start: int, end: int,
+                  metrics: Tuple[str, ...]) -> Iterator[Tuple]:
+        """Raw samples between two epoch timestamps as (timestamp, *metrics), oldest first.
+
+        Merges decoded chunks with the uncompressed rows in hourly_stats.
+        Chunks are decoded one at a time as the iterator advances.
+        """
+        columns = ", ".join(metrics)
+        chunks = conn.execute(f"""
+            SELECT samples, timestamps, {columns} FROM raw_chunks
+            WHERE chunk_start BETWEEN ? AND ?
+            ORDER BY chunk_start ASC
+        """, (start - start % self.CHUNK_SECONDS, end))
+        table = conn.execute(f"""
+            SELECT timestamp, {columns} FROM hourly_stats
+            WHERE timestamp BETWEEN ? AND ?
+            ORDER BY timestamp ASC
+        """, (start, end))
+
+        def decoded():
+            for count, timestamps, *blobs in chunks:
+                timestamps = decode_timestamps(timestamps)
+                low, high = bisect_left(timestamps, start), bisect_right(timestamps, end)
+                yield from zip(timestamps[low:high], *(decode_values(blob, count)[low:high] for blob in blobs))
+
+        return heapq.merge(decoded(), table)
+
+    @staticmethod
+    def _iso(timestamp: int) -> str:
+        return time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(timestamp))
+
+    def choose_tier(self, start: int, end: int, max_points: int = 500, include_raw: bool = True) -> str:
+        """Pick the finest tier that keeps the range within max_points and still retains its start"""
+        now = int(time.time())
+        span = max(0, end - start)
+        resolutions = {"raw": self.raw_resolution, **self.ROLLUP_TIERS} if include_raw else self.ROLLUP_TIERS
+        for tier, resolution in resolutions.items():
+            if span / resolution <= max_points and start >= now - self.retention_days[tier] * 86400:
+                return tier
+        return "month"
+
+    def get_metric_history(self, metric: str, start: int, end: int, max_points: int = 500, tier: str = None):
+        """Get min/max/avg/sum series of a metric from the tier that best fits the range"""
+        tier = tier or self.choose_tier(start, end, max_points, include_raw=metric in self.RAW_METRICS)
+        result = {
+            'metric': metric,
+            'tier': tier,
+            'timestamps': [],
+            'min': [],
+            'max': [],
+            'avg': [],
+            'sum': [],
+            'samples': []
+        }
+        if tier == "raw" and metric not in self.RAW_METRICS:
+            raise ValueError(f"No raw samples are stored for metric '{metric}'")
+
+        with self._read_connection() as conn:
+            cursor = conn.cursor()
+            try:
+                if tier == "raw":
+                    rows = [
+                        (self._iso(timestamp), value, value, value, value, 1)
+                        for timestamp, value in self._raw_rows(conn, start, end, (metric,))
+                    ]
+                else:
+                    cursor.execute("""
+                        SELECT strftime('%Y-%m-%dT%H:%M:%SZ', bucket_start, 'unixepoch'),
+                               min, max, sum / samples, sum, samples
+                        FROM metric_rollups
+                        WHERE tier = ? AND metric = ? AND bucket_start BETWEEN ? AND ?
+                        ORDER BY bucket_start ASC
+                    """, (tier, metric, self._bucket_start(tier, start), end))
+                    rows = cursor.fetchall()
+                
+                columns = list(zip(*rows))
+                for key, column in zip(('timestamps', 'min', 'max', 'avg', 'sum', 'samples'), columns):
+                    result[key] = list(column)
+                return result
+            except Exception as e:
+                print(f"Error getting metric history: {e}")
+                return result
+
+    def export_metric_rows(self, metric: str, start: int, end: int, step: int = None,
+                           tier: str = None) -> Iterator[Tuple]:
+        """Stream a metric's history as (timestamp, min, max, avg, sum, samples) rows.
+
+        Without `step` the rows are the stored samples or buckets of `tier`,
+        by default the finest tier still retaining `start`. With `step` they
+        are aggregated into `step`-second buckets, by default from the
+        coarsest tier no wider than `step`. Arguments are validated before
+        this returns; rows are then fetched lazily in batches from a
+        dedicated connection, so memory does not grow with the range.
+        """
+        resolutions = {"raw": self.raw_resolution, **self.ROLLUP_TIERS}
+        if metric not in self.RAW_METRICS:
+            del resolutions["raw"]
+        if tier is not None and tier not in resolutions:
+            raise ValueError(f"Tier '{tier}' is not available for metric '{metric}'")
+        if step is not None:
+            if step <= 0:
+                raise ValueError("step must be a positive number of seconds")
+            if tier is None:
+                fitting = [name for name, resolution in resolutions.items() if resolution <= step]
+                tier = fitting[-1] if fitting else next(iter(resolutions))
+            if step < resolutions[tier]:
+                raise ValueError(f"step must be at least the {resolutions[tier]}s resolution of tier '{tier}'")
+        elif tier is None:
+            tier = self.choose_tier(start, end, max_points=float("inf"), include_raw="raw" in resolutions)
+
+        if tier == "raw":
+            return self._stream_raw(metric, start, end, step)
+        elif step:
+            sql = """
+                SELECT strftime('%Y-%m-%dT%H:%M:%SZ', bucket_start / ? * ?, 'unixepoch'),
+                       MIN(min), MAX(max), SUM(sum) / SUM(samples), SUM(sum), SUM(samples)
+                FROM metric_rollups
+                WHERE tier = ? AND metric = ? AND bucket_start BETWEEN ? AND ?
+                GROUP BY bucket_start / ?
+                ORDER BY bucket_start / ? ASC
+            """
+            params = (step, step, tier, metric, self._bucket_start(tier, start), end, step, step)
+        else:
+            sql = """
+                SELECT strftime('%Y-%m-%dT%H:%M:%SZ', bucket_start, 'unixepoch'),
+                       min, max, sum / samples, sum, samples
+                FROM metric_rollups
+                WHERE tier = ? AND metric = ? AND bucket_start BETWEEN ? AND ?
+                ORDER BY bucket_start ASC
+            """
+            params = (tier, metric, self._bucket_start(tier, start), end)
+        return self._stream_rows(sql, params)
+
+    def _stream_raw(self, metric: str, start: int, end: int, step: int = None) -> Iterator[Tuple]:
+        conn = self._connect(read_only=True)
+        try:
+            rows = self._raw_rows(conn, start, end, (metric,))
+            if not step:
+                for timestamp, value in rows:
+                    yield self._iso(timestamp), value, value, value, value, 1
+                return
+            for bucket, group in groupby(rows, key=lambda row: row[0] // step):
+                values = [row[1] for row in group]
+                total = sum(values)
+                yield self._iso(bucket * step), min(values), max(values), total / len(values), total, len(values)
+        finally:
+            conn.close()
+
+    def _stream_rows(self, sql: str, params: Tuple, batch_size: int = 1000) -> Iterator[Tuple]:
+        # A connection of its own, so a long export never holds one of the pooled readers
+        conn = self._connect(read_only=True)
+        try:
+            cursor = conn.execute(sql, params)
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield from rows
+        finally:
+            conn.close()
+
     def _load_all_data(self) -> Dict[str, List]:
         """Load all data with better error handling and performance"""
-        with self.lock:
-            with self.get_connection() as conn:
-                cursor = conn.cursor()
-                data = {
-                    "daily_messages": [],
-                    "hourly": [],
-                    "daily": []
-                }
+        with self._read_connection() as conn:
+            cursor = conn.cursor()
+            data = {
+                "daily_messages": [],
+                "hourly": [],
+                "daily": []
+            }
+            
+            try:
+                # Load daily messages from dedicated table first
+                cursor.execute("""
+                    SELECT date, count FROM daily_message_counts 
+                    WHERE date >= date('now', '-7 days')
+                    ORDER BY date
+                """)
+                for row in cursor.fetchall():
+                    data["daily_messages"].append({
+                        "date": row[0],
+                        "count": row[1]
+                    })
                 
-                try:
-                    # Load daily messages from dedicated table first
-                    cursor.execute("""
-                        SELECT date, count FROM daily_message_counts 
-                        WHERE date >= date('now', '-7 days')
-                        ORDER BY date
-                    """)
-                    for row in cursor.fetchall():
-                        data["daily_messages"].append({
-                            "date": row[0],
-                            "count": row[1]
-                        })
-                    
-                    # If no data in dedicated table, try legacy format
-                    if not data["daily_messages"]:
-                        cursor.execute("SELECT json_data FROM stats WHERE data_type = 'daily_messages'")
-                        for row in cursor.fetchall():
-                            try:
-                                item = json.loads(row[0])
-                                data["daily_messages"].append(item)
-                            except json.JSONDecodeError as e:
-                                print(f"Error parsing daily_messages JSON: {e}")
-                    
-                    # Load hourly data
-                    cursor.execute("""
-                        SELECT json_data FROM stats 
-                        WHERE data_type = 'hourly' 
-                        AND timestamp >= datetime('now', '-24 hours')
-                        ORDER BY timestamp
-                    """)
+                # If no data in dedicated table, try legacy format
+                if not data["daily_messages"]:
+                    cursor.execute("SELECT json_data FROM stats WHERE data_type = 'daily_messages'")
                     for row in cursor.fetchall():
                         try:
                             item = json.loads(row[0])
-                            data["hourly"].append(item)
+                            data["daily_messages"].append(item)
                         except json.JSONDecodeError as e:
-                            print(f"Error parsing hourly JSON: {e}")
-                    
-                except Exception as e:
-                    print(f"Error loading data: {e}")
+                            print(f"Error parsing daily_messages JSON: {e}")
                 
-                return data
+                # Load hourly data
+                for timestamp, bytes_received, bytes_sent in self._raw_rows(
+                    conn, self._epoch_hours_ago(24), int(time.time()), self.RAW_METRICS
+                ):
+                    data["hourly"].append({
+                        "timestamp": self._iso(timestamp),
+                        "bytes_received": bytes_received,
+                        "bytes_sent": bytes_sent
+                    })
+                
+            except Exception as e:
+                print(f"Error loading data: {e}")
+            
+            return data
     
     def _save_data_item(self, data_type: str, item: Dict, timestamp: str = None):
         """Save a single data item with better error handling"""
-        with self.lock:
-            with self.get_connection() as conn:
-                cursor = conn.cursor()
-                try:
-                    cursor.execute(
-                        "INSERT INTO stats (data_type, json_data, timestamp) VALUES (?, ?, ?)",
-                        (data_type, json.dumps(item), timestamp)
-                    )
-                    conn.commit()
-                except Exception as e:
-                    conn.rollback()
-                    raise e
+        def write(cursor):
+            cursor.execute(
+                "INSERT INTO stats (data_type, json_data, timestamp) VALUES (?, ?, ?)",
+                (data_type, json.dumps(item), timestamp)
+            )
+        self._write(write)
     
     def _clean_old_data(self, data_type: str = None, hours: int = None, days: int = None):
         """Enhanced cleanup with flexible time ranges"""
-        with self.lock:
-            with self.get_connection() as conn:
-                cursor = conn.cursor()
-                try:
-                    if data_type == "hourly" and hours:
-                        cutoff = datetime.now(timezone.utc) - timedelta(hours=hours)
-                        cursor.execute(
-                            "DELETE FROM stats WHERE data_type = 'hourly' AND timestamp < ?", 
-                            (cutoff.isoformat(),)
-                        )
-                    elif data_type == "daily_messages" and days:
-                        cutoff_date = (datetime.now() - timedelta(days=days)).date().isoformat()
-                        # Clean from both tables
-                        cursor.execute(
-                            "DELETE FROM daily_message_counts WHERE date < ?", 
-                            (cutoff_date,)
-                        )
-                        cursor.execute(
-                            """DELETE FROM stats 
-                               WHERE data_type = 'daily_messages' 
-                               AND json_extract(json_data, '$.date') < ?""", 
-                            (cutoff_date,)
-                        )
-                    
-                    conn.commit()
-                except Exception as e:
-                    conn.rollback()
-                    print(f"Error cleaning old data: {e}")
+        def write(cursor):
+            if data_type == "hourly" and hours:
+                cursor.execute(
+                    "DELETE FROM hourly_stats WHERE timestamp < ?", 
+                    (self._epoch_hours_ago(hours),)
+                )
+            elif data_type == "daily_messages" and days:
+                cutoff_date = (datetime.now() - timedelta(days=days)).date().isoformat()
+                # Clean from both tables
+                cursor.execute(
+                    "DELETE FROM daily_message_counts WHERE date < ?", 
+                    (cutoff_date,)
+                )
+                cursor.execute(
+                    """DELETE FROM stats 
+                       WHERE data_type = 'daily_messages' 
+                       AND json_extract(json_data, '$.date') < ?""", 
+                    (cutoff_date,)
+                )
+        
+        try:
+            self._write(write)
+        except Exception as e:
+            print(f"Error cleaning old data: {e}")
 
     def ensure_file_exists(self):
         """Initialize the database - now handled in __init__"""
@@ -198,99 +894,381 @@ class HistoricalDataStorage:
 
     def save_data(self, data):
         """Bulk save data (used for migrations/full updates)"""
-        with self.lock:
-            with self.get_connection() as conn:
-                cursor = conn.cursor()
-                try:
-                    # Clear existing data
-                    cursor.execute("DELETE FROM stats")
-                    cursor.execute("DELETE FROM daily_message_counts")
-                    
-                    # Save daily messages to dedicated table
-                    for item in data.get("daily_messages", []):
-                        cursor.execute(
-                            """INSERT OR REPLACE INTO daily_message_counts (date, count) 
-                               VALUES (?, ?)""",
-                            (item["date"], item["count"])
-                        )
-                    
-                    # Save hourly data
-                    for item in data.get("hourly", []):
-                        cursor.execute(
-                            "INSERT INTO stats (data_type, json_data, timestamp) VALUES (?, ?, ?)",
-                            ("hourly", json.dumps(item), item["timestamp"])
-                        )
-                    
-                    conn.commit()
-                except Exception as e:
-                    conn.rollback()
-                    print(f"Error saving data: {e}")
-                    raise
+        def write(cursor):
+            # Clear existing data
+            cursor.execute("DELETE FROM stats")
+            cursor.execute("DELETE FROM hourly_stats")
+            cursor.execute("DELETE FROM daily_message_counts")
+            
+            # Save daily messages to dedicated table
+            cursor.executemany(
+                """INSERT OR REPLACE INTO daily_message_counts (date, count) 
+                   VALUES (?, ?)""",
+                [(item["date"], item["count"]) for item in data.get("daily_messages", [])]
+            )
+            
+            # Save hourly data
+            cursor.executemany(
+                "INSERT OR REPLACE INTO hourly_stats (timestamp, bytes_received, bytes_sent) VALUES (?, ?, ?)",
+                [
+                    (int(self._parse_timestamp(item["timestamp"]).timestamp()),
+                     item["bytes_received"], item["bytes_sent"])
+                    for item in data.get("hourly", [])
+                ]
+            )
+        
+        try:
+            self._write(write)
+        except Exception as e:
+            print(f"Error saving data: {e}")
+            raise
 
     def update_daily_messages(self, message_count: int):
         """Update daily message count using dedicated table"""
-        with self.lock:
-            with self.get_connection() as conn:
-                cursor = conn.cursor()
-                try:
-                    current_date = datetime.now(timezone.utc).strftime('%Y-%m-%d')
-                    
-                    # Use INSERT OR IGNORE then UPDATE for upsert behavior
-                    cursor.execute(
-                        """INSERT OR IGNORE INTO daily_message_counts (date, count) 
-                           VALUES (?, 0)""",
-                        (current_date,)
-                    )
-                    
-                    cursor.execute(
-                        """UPDATE daily_message_counts 
-                           SET count = count + ?, updated_at = CURRENT_TIMESTAMP 
-                           WHERE date = ?""",
-                        (message_count, current_date)
-                    )
-                    
-                    # Clean old data (keep 7 days)
-                    cutoff_date = (datetime.now(timezone.utc) - timedelta(days=7)).strftime('%Y-%m-%d')
-                    cursor.execute("DELETE FROM daily_message_counts WHERE date < ?", (cutoff_date,))
-                    
-                    conn.commit()
-                except Exception as e:
-                    conn.rollback()
-                    print(f"Error updating daily messages: {e}")
+        def write(cursor):
+            current_date = datetime.now(timezone.utc).strftime('%Y-%m-%d')
+            
+            # Use INSERT OR IGNORE then UPDATE for upsert behavior
+            cursor.execute(
+                """INSERT OR IGNORE INTO daily_message_counts (date, count) 
+                   VALUES (?, 0)""",
+                (current_date,)
+            )
+            
+            cursor.execute(
+                """UPDATE daily_message_counts 
+                   SET count = count + ?, updated_at = CURRENT_TIMESTAMP 
+                   WHERE date = ?""",
+                (message_count, current_date)
+            )
+            
+        
+        try:
+            self._write(write)
+        except Exception as e:
+            print(f"Error updating daily messages: {e}")
+
+    def apply_daily_message_deltas(self, deltas: Dict[str, int], flush_seq: int) -> bool:
+        """Add batched per-date message count deltas in one transaction.
+
+        The flush sequence number is recorded in the same transaction, so a
+        batch that was already committed is skipped if it is replayed again.
+        Returns True once the batch is durable (applied now or previously).
+        """
+        def write(cursor):
+            cursor.execute("SELECT value FROM monitor_state WHERE key = 'message_flush_seq'")
+            row = cursor.fetchone()
+            if row and int(row[0]) >= flush_seq:
+                return
+
+            cursor.executemany(
+                """INSERT INTO daily_message_counts (date, count) VALUES (?, ?)
+                   ON CONFLICT(date) DO UPDATE
+                   SET count = count + excluded.count, updated_at = CURRENT_TIMESTAMP""",
+                [(date, count) for date, count in deltas.items() if count]
+            )
+            cursor.execute(
+                """INSERT INTO monitor_state (key, value) VALUES ('message_flush_seq', ?)
+                   ON CONFLICT(key) DO UPDATE
+                   SET value = excluded.value, updated_at = CURRENT_TIMESTAMP""",
+                (str(flush_seq),)
+            )
+
+        try:
+            self._write(write)
+            return True
+        except Exception as e:
+            print(f"Error applying daily message deltas: {e}")
+            return False
+
+    def get_message_flush_seq(self) -> int:
+        """Get the sequence number of the last committed message count flush"""
+        with self._read_connection() as conn:
+            cursor = conn.cursor()
+            try:
+                cursor.execute("SELECT value FROM monitor_state WHERE key = 'message_flush_seq'")
+                row = cursor.fetchone()
+                return int(row[0]) if row else 0
+            except Exception as e:
+                print(f"Error reading message flush sequence: {e}")
+                return 0
+
+    def get_monitor_state(self, key: str):
+        """Get a JSON value saved with set_monitor_state(), or None"""
+        with self._read_connection() as conn:
+            cursor = conn.cursor()
+            try:
+                cursor.execute("SELECT value FROM monitor_state WHERE key = ?", (key,))
+                row = cursor.fetchone()
+                return json.loads(row[0]) if row else None
+            except Exception as e:
+                print(f"Error reading monitor state '{key}': {e}")
+                return None
+
+    def set_monitor_state(self, key: str, value):
+        """Save a JSON-serializable value under `key`"""
+        def write(cursor):
+            cursor.execute(
+                """INSERT INTO monitor_state (key, value) VALUES (?, ?)
+                   ON CONFLICT(key) DO UPDATE
+                   SET value = excluded.value, updated_at = CURRENT_TIMESTAMP""",
+                (key, json.dumps(value, separators=(',', ':')))
+            )
+
+        try:
+            self._write(write)
+        except Exception as e:
+            print(f"Error saving monitor state '{key}': {e}")
+
+    def backfill_daily_message_counts(self, counts: Dict[str, int], replace: bool = False):
+        """Write recovered per-day message counts in one batch.
+
+        By default a day keeps the larger of its stored and recovered count,
+        so days the live counter saw in full are never lowered.
+        """
+        conflict = "excluded.count" if replace else "MAX(count, excluded.count)"
+
+        def write(cursor):
+            cursor.executemany(
+                f"""INSERT INTO daily_message_counts (date, count) VALUES (?, ?)
+                    ON CONFLICT(date) DO UPDATE
+                    SET count = {conflict}, updated_at = CURRENT_TIMESTAMP""",
+                sorted(counts.items())
+            )
+
+        try:
+            self._write(write)
+        except Exception as e:
+            print(f"Error backfilling daily message counts: {e}")
+
+    def add_connection_history(self, rows: List[Tuple[int, int, int, int]]):
+        """Store (hour start, connects, disconnects, unique clients) rows, replacing existing hours"""
+        def write(cursor):
+            cursor.executemany(
+                """INSERT OR REPLACE INTO connection_history (timestamp, connects, disconnects, unique_clients)
+                   VALUES (?, ?, ?, ?)""",
+                rows
+            )
+
+        try:
+            self._write(write)
+        except Exception as e:
+            print(f"Error adding connection history: {e}")
+
+    def get_connection_history(self, start: int, end: int) -> List[Dict]:
+        """Get hourly connection activity in an epoch range"""
+        with self._read_connection() as conn:
+            cursor = conn.cursor()
+            try:
+                cursor.execute("""
+                    SELECT timestamp, connects, disconnects, unique_clients FROM connection_history
+                    WHERE timestamp BETWEEN ? AND ?
+                    ORDER BY timestamp
+                """, (start, end))
+                columns = [description[0] for description in cursor.description]
+                return [dict(zip(columns, row)) for row in cursor.fetchall()]
+            except Exception as e:
+                print(f"Error getting connection history: {e}")
+                return []
+
+    def get_daily_message_counts(self, days: int = 7) -> Dict[str, int]:
+        """Get persisted message counts keyed by date for the last N days"""
+        with self._read_connection() as conn:
+            cursor = conn.cursor()
+            try:
+                cutoff_date = (datetime.now(timezone.utc) - timedelta(days=days)).strftime('%Y-%m-%d')
+                cursor.execute(
+                    "SELECT date, count FROM daily_message_counts WHERE date >= ?",
+                    (cutoff_date,)
+                )
+                return {row[0]: row[1] for row in cursor.fetchall()}
+            except Exception as e:
+                print(f"Error getting daily message counts: {e}")
+                return {}
+
+    def add_topic_traffic(self, rows: List[tuple], retention_days: int = 30):
+        """Store one snapshot of (prefix, depth, messages, bytes) rows with automatic cleanup"""
+        def write(cursor):
+            current_time = int(time.time())
+            cursor.executemany(
+                """INSERT INTO topic_traffic (timestamp, prefix, depth, messages, bytes)
+                   VALUES (?, ?, ?, ?, ?)""",
+                [(current_time, prefix, depth, messages, payload_bytes)
+                 for prefix, depth, messages, payload_bytes in rows]
+            )
+            
+            cursor.execute("DELETE FROM topic_traffic WHERE timestamp < ?", (current_time - retention_days * 86400,))
+        
+        try:
+            self._write(write)
+        except Exception as e:
+            print(f"Error adding topic traffic: {e}")
+
+    def get_topic_traffic(self, prefix: str, hours: int = 24):
+        """Get traffic snapshots of one topic prefix for the last N hours"""
+        with self._read_connection() as conn:
+            cursor = conn.cursor()
+            try:
+                cursor.execute("""
+                    SELECT timestamp, messages, bytes FROM topic_traffic
+                    WHERE prefix = ? AND timestamp >= ?
+                    ORDER BY timestamp ASC
+                """, (prefix, int(time.time()) - hours * 3600))
+                rows = cursor.fetchall()
+                return {
+                    'prefix': prefix,
+                    'timestamps': [self._iso(row[0]) for row in rows],
+                    'messages': [row[1] for row in rows],
+                    'bytes': [row[2] for row in rows]
+                }
+            except Exception as e:
+                print(f"Error getting topic traffic: {e}")
+                return {
+                    'prefix': prefix,
+                    'timestamps': [],
+                    'messages': [],
+                    'bytes': []
+                }
+
+    def add_anomalies(self, episodes: List[Dict]):
+        """Insert anomaly episodes, or update them when they end"""
+        def write(cursor):
+            cursor.executemany(
+                """INSERT INTO anomalies (metric, started_at, ended_at, kind, value, expected, peak_score, samples)
+                   VALUES (:metric, :started_at, :ended_at, :kind, :value, :expected, :peak_score, :samples)
+                   ON CONFLICT(metric, started_at) DO UPDATE SET
+                       ended_at = excluded.ended_at,
+                       value = excluded.value,
+                       expected = excluded.expected,
+                       peak_score = excluded.peak_score,
+                       samples = excluded.samples""",
+                episodes
+            )
+
+        try:
+            self._write(write)
+        except Exception as e:
+            print(f"Error adding anomalies: {e}")
+
+    def close_open_anomalies(self, ended_at: int = None):
+        """End episodes left open by a previous run"""
+        def write(cursor):
+            cursor.execute(
+                "UPDATE anomalies SET ended_at = ? WHERE ended_at IS NULL",
+                (ended_at or int(time.time()),)
+            )
+
+        try:
+            self._write(write)
+        except Exception as e:
+            print(f"Error closing open anomalies: {e}")
+
+    def get_anomalies(self, start: int, end: int, metric: str = None, limit: int = 500) -> List[Dict]:
+        """Get anomaly episodes overlapping an epoch range, newest first"""
+        with self._read_connection() as conn:
+            cursor = conn.cursor()
+            try:
+                cursor.execute("""
+                    SELECT metric, kind, started_at, ended_at, value, expected, peak_score, samples
+                    FROM anomalies
+                    WHERE started_at <= ? AND (ended_at IS NULL OR ended_at >= ?)
+                      AND (? IS NULL OR metric = ?)
+                    ORDER BY started_at DESC
+                    LIMIT ?
+                """, (end, start, metric, metric, limit))
+                columns = [description[0] for description in cursor.description]
+                return [dict(zip(columns, row)) for row in cursor.fetchall()]
+            except Exception as e:
+                print(f"Error getting anomalies: {e}")
+                return []
+
+    def get_alert_rules(self) -> List[Dict]:
+        """Get every alert rule with its last evaluated state"""
+        with self._read_connection() as conn:
+            cursor = conn.cursor()
+            try:
+                cursor.execute("""
+                    SELECT id, name, expression, for_seconds, hysteresis, webhook_url, state, state_since
+                    FROM alert_rules ORDER BY id
+                """)
+                columns = [description[0] for description in cursor.description]
+                return [dict(zip(columns, row)) for row in cursor.fetchall()]
+            except Exception as e:
+                print(f"Error getting alert rules: {e}")
+                return []
+
+    def add_alert_rule(self, name: str, expression: str, hysteresis: float,
+                       for_seconds: int = None, webhook_url: str = None) -> int:
+        """Store a new alert rule and return its id"""
+        def write(cursor):
+            cursor.execute(
+                """INSERT INTO alert_rules (name, expression, for_seconds, hysteresis, webhook_url)
+                   VALUES (?, ?, ?, ?, ?)""",
+                (name, expression, for_seconds, hysteresis, webhook_url)
+            )
+            return cursor.lastrowid
+
+        return self._write(write)
+
+    def delete_alert_rule(self, rule_id: int) -> bool:
+        def write(cursor):
+            cursor.execute("DELETE FROM alert_rules WHERE id = ?", (rule_id,))
+            return cursor.rowcount > 0
+
+        return self._write(write)
+
+    def add_alert_events(self, events: List[Dict]):
+        """Record alert transitions and the resulting state of their rules"""
+        def write(cursor):
+            cursor.executemany(
+                "INSERT INTO alert_events (rule_id, name, status, value, at) VALUES (:rule_id, :name, :status, :value, :at)",
+                events
+            )
+            cursor.executemany(
+                "UPDATE alert_rules SET state = ?, state_since = ? WHERE id = ?",
+                [("firing" if event["status"] == "firing" else "ok", event["at"], event["rule_id"])
+                 for event in events]
+            )
+
+        try:
+            self._write(write)
+        except Exception as e:
+            print(f"Error adding alert events: {e}")
+
+    def get_alert_events(self, start: int, end: int, limit: int = 500) -> List[Dict]:
+        """Get alert transitions in an epoch range, newest first"""
+        with self._read_connection() as conn:
+            cursor = conn.cursor()
+            try:
+                cursor.execute("""
+                    SELECT rule_id, name, status, value, at FROM alert_events
+                    WHERE at BETWEEN ? AND ?
+                    ORDER BY at DESC, id DESC
+                    LIMIT ?
+                """, (start, end, limit))
+                columns = [description[0] for description in cursor.description]
+                return [dict(zip(columns, row)) for row in cursor.fetchall()]
+            except Exception as e:
+                print(f"Error getting alert events: {e}")
+                return []
 
     def add_hourly_data(self, bytes_received: float, bytes_sent: float):
-        """Add hourly data point with automatic cleanup"""
-        with self.lock:
-            with self.get_connection() as conn:
-                cursor = conn.cursor()
-                try:
-                    current_time = datetime.now(timezone.utc).isoformat().replace('+00:00', 'Z')
-                    
-                    data_item = {
-                        'timestamp': current_time,
-                        'bytes_received': bytes_received,
-                        'bytes_sent': bytes_sent
-                    }
-                    
-                    cursor.execute(
-                        "INSERT INTO stats (data_type, json_data, timestamp) VALUES (?, ?, ?)",
-                        ("hourly", json.dumps(data_item), current_time)
-                    )
-                    
-                    # Clean data older than 24 hours
-                    cutoff_time = (datetime.now(timezone.utc) - timedelta(hours=24)).isoformat().replace('+00:00', 'Z')
-                    cursor.execute(
-                        "DELETE FROM stats WHERE data_type = 'hourly' AND timestamp < ?",
-                        (cutoff_time,)
-                    )
-                    
-                    conn.commit()
-                except Exception as e:
-                    conn.rollback()
-                    print(f"Error adding hourly data: {e}")
-                except Exception as e:
-                    conn.rollback()
-                    print(f"Error adding hourly data: {e}")
+        """Add a raw byte rate sample and fold it into the rollup tiers"""
+        def write(cursor):
+            timestamp = int(time.time())
+            cursor.execute(
+                "INSERT OR REPLACE INTO hourly_stats (timestamp, bytes_received, bytes_sent) VALUES (?, ?, ?)",
+                (timestamp, bytes_received, bytes_sent)
+            )
+            self._rollup(cursor, timestamp, {
+                'bytes_received': bytes_received,
+                'bytes_sent': bytes_sent
+            })
+        
+        try:
+            self._write(write)
+        except Exception as e:
+            print(f"Error adding hourly data: {e}")
     
     # Keep all remaining methods exactly the same
     def _parse_timestamp(self, timestamp_str: str) -> datetime:
@@ -305,130 +1283,164 @@ class HistoricalDataStorage:
         except:
             return datetime.fromisoformat(timestamp_str.replace('Z', '')).replace(tzinfo=timezone.utc)
     
+    @staticmethod
+    def _epoch_hours_ago(hours: float) -> int:
+        return int(time.time() - hours * 3600)
+
     def get_hourly_data(self):
-        """Get hourly byte rate data with better performance"""
-        with self.lock:
-            with self.get_connection() as conn:
-                cursor = conn.cursor()
-                try:
-                    # Get data from last 24 hours, ordered by timestamp
-                    cursor.execute("""
-                        SELECT json_data FROM stats 
-                        WHERE data_type = 'hourly' 
-                        AND timestamp >= datetime('now', '-24 hours')
-                        ORDER BY timestamp ASC
-                    """)
-                    
-                    hourly_data = []
-                    for row in cursor.fetchall():
-                        try:
-                            item = json.loads(row[0])
-                            hourly_data.append(item)
-                        except json.JSONDecodeError as e:
-                            print(f"Error parsing hourly data JSON: {e}")
-                    
-                    return {
-                        'timestamps': [entry['timestamp'] for entry in hourly_data],
-                        'bytes_received': [entry['bytes_received'] for entry in hourly_data],
-                        'bytes_sent': [entry['bytes_sent'] for entry in hourly_data]
-                    }
-                    
-                except Exception as e:
-                    print(f"Error getting hourly data: {e}")
-                    return {
-                        'timestamps': [],
-                        'bytes_received': [],
-                        'bytes_sent': []
-                    }
+        """Get hourly byte rate data for the last 24 hours"""
+        # Finer sampling than the default is averaged back to it to keep the payload size
+        step = self.RAW_RESOLUTION if self.raw_resolution < self.RAW_RESOLUTION else None
+        return self.get_hourly_range(self._epoch_hours_ago(24), int(time.time()), step=step)
+
+    def get_hourly_range(self, start: int, end: int, step: int = None):
+        """Get byte rate samples between two epoch timestamps as columns, averaged per `step` seconds if given"""
+        with self._read_connection() as conn:
+            try:
+                rows = self._raw_rows(conn, start, end, self.RAW_METRICS)
+                if step:
+                    averaged = []
+                    for bucket, group in groupby(rows, key=lambda row: row[0] // step):
+                        group = list(group)
+                        averaged.append((
+                            bucket * step,
+                            sum(row[1] for row in group) / len(group),
+                            sum(row[2] for row in group) / len(group)
+                        ))
+                    rows = averaged
+                
+                columns = list(zip(*rows)) or [(), (), ()]
+                return {
+                    'timestamps': [self._iso(timestamp) for timestamp in columns[0]],
+                    'bytes_received': list(columns[1]),
+                    'bytes_sent': list(columns[2])
+                }
+                
+            except Exception as e:
+                print(f"Error getting hourly data: {e}")
+                return {
+                    'timestamps': [],
+                    'bytes_received': [],
+                    'bytes_sent': []
+                }
 
     def get_daily_messages(self):
         """Get daily message counts for the last 7 days with better performance"""
-        with self.lock:
-            with self.get_connection() as conn:
-                cursor = conn.cursor()
-                try:
-                    # Try dedicated table first
-                    cursor.execute("""
-                        SELECT date, count FROM daily_message_counts 
-                        WHERE date >= date('now', '-7 days')
-                        ORDER BY date ASC
-                    """)
-                    
-                    rows = cursor.fetchall()
-                    if rows:
-                        return {
-                            'dates': [row[0] for row in rows],
-                            'counts': [row[1] for row in rows]
-                        }
-                    
-                    # Fallback to legacy format
-                    cursor.execute("SELECT json_data FROM stats WHERE data_type = 'daily_messages'")
-                    daily_data = []
-                    for row in cursor.fetchall():
-                        try:
-                            item = json.loads(row[0])
-                            daily_data.append(item)
-                        except json.JSONDecodeError as e:
-                            print(f"Error parsing daily messages JSON: {e}")
-                    
-                    if not daily_data:
-                        return {
-                            'dates': [],
-                            'counts': []
-                        }
-                    
-                    # Sort and limit to last 7 days
-                    daily_data = sorted(daily_data, key=lambda x: x['date'])[-7:]
-                    
+        with self._read_connection() as conn:
+            cursor = conn.cursor()
+            try:
+                # Try dedicated table first
+                cursor.execute("""
+                    SELECT date, count FROM daily_message_counts 
+                    WHERE date >= date('now', '-7 days')
+                    ORDER BY date ASC
+                """)
+                
+                rows = cursor.fetchall()
+                if rows:
                     return {
-                        'dates': [entry['date'] for entry in daily_data],
-                        'counts': [entry['count'] for entry in daily_data]
+                        'dates': [row[0] for row in rows],
+                        'counts': [row[1] for row in rows]
                     }
-                    
-                except Exception as e:
-                    print(f"Error getting daily messages: {e}")
+                
+                # Fallback to legacy format
+                cursor.execute("SELECT json_data FROM stats WHERE data_type = 'daily_messages'")
+                daily_data = []
+                for row in cursor.fetchall():
+                    try:
+                        item = json.loads(row[0])
+                        daily_data.append(item)
+                    except json.JSONDecodeError as e:
+                        print(f"Error parsing daily messages JSON: {e}")
+                
+                if not daily_data:
                     return {
                         'dates': [],
                         'counts': []
                     }
+                
+                # Sort and limit to last 7 days
+                daily_data = sorted(daily_data, key=lambda x: x['date'])[-7:]
+                
+                return {
+                    'dates': [entry['date'] for entry in daily_data],
+                    'counts': [entry['count'] for entry in daily_data]
+                }
+                
+            except Exception as e:
+                print(f"Error getting daily messages: {e}")
+                return {
+                    'dates': [],
+                    'counts': []
+                }
     
     def get_stats_summary(self):
         """Get a summary of stored data for monitoring"""
-        with self.lock:
-            with self.get_connection() as conn:
-                cursor = conn.cursor()
-                try:
-                    # Count hourly records
-                    cursor.execute("SELECT COUNT(*) FROM stats WHERE data_type = 'hourly'")
-                    hourly_count = cursor.fetchone()[0]
-                    
-                    # Count daily message records
-                    cursor.execute("SELECT COUNT(*) FROM daily_message_counts")
-                    daily_count = cursor.fetchone()[0]
-                    
-                    # Get latest timestamps
-                    cursor.execute("""
-                        SELECT MAX(timestamp) FROM stats WHERE data_type = 'hourly'
-                    """)
-                    latest_hourly = cursor.fetchone()[0]
-                    
-                    cursor.execute("SELECT MAX(updated_at) FROM daily_message_counts")
-                    latest_daily = cursor.fetchone()[0]
-                    
-                    return {
-                        'hourly_records': hourly_count,
-                        'daily_records': daily_count,
-                        'latest_hourly_data': latest_hourly,
-                        'latest_daily_data': latest_daily,
-                        'database_size_mb': os.path.getsize(self.db_path) / (1024 * 1024) if os.path.exists(self.db_path) else 0
-                    }
-                    
-                except Exception as e:
-                    print(f"Error getting stats summary: {e}")
-                    return {
-                        'hourly_records': 0,
-                        'daily_records': 0,
-                        'latest_hourly_data': None,
-                        'latest_daily_data': None,
-                        'database_size_mb': 0
-                    }
\ No newline at end of file
+        with self._read_connection() as conn:
+            cursor = conn.cursor()
+            try:
+                # Count hourly records
+                cursor.execute("SELECT COUNT(*) FROM hourly_stats")
+                hourly_count = cursor.fetchone()[0]
+                cursor.execute("SELECT COUNT(*), COALESCE(SUM(samples), 0) FROM raw_chunks")
+                chunk_count, compressed_count = cursor.fetchone()
+                
+                # Count daily message records
+                cursor.execute("SELECT COUNT(*) FROM daily_message_counts")
+                daily_count = cursor.fetchone()[0]
+                
+                # Get latest timestamps
+                cursor.execute("SELECT MAX(timestamp) FROM hourly_stats")
+                latest = cursor.fetchone()[0]
+                if latest is None:
+                    cursor.execute("SELECT MAX(chunk_end) FROM raw_chunks")
+                    latest = cursor.fetchone()[0]
+                latest_hourly = self._iso(latest) if latest is not None else None
+                
+                cursor.execute("SELECT MAX(updated_at) FROM daily_message_counts")
+                latest_daily = cursor.fetchone()[0]
+                
+                return {
+                    'hourly_records': hourly_count + compressed_count,
+                    'compressed_hourly_records': compressed_count,
+                    'compressed_chunks': chunk_count,
+                    'daily_records': daily_count,
+                    'latest_hourly_data': latest_hourly,
+                    'latest_daily_data': latest_daily,
+                    'database_size_mb': os.path.getsize(self.db_path) / (1024 * 1024) if os.path.exists(self.db_path) else 0
+                }
+                
+            except Exception as e:
+                print(f"Error getting stats summary: {e}")
+                return {
+                    'hourly_records': 0,
+                    'compressed_hourly_records': 0,
+                    'compressed_chunks': 0,
+                    'daily_records': 0,
+                    'latest_hourly_data': None,
+                    'latest_daily_data': None,
+                    'database_size_mb': 0
+                }
+
+
+class AsyncHistoricalDataStorage:
+    """Awaitable facade over HistoricalDataStorage for the FastAPI event loop.
+
+    Every public storage method is exposed as a coroutine that runs the
+    blocking call on a worker thread, e.g. `await storage.aio.get_hourly_data()`.
+    """
+
+    def __init__(self, storage: HistoricalDataStorage):
+        self._storage = storage
+
+    def __getattr__(self, name):
+        method = getattr(self._storage, name)
+        if name.startswith('_') or not callable(method):
+            raise AttributeError(name)
+
+        async def call(*args, **kwargs):
+            return await asyncio.to_thread(method, *args, **kwargs)
+
+        call.__name__ = name
+        call.__doc__ = method.__doc__
+        return call
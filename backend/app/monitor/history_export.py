@@ -0,0 +1,61 @@
+# Copyright (c) 2025 BunkerM
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# You may not use this file except in compliance with the License.
+# http://www.apache.org/licenses/LICENSE-2.0
+# Distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND.
+#
+# history_export.py
+import csv
+import io
+import json
+from itertools import islice
+from typing import Iterable, Iterator, Tuple
+
+COLUMNS = ("timestamp", "metric", "min", "max", "avg", "sum", "samples")
+
+EXPORT_FORMATS = {
+    "csv": "text/csv; charset=utf-8",
+    "ndjson": "application/x-ndjson",
+}
+
+# Rows encoded per chunk handed to the HTTP response
+_ROWS_PER_CHUNK = 500
+
+
+def _chunks(rows: Iterable[Tuple]) -> Iterator[list]:
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, _ROWS_PER_CHUNK))
+        if not chunk:
+            return
+        yield chunk
+
+
+def csv_chunks(metric: str, rows: Iterable[Tuple]) -> Iterator[bytes]:
+    """Encode (timestamp, min, max, avg, sum, samples) rows as CSV with a header line"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    writer.writerow(COLUMNS)
+    for chunk in _chunks(rows):
+        writer.writerows((timestamp, metric, *values) for timestamp, *values in chunk)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()  # header only: the range was empty
+
+
+def ndjson_chunks(metric: str, rows: Iterable[Tuple]) -> Iterator[bytes]:
+    """Encode (timestamp, min, max, avg, sum, samples) rows as one JSON object per line"""
+    for chunk in _chunks(rows):
+        yield "".join(
+            json.dumps(dict(zip(COLUMNS, (timestamp, metric, *values))), separators=(',', ':')) + "\n"
+            for timestamp, *values in chunk
+        ).encode()
+
+
+def encode_rows(export_format: str, metric: str, rows: Iterable[Tuple]) -> Iterator[bytes]:
+    if export_format == "csv":
+        return csv_chunks(metric, rows)
+    return ndjson_chunks(metric, rows)
@@ -0,0 +1,197 @@
+# Copyright (c) 2025 BunkerM
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# You may not use this file except in compliance with the License.
+# http://www.apache.org/licenses/LICENSE-2.0
+# Distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND.
+#
+# instrumentation.py
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, Optional, Tuple
+
+# Bucket i counts durations of less than 2**i microseconds; the last bucket is open-ended
+_BUCKETS = 26  # up to ~33.5 s
+
+
+class LatencyHistogram:
+    """Durations in power-of-two microsecond buckets.
+
+    Recording is a bit_length() and two additions under an uncontended
+    lock, so it can sit on per-message paths. Percentiles are reported as
+    the upper bound of the bucket they fall in.
+    """
+
+    __slots__ = ("counts", "count", "total_ns", "max_ns", "_lock")
+
+    def __init__(self):
+        self.counts = [0] * _BUCKETS
+        self.count = 0
+        self.total_ns = 0
+        self.max_ns = 0
+        self._lock = threading.Lock()
+
+    def record(self, duration_ns: int):
+        index = min((duration_ns // 1000).bit_length(), _BUCKETS - 1)
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.total_ns += duration_ns
+            if duration_ns > self.max_ns:
+                self.max_ns = duration_ns
+
+    def time(self) -> "_Timer":
+        """Context manager recording the duration of its block"""
+        return _Timer(self)
+
+    def _percentile_ms(self, counts, count: int, fraction: float) -> Optional[float]:
+        if not count:
+            return None
+        rank = fraction * count
+        seen = 0
+        for index, bucket in enumerate(counts):
+            seen += bucket
+            if seen >= rank:
+                return round(min(2 ** index / 1000, self.max_ns / 1e6), 4)
+        return round(self.max_ns / 1e6, 4)
+
+    def summary(self) -> Dict:
+        with self._lock:
+            counts, count, total_ns, max_ns = list(self.counts), self.count, self.total_ns, self.max_ns
+        return {
+            "count": count,
+            "mean_ms": round(total_ns / count / 1e6, 4) if count else None,
+            "p50_ms": self._percentile_ms(counts, count, 0.5),
+            "p90_ms": self._percentile_ms(counts, count, 0.9),
+            "p99_ms": self._percentile_ms(counts, count, 0.99),
+            "max_ms": round(max_ns / 1e6, 4) if count else None,
+            # Non-empty buckets as {upper bound in ms: count}
+            "buckets": {str(2 ** index / 1000): bucket for index, bucket in enumerate(counts) if bucket},
+        }
+
+
+class _Timer:
+    __slots__ = ("histogram", "started")
+
+    def __init__(self, histogram: LatencyHistogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.started = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.record(time.perf_counter_ns() - self.started)
+        return False
+
+
+class TimedLock:
+    """A threading.Lock that records how long contended acquisitions waited.
+
+    Uncontended acquisitions take the lock without touching the clock.
+    """
+
+    __slots__ = ("_lock", "waits", "acquisitions", "contended")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.waits = LatencyHistogram()
+        self.acquisitions = 0
+        self.contended = 0
+
+    def acquire(self, blocking: bool = True, timeout: float = -1) -> bool:
+        if self._lock.acquire(False):
+            self.acquisitions += 1
+            return True
+        if not blocking:
+            return False
+        started = time.perf_counter_ns()
+        acquired = self._lock.acquire(True, timeout)
+        if acquired:
+            self.acquisitions += 1
+            self.contended += 1
+            self.waits.record(time.perf_counter_ns() - started)
+        return acquired
+
+    def release(self):
+        self._lock.release()
+
+    def locked(self) -> bool:
+        return self._lock.locked()
+
+    __enter__ = acquire
+
+    def __exit__(self, *exc):
+        self._lock.release()
+        return False
+
+    def summary(self) -> Dict:
+        # Counters are only updated while the lock is held
+        return {
+            "acquisitions": self.acquisitions,
+            "contended": self.contended,
+            "wait": self.waits.summary(),
+        }
+
+
+class IngestCompleteness:
+    """Share of the broker's received publishes that the monitor saw on `#`.
+
+    Compares the monitor's count of non-$SYS messages with the broker's
+    `$SYS/broker/publish/messages/received` counter, both counted from the
+    first $SYS value seen (and again after a broker restart resets it). The
+    broker publishes the counter every `sys_interval`, so the recent ratio
+    is taken over `window` seconds of observations rather than per tick.
+    """
+
+    def __init__(self, window: int = 300):
+        self.window = window
+        self.baseline: Optional[Tuple[float, int, int]] = None  # (time, broker, monitor)
+        self.last_broker: Optional[int] = None
+        self.history: Deque[Tuple[float, int, int]] = deque()
+        self._lock = threading.Lock()
+
+    def observe(self, broker_received: Optional[float], monitor_seen: int, now: Optional[float] = None):
+        if broker_received is None:
+            return
+        now = time.time() if now is None else now
+        broker_received = int(broker_received)
+        with self._lock:
+            if self.last_broker is not None and broker_received < self.last_broker:
+                self.baseline = None  # broker restarted
+                self.history.clear()
+            self.last_broker = broker_received
+            sample = (now, broker_received, monitor_seen)
+            if self.baseline is None:
+                self.baseline = sample
+            self.history.append(sample)
+            while len(self.history) > 1 and self.history[1][0] <= now - self.window:
+                self.history.popleft()
+
+    @staticmethod
+    def _ratio(first: Tuple[float, int, int], last: Tuple[float, int, int]) -> Optional[float]:
+        broker = last[1] - first[1]
+        if broker <= 0:
+            return None
+        return round((last[2] - first[2]) / broker, 4)
+
+    def summary(self) -> Dict:
+        with self._lock:
+            if self.baseline is None:
+                return {"since": None, "broker_received": 0, "monitor_seen": 0, "ratio": None, "window_ratio": None}
+            last = self.history[-1]
+            return {
+                "since": self.baseline[0],
+                "broker_received": last[1] - self.baseline[1],
+                "monitor_seen": last[2] - self.baseline[2],
+                "ratio": self._ratio(self.baseline, last),
+                "window_seconds": self.window,
+                "window_ratio": self._ratio(self.history[0], last),
+            }
+
+    def ratio(self) -> Optional[float]:
+        with self._lock:
+            if self.baseline is None:
+                return None
+            return self._ratio(self.baseline, self.history[-1])
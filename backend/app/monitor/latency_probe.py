@@ -0,0 +1,175 @@
+# Copyright (c) 2025 BunkerM
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# You may not use this file except in compliance with the License.
+# http://www.apache.org/licenses/LICENSE-2.0
+# Distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND.
+#
+# latency_probe.py
+import logging
+import math
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+from typing import Deque, Dict, List, Optional, Tuple
+
+from paho.mqtt import client as mqtt_client
+
+logger = logging.getLogger(__name__)
+
+PROBES = ("connect", "subscribe", "qos0_rtt", "qos1_rtt")
+
+
+class ProbeFailed(Exception):
+    pass
+
+
+def percentile(sorted_values: List[float], quantile: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    rank = max(1, math.ceil(quantile * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+class LatencyProbe:
+    """Synthetic client that measures broker latency end to end.
+
+    Each run opens a fresh connection and times CONNECT→CONNACK and
+    SUBSCRIBE→SUBACK, then `round_trips` QoS 0 and QoS 1 publishes to a
+    private canary topic until they are delivered back. Results are kept
+    for `window` seconds to report percentiles; a step that times out is
+    counted as a failure and aborts the rest of the run.
+    """
+
+    def __init__(self, host: str, port: int, username: Optional[str], password: Optional[str],
+                 topic: str = "bunkerm/probe", round_trips: int = 5, timeout: float = 5.0,
+                 window: int = 900, max_samples: int = 2000):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.topic = topic.rstrip('/')
+        self.round_trips = round_trips
+        self.timeout = timeout
+        self.window = window
+        self.samples: Dict[str, Deque[Tuple[float, float]]] = {
+            name: deque(maxlen=max_samples) for name in PROBES
+        }
+        self.failures: Dict[str, int] = {name: 0 for name in PROBES}
+        self.last_run: Optional[Dict] = None
+        self._lock = threading.Lock()
+
+    def is_probe_topic(self, topic: str) -> bool:
+        return topic.startswith(self.topic + '/')
+
+    def _record(self, name: str, started: float) -> float:
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with self._lock:
+            self.samples[name].append((time.monotonic(), elapsed_ms))
+        return elapsed_ms
+
+    def _fail(self, name: str, reason: str):
+        with self._lock:
+            self.failures[name] += 1
+        raise ProbeFailed(f"{name} probe failed: {reason}")
+
+    def run_once(self) -> Dict[str, float]:
+        """Run every probe once; returns window percentiles as rollup metric samples"""
+        client_id = f"bunkerm-probe-{os.urandom(4).hex()}"
+        topic = f"{self.topic}/{client_id}"
+        connected = threading.Event()
+        subscribed = threading.Event()
+        delivered = threading.Event()
+        state = {"expected": None, "connect_rc": None, "subscribe_failed": False}
+
+        def on_connect(client, userdata, flags, reason_code, properties=None):
+            state["connect_rc"] = reason_code
+            connected.set()
+
+        def on_subscribe(client, userdata, mid, reason_codes, properties=None):
+            state["subscribe_failed"] = any(code.is_failure for code in reason_codes)
+            subscribed.set()
+
+        def on_message(client, userdata, msg):
+            # Late deliveries from a timed-out round trip carry an older payload
+            if msg.payload == state["expected"]:
+                delivered.set()
+
+        client = mqtt_client.Client(mqtt_client.CallbackAPIVersion.VERSION2, client_id=client_id)
+        if self.username:
+            client.username_pw_set(self.username, self.password)
+        client.on_connect = on_connect
+        client.on_subscribe = on_subscribe
+        client.on_message = on_message
+
+        run = {"started_at": datetime.now(timezone.utc).isoformat().replace('+00:00', 'Z'), "error": None}
+        try:
+            started = time.perf_counter()
+            try:
+                client.connect(self.host, self.port, keepalive=30)
+            except OSError as e:
+                self._fail("connect", str(e))
+            client.loop_start()
+            if not connected.wait(self.timeout):
+                self._fail("connect", "no CONNACK")
+            if state["connect_rc"].is_failure:
+                self._fail("connect", f"CONNACK {state['connect_rc']}")
+            run["connect"] = round(self._record("connect", started), 3)
+
+            started = time.perf_counter()
+            client.subscribe(topic, qos=1)
+            if not subscribed.wait(self.timeout) or state["subscribe_failed"]:
+                self._fail("subscribe", "no SUBACK")
+            run["subscribe"] = round(self._record("subscribe", started), 3)
+
+            for name, qos in (("qos0_rtt", 0), ("qos1_rtt", 1)):
+                rtts = []
+                for seq in range(self.round_trips):
+                    payload = f"{client_id}:{name}:{seq}".encode()
+                    state["expected"] = payload
+                    delivered.clear()
+                    started = time.perf_counter()
+                    client.publish(topic, payload, qos=qos)
+                    if not delivered.wait(self.timeout):
+                        self._fail(name, f"message {seq} not delivered")
+                    rtts.append(self._record(name, started))
+                run[name] = round(sorted(rtts)[len(rtts) // 2], 3)
+        except ProbeFailed as e:
+            run["error"] = str(e)
+            logger.warning(f"Latency probe failed: {e}")
+        finally:
+            try:
+                client.disconnect()
+            finally:
+                client.loop_stop()
+
+        with self._lock:
+            self.last_run = run
+        return self._window_samples(bool(run["error"]))
+
+    def _window_samples(self, failed: bool) -> Dict[str, float]:
+        samples = {"probe_failures": float(failed)}
+        for name, summary in self.summary()["probes"].items():
+            if summary["count"]:
+                samples[f"probe_{name}_p50_ms"] = summary["p50_ms"]
+                samples[f"probe_{name}_p99_ms"] = summary["p99_ms"]
+        return samples
+
+    def summary(self) -> Dict:
+        """Latency percentiles over the sliding window, in milliseconds"""
+        cutoff = time.monotonic() - self.window
+        probes = {}
+        with self._lock:
+            for name, samples in self.samples.items():
+                values = sorted(ms for ts, ms in samples if ts >= cutoff)
+                probes[name] = {
+                    "count": len(values),
+                    "failures": self.failures[name],
+                    "p50_ms": round(percentile(values, 0.5), 3) if values else None,
+                    "p90_ms": round(percentile(values, 0.9), 3) if values else None,
+                    "p99_ms": round(percentile(values, 0.99), 3) if values else None,
+                    "max_ms": round(values[-1], 3) if values else None,
+                }
+            last_run = self.last_run
+        return {"window_seconds": self.window, "probes": probes, "last_run": last_run}
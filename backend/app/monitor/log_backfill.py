@@ -0,0 +1,301 @@
+# Copyright (c) 2025 BunkerM
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# You may not use this file except in compliance with the License.
+# http://www.apache.org/licenses/LICENSE-2.0
+# Distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND.
+#
+# log_backfill.py
+"""Rebuild message and connection history from archived Mosquitto logs.
+
+Reads `mosquitto.log*` files written with `log_timestamp true` (each line
+starts with `<epoch seconds>: `) and `log_type all`, plain or gzipped, and
+writes per-day message counts to `daily_message_counts` and per-hour
+connects, disconnects and distinct clients to `connection_history`.
+
+Plain files are binary-searched to the requested range by their timestamp
+prefix and split into byte ranges; gzipped files are streamed whole. Every
+range is scanned by a separate worker process. Blocks of lines that fall
+within one hour are counted with `bytes.count()` and a regex over the whole
+block, so per-line Python work is only done around hour boundaries.
+
+It can run against a live monitor's database. The monitor re-reads the
+daily counts every MESSAGE_COUNT_RELOAD_INTERVAL seconds (default 300), so
+rebuilt days show up in /api/v1/stats within that interval.
+
+Run from backend/app/monitor:
+
+    python log_backfill.py /var/log/mosquitto --from 2025-01-01 --to 2025-02-01
+"""
+import argparse
+import glob
+import gzip
+import json
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timezone
+from typing import BinaryIO, Dict, List, NamedTuple, Optional
+
+from data_storage import HistoricalDataStorage
+
+_PUBLISH = b" Received PUBLISH from "
+_CONNECT = re.compile(rb"New client connected from \S+ as (\S+) ")
+_DISCONNECT = re.compile(rb"Client \S+ (?:disconnected|closed its connection|has exceeded timeout)")
+_BLOCK_SIZE = 1 << 20
+
+
+class ScanTask(NamedTuple):
+    path: str
+    start_offset: Optional[int]  # None for gzipped files, which are read whole
+    end_offset: Optional[int]
+
+
+def line_timestamp(line: bytes) -> Optional[int]:
+    colon = line.find(b":", 0, 24)
+    if colon <= 0 or not line[:colon].isdigit():
+        return None
+    return int(line[:colon])
+
+
+def _is_gzip(path: str) -> bool:
+    with open(path, "rb") as f:
+        return f.read(2) == b"\x1f\x8b"
+
+
+def _next_timestamp(f: BinaryIO, max_lines: int = 16) -> Optional[int]:
+    for _ in range(max_lines):
+        line = f.readline()
+        if not line:
+            return None
+        timestamp = line_timestamp(line)
+        if timestamp is not None:
+            return timestamp
+    return None
+
+
+def find_offset(f: BinaryIO, size: int, target: int) -> int:
+    """Offset of the first line whose timestamp is >= target (size if there is none)"""
+    def line_start(position: int) -> int:
+        if position == 0:
+            return 0
+        f.seek(position - 1)
+        f.readline()
+        return f.tell()
+
+    low, high = 0, size
+    while low < high:
+        middle = (low + high) // 2
+        f.seek(line_start(middle))
+        timestamp = _next_timestamp(f)
+        if timestamp is None or timestamp >= target:
+            high = middle
+        else:
+            low = middle + 1
+    return line_start(low)
+
+
+def plan_tasks(paths: List[str], start: int, end: int, chunk_bytes: int) -> List[ScanTask]:
+    """Split the files into ranges that can be scanned independently"""
+    tasks = []
+    for path in paths:
+        if _is_gzip(path):
+            tasks.append(ScanTask(path, None, None))
+            continue
+        size = os.path.getsize(path)
+        with open(path, "rb") as f:
+            first = find_offset(f, size, start)
+            last = find_offset(f, size, end)
+            offset = first
+            while offset < last:
+                cut = min(offset + chunk_bytes, last)
+                if cut < last:
+                    f.seek(cut)
+                    f.readline()
+                    cut = min(f.tell(), last)
+                tasks.append(ScanTask(path, offset, cut))
+                offset = cut
+    return tasks
+
+
+def _new_hour() -> list:
+    return [0, 0, 0, set()]  # publishes, connects, disconnects, client ids
+
+
+def _scan_block(block: bytes, start: int, end: int, hours: Dict[int, list]):
+    """Count one block of whole lines into `hours`"""
+    first = line_timestamp(block)
+    last_line = block.rfind(b"\n", 0, len(block) - 1) + 1
+    last = line_timestamp(block[last_line:])
+    if first is not None and last is not None:
+        if last < start or first >= end:
+            return
+        if first >= start and last < end and first // 3600 == last // 3600:
+            hour = hours.setdefault(first - first % 3600, _new_hour())
+            hour[0] += block.count(_PUBLISH)
+            clients = _CONNECT.findall(block)
+            hour[1] += len(clients)
+            hour[2] += len(_DISCONNECT.findall(block))
+            hour[3].update(clients)
+            return
+
+    # The block spans an hour or range boundary: attribute line by line
+    timestamp = first
+    for line in block.splitlines():
+        timestamp = line_timestamp(line) or timestamp
+        if timestamp is None or not start <= timestamp < end:
+            continue
+        if _PUBLISH in line:
+            hours.setdefault(timestamp - timestamp % 3600, _new_hour())[0] += 1
+            continue
+        match = _CONNECT.search(line)
+        if match:
+            hour = hours.setdefault(timestamp - timestamp % 3600, _new_hour())
+            hour[1] += 1
+            hour[3].add(match.group(1))
+        elif _DISCONNECT.search(line):
+            hours.setdefault(timestamp - timestamp % 3600, _new_hour())[2] += 1
+
+
+def scan(task: ScanTask, start: int, end: int) -> Dict[int, list]:
+    """Worker: per-hour counts of one file range"""
+    hours: Dict[int, list] = {}
+    if task.start_offset is None:
+        with gzip.open(task.path, "rb") as f:
+            carry = b""
+            while True:
+                data = f.read(_BLOCK_SIZE)
+                if not data:
+                    break
+                data = carry + data
+                cut = data.rfind(b"\n") + 1
+                if not cut:
+                    carry = data
+                    continue
+                block, carry = data[:cut], data[cut:]
+                # Logs are chronological: stop once a block starts past the range
+                first = line_timestamp(block)
+                if first is not None and first >= end:
+                    return hours
+                _scan_block(block, start, end, hours)
+            if carry:
+                _scan_block(carry + b"\n", start, end, hours)
+        return hours
+
+    with open(task.path, "rb") as f:
+        f.seek(task.start_offset)
+        remaining = task.end_offset - task.start_offset
+        carry = b""
+        while remaining > 0:
+            data = f.read(min(_BLOCK_SIZE, remaining))
+            if not data:
+                break
+            remaining -= len(data)
+            data = carry + data
+            cut = data.rfind(b"\n") + 1 if remaining > 0 else len(data)
+            block, carry = data[:cut], data[cut:]
+            if block:
+                _scan_block(block, start, end, hours)
+    return hours
+
+
+def find_log_files(paths: List[str]) -> List[str]:
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files += glob.glob(os.path.join(path, "mosquitto.log*"))
+        else:
+            files.append(path)
+    return sorted(set(files))
+
+
+def backfill(paths: List[str], start: int, end: int, workers: int = None,
+             chunk_bytes: int = 64 << 20) -> Dict[int, list]:
+    """Scan log files in parallel and return merged per-hour counts"""
+    tasks = plan_tasks(find_log_files(paths), start, end, chunk_bytes)
+    merged: Dict[int, list] = {}
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        futures = [pool.submit(scan, task, start, end) for task in tasks]
+        for future in as_completed(futures):
+            for hour, (publishes, connects, disconnects, clients) in future.result().items():
+                total = merged.setdefault(hour, _new_hour())
+                total[0] += publishes
+                total[1] += connects
+                total[2] += disconnects
+                total[3] |= clients
+    return merged
+
+
+def daily_counts(hours: Dict[int, list]) -> Dict[str, int]:
+    days: Dict[str, int] = {}
+    for hour, counts in hours.items():
+        day = datetime.fromtimestamp(hour, timezone.utc).strftime('%Y-%m-%d')
+        days[day] = days.get(day, 0) + counts[0]
+    return days
+
+
+def parse_time(value: str) -> int:
+    """Epoch seconds, or an ISO date/datetime taken as UTC unless it has an offset"""
+    if value.isdigit():
+        return int(value)
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return int(parsed.timestamp())
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Rebuild monitor history from archived Mosquitto logs",
+        epilog="A running monitor picks up rebuilt daily counts within MESSAGE_COUNT_RELOAD_INTERVAL "
+               "seconds (default 300)."
+    )
+    parser.add_argument("paths", nargs="*", default=["/var/log/mosquitto"],
+                        help="log files, or directories searched for mosquitto.log*")
+    parser.add_argument("--db", default="/app/monitor/data/historical_data.db")
+    parser.add_argument("--from", dest="start", default="0", help="epoch seconds or ISO date (UTC)")
+    parser.add_argument("--to", dest="end", default=None, help="epoch seconds or ISO date (UTC), exclusive")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument("--chunk-mb", type=int, default=64, help="size of the ranges plain files are split into")
+    parser.add_argument("--replace", action="store_true",
+                        help="overwrite daily counts instead of keeping the larger of stored and backfilled")
+    parser.add_argument("--dry-run", action="store_true", help="scan and report without writing")
+    args = parser.parse_args()
+
+    start = parse_time(args.start)
+    end = parse_time(args.end) if args.end else int(time.time())
+    if start >= end:
+        parser.error("--from must be before --to")
+
+    started = time.monotonic()
+    hours = backfill(args.paths, start, end, workers=args.workers, chunk_bytes=args.chunk_mb << 20)
+    days = daily_counts(hours)
+    rows = [
+        (hour, connects, disconnects, len(clients))
+        for hour, (_, connects, disconnects, clients) in sorted(hours.items())
+    ]
+    if not args.dry_run:
+        storage = HistoricalDataStorage(db_path=args.db)
+        try:
+            storage.backfill_daily_message_counts(days, replace=args.replace)
+            storage.add_connection_history(rows)
+        finally:
+            storage.close()
+
+    json.dump({
+        "files": len(find_log_files(args.paths)),
+        "hours": len(hours),
+        "days": dict(sorted(days.items())),
+        "messages": sum(days.values()),
+        "connects": sum(row[1] for row in rows),
+        "disconnects": sum(row[2] for row in rows),
+        "seconds": round(time.monotonic() - started, 3),
+        "written": not args.dry_run,
+    }, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == "__main__":
+    main()
@@ -5,30 +5,51 @@
 # http://www.apache.org/licenses/LICENSE-2.0
 # Distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND.
 
-from fastapi import FastAPI, Depends, HTTPException, Request, BackgroundTasks
+from fastapi import FastAPI, Depends, HTTPException, Query, Request, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import Response, StreamingResponse
 from slowapi import Limiter, _rate_limit_exceeded_handler
 from slowapi.util import get_remote_address
 from slowapi.errors import RateLimitExceeded
+from pydantic import BaseModel
 from paho.mqtt import client as mqtt_client
 import threading
 import asyncio
-from typing import Dict, List, Optional
+import functools
+from typing import Dict, List, NamedTuple, Optional
 from collections import deque
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 import json
 import os
+import re
+import secrets
+import time
 import logging
 from logging.handlers import RotatingFileHandler
-from data_storage import HistoricalDataStorage
+from data_storage import HistoricalDataStorage, StorageWriter
+from topic_stats import TopTopicsTracker
+from topic_tree import TopicTree
+from stats_stream import StatsBroadcaster
+from sys_metrics import SysMetricRegistry
+from payload_stats import PayloadSizeStats
+from latency_probe import LatencyProbe
+from mqtt_ingest import AsyncioMQTTIngest, MessageBatch
+from scheduler import TaskScheduler
+from topic_sampling import TopicSampler
+from prometheus_metrics import MetricSample, PrometheusExporter, metric_name
+from brokers import BrokerTarget, parse_broker_targets
+from history_export import EXPORT_FORMATS, encode_rows
+from anomaly_detection import AnomalyMonitor
+from alert_rules import AlertEngine, AlertRule, WebhookNotifier, parse_rule_expression
+from instrumentation import IngestCompleteness, LatencyHistogram, TimedLock
 import socket
 import uvicorn
 from contextlib import asynccontextmanager
 import firebase_admin
 from firebase_admin import credentials, auth
+from firebase_auth import get_verifier, verify_id_token
 
 # Environment variable loading
 try:
@@ -66,6 +87,12 @@ MOSQUITTO_ADMIN_PASSWORD = os.getenv("MOSQUITTO_ADMIN_PASSWORD")
 MOSQUITTO_IP = os.getenv("MOSQUITTO_IP", "127.0.0.1")
 MOSQUITTO_PORT = int(os.getenv("MOSQUITTO_PORT", "1900"))
 
+# Brokers to monitor as "name=[user[:password]@]host[:port],..."; when unset only
+# MOSQUITTO_IP:MOSQUITTO_PORT is monitored, as broker "default"
+MONITOR_BROKERS = os.getenv("MONITOR_BROKERS", "")
+# Directory of the history databases
+MONITOR_DATA_DIR = os.getenv("MONITOR_DATA_DIR", "/app/monitor/data")
+
 # Security settings
 security = HTTPBearer()
 ALLOWED_HOSTS = os.getenv("ALLOWED_HOSTS", "localhost").split(",")
@@ -80,94 +107,361 @@ MONITORED_TOPICS = {
     "$SYS/broker/load/bytes/sent/15min": "bytes_sent_15min"
 }
 
+# "thread" runs paho's network loop in its own thread; "asyncio" runs it on the
+# uvicorn event loop and applies user messages in batches
+MQTT_INGEST_MODE = os.getenv("MQTT_INGEST_MODE", "thread").lower()
+MQTT_INGEST_BATCH_INTERVAL = float(os.getenv("MQTT_INGEST_BATCH_INTERVAL", "0.1"))
+
+# Sampled ingestion: "off" subscribes to "#"; "hashed" or "rotating" subscribe to a
+# fraction of topic prefixes and take message totals from $SYS instead
+MQTT_SAMPLING_MODE = os.getenv("MQTT_SAMPLING_MODE", "off").lower()
+MQTT_SAMPLING_FRACTION = float(os.getenv("MQTT_SAMPLING_FRACTION", "0.1"))
+MQTT_SAMPLING_DEPTH = int(os.getenv("MQTT_SAMPLING_DEPTH", "1"))
+MQTT_SAMPLING_PERIOD = int(os.getenv("MQTT_SAMPLING_PERIOD", "300"))
+MQTT_SAMPLING_DISCOVERY_INTERVAL = int(os.getenv("MQTT_SAMPLING_DISCOVERY_INTERVAL", "3600"))
+MQTT_SAMPLING_DISCOVERY_SECONDS = int(os.getenv("MQTT_SAMPLING_DISCOVERY_SECONDS", "30"))
+SYS_PUBLISH_RECEIVED_TOPIC = "$SYS/broker/publish/messages/received"
+
+# Seconds between byte rate history samples; sub-minute values give finer raw history
+STATS_SAMPLE_INTERVAL = int(os.getenv("STATS_SAMPLE_INTERVAL", "180"))
+# Largest random delay added to storage jobs, as a fraction of their interval
+TASK_JITTER_FRACTION = float(os.getenv("TASK_JITTER_FRACTION", "0.02"))
+
+# Seconds between write-behind flushes of the user message counter
+MESSAGE_FLUSH_INTERVAL = int(os.getenv("MESSAGE_FLUSH_INTERVAL", "10"))
+# Seconds between re-reads of the persisted daily counts, which picks up days
+# rewritten by log_backfill.py while the monitor runs
+MESSAGE_COUNT_RELOAD_INTERVAL = int(os.getenv("MESSAGE_COUNT_RELOAD_INTERVAL", "300"))
+
+# Number of topics each heavy-hitter summary keeps per time bucket
+TOP_TOPICS_CAPACITY = int(os.getenv("TOP_TOPICS_CAPACITY", "100"))
+
+# Topic tree aggregation: node cap, snapshot cadence and persisted depth/retention
+TOPIC_TREE_MAX_NODES = int(os.getenv("TOPIC_TREE_MAX_NODES", "200000"))
+TOPIC_SNAPSHOT_INTERVAL = int(os.getenv("TOPIC_SNAPSHOT_INTERVAL", "300"))
+TOPIC_HISTORY_DEPTH = int(os.getenv("TOPIC_HISTORY_DEPTH", "3"))
+TOPIC_HISTORY_DAYS = int(os.getenv("TOPIC_HISTORY_DAYS", "30"))
+
+# Seconds between checks for a new /api/v1/stats snapshot
+STATS_SNAPSHOT_INTERVAL = float(os.getenv("STATS_SNAPSHOT_INTERVAL", "1"))
+
+# Live stats stream: per-subscriber queue bound and subscriber cap
+STATS_STREAM_QUEUE_SIZE = int(os.getenv("STATS_STREAM_QUEUE_SIZE", "16"))
+STATS_STREAM_MAX_SUBSCRIBERS = int(os.getenv("STATS_STREAM_MAX_SUBSCRIBERS", "100"))
+
+# Upper bound on distinct $SYS topics kept in the metric registry
+SYS_METRICS_MAX = int(os.getenv("SYS_METRICS_MAX", "500"))
+
+# Topic prefixes with their own payload size histogram, e.g. "sensors,factory/line1"
+PAYLOAD_SIZE_PREFIXES = [p for p in os.getenv("PAYLOAD_SIZE_PREFIXES", "").split(",") if p.strip()]
+# Seconds between payload size summaries written to the history rollups
+PAYLOAD_SIZE_INTERVAL = int(os.getenv("PAYLOAD_SIZE_INTERVAL", "60"))
+
+# Synthetic latency probes; an interval of 0 disables them
+LATENCY_PROBE_INTERVAL = int(os.getenv("LATENCY_PROBE_INTERVAL", "30"))
+LATENCY_PROBE_TOPIC = os.getenv("LATENCY_PROBE_TOPIC", "bunkerm/probe")
+LATENCY_PROBE_ROUND_TRIPS = int(os.getenv("LATENCY_PROBE_ROUND_TRIPS", "5"))
+LATENCY_PROBE_WINDOW = int(os.getenv("LATENCY_PROBE_WINDOW", "900"))
+
+# Bearer token required by /metrics; the endpoint is open when unset
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+# Anomaly detection: seconds between samples fed to the detectors, and how many
+# standard deviations from the recent (EWMA) and weekly baselines count as anomalous
+ANOMALY_DETECTION_INTERVAL = int(os.getenv("ANOMALY_DETECTION_INTERVAL", "60"))
+ANOMALY_THRESHOLD = float(os.getenv("ANOMALY_THRESHOLD", "4"))
+ANOMALY_SEASONAL_THRESHOLD = float(os.getenv("ANOMALY_SEASONAL_THRESHOLD", "4"))
+ANOMALY_METRICS = ("published_rate", "bytes_received_rate", "bytes_sent_rate", "connected_clients")
+
+# Alert rules: seconds between evaluations, default resolve margin as a fraction of the
+# threshold, and webhooks (comma-separated) notified of alerts whose rule names none
+ALERT_EVALUATION_INTERVAL = float(os.getenv("ALERT_EVALUATION_INTERVAL", "1"))
+ALERT_HYSTERESIS = float(os.getenv("ALERT_HYSTERESIS", "0.1"))
+ALERT_WEBHOOK_URLS = [u.strip() for u in os.getenv("ALERT_WEBHOOK_URLS", "").split(",") if u.strip()]
+ALERT_WEBHOOK_INTERVAL = float(os.getenv("ALERT_WEBHOOK_INTERVAL", "5"))
+ALERT_WEBHOOK_MAX_ATTEMPTS = int(os.getenv("ALERT_WEBHOOK_MAX_ATTEMPTS", "5"))
+# Metrics rules can reference; any other name containing '/' is looked up among the $SYS metrics
+ALERT_METRICS = ("connected_clients", "subscriptions", "retained_messages", "messages_sent",
+                 "messages_received", "published_rate", "bytes_received_15min", "bytes_sent_15min")
+
+# Raw byte rate samples older than this many hours are stored as compressed chunks,
+# which makes long raw retention cheap; 0 keeps every sample as a row
+HISTORY_COMPRESS_AFTER_HOURS = int(os.getenv("HISTORY_COMPRESS_AFTER_HOURS", "24"))
+
+# Retention per history tier, in days
+HISTORY_RETENTION_DAYS = {
+    "raw": int(os.getenv("HISTORY_RAW_RETENTION_DAYS", "7")),
+    "hour": int(os.getenv("HISTORY_HOURLY_RETENTION_DAYS", "90")),
+    "day": int(os.getenv("HISTORY_DAILY_RETENTION_DAYS", "730")),
+    "month": int(os.getenv("HISTORY_MONTHLY_RETENTION_DAYS", "3650")),
+    "daily_messages": int(os.getenv("DAILY_MESSAGES_RETENTION_DAYS", "730")),
+    "anomalies": int(os.getenv("ANOMALY_RETENTION_DAYS", "90")),
+    "alerts": int(os.getenv("ALERT_EVENT_RETENTION_DAYS", "90")),
+    "connections": int(os.getenv("CONNECTION_HISTORY_RETENTION_DAYS", "365")),
+}
+
 class BackgroundDataCollector:
-    """Handles continuous background data collection"""
+    """Runs the monitor's periodic jobs on a monotonic-clock TaskScheduler
+
+    Storage jobs are registered once per broker, named `<job>[<broker>]`
+    when more than one broker is monitored.
+    """
     
-    def __init__(self, mqtt_stats_instance):
-        self.mqtt_stats = mqtt_stats_instance
+    def __init__(self, brokers: Dict[str, "MQTTStats"], broadcasters: Dict[str, StatsBroadcaster],
+                 exporter: PrometheusExporter, notifier: WebhookNotifier):
+        self.brokers = brokers
+        self.broadcasters = broadcasters
+        self.exporter = exporter
+        self.notifier = notifier
         self.is_running = False
-        self.task = None
-        self.storage_interval = 180  # 3 minutes for hourly data
+        self.scheduler = TaskScheduler()
+        self.storage_interval = STATS_SAMPLE_INTERVAL  # byte rate history samples
         self.message_rate_interval = 60  # 1 minute for message rates
-        
+        self.message_flush_interval = MESSAGE_FLUSH_INTERVAL  # write-behind message counts
+        self.topic_snapshot_interval = TOPIC_SNAPSHOT_INTERVAL  # topic tree history
+        self.payload_size_interval = PAYLOAD_SIZE_INTERVAL  # payload size rollups
+        self.latency_probe_interval = LATENCY_PROBE_INTERVAL  # synthetic broker latency probes
+        self.retention_interval = 3600  # 1 hour for history retention
+        self.compression_interval = 3600  # compress raw history of closed windows
+        self.anomaly_interval = ANOMALY_DETECTION_INTERVAL  # rate and connection anomaly detectors
+        self.anomaly_state_interval = 3600  # persist learned anomaly baselines
+        self.alert_interval = ALERT_EVALUATION_INTERVAL  # alert rule evaluation
+        self.webhook_interval = ALERT_WEBHOOK_INTERVAL  # batched alert webhook delivery
+        self._anomaly_state_saved: Dict[str, float] = {}
+        self.snapshot_interval = STATS_SNAPSHOT_INTERVAL  # serialized /api/v1/stats payload
+        self._register_tasks()
+    
+    @staticmethod
+    def _jitter(interval: float) -> float:
+        # Spread storage jobs that share a cadence so they don't queue on the writer together
+        return min(interval * TASK_JITTER_FRACTION, 5.0)
+    
+    def _register_tasks(self):
+        register = self.scheduler.register
+        register("publish_snapshot", self.snapshot_interval, self._publish_snapshots, initial_delay=0)
+        register("update_message_rates", self.message_rate_interval, self._update_message_rates)
+        register("evaluate_alerts", self.alert_interval, self._evaluate_alerts)
+        register("send_alert_webhooks", self.webhook_interval, self.notifier.flush, blocking=True)
+        for name, stats in self.brokers.items():
+            suffix = f"[{name}]" if len(self.brokers) > 1 else ""
+            register(f"flush_message_counts{suffix}", self.message_flush_interval,
+                     functools.partial(self._flush_message_counts, stats),
+                     blocking=True, jitter=self._jitter(self.message_flush_interval))
+            register(f"store_byte_rates{suffix}", self.storage_interval,
+                     functools.partial(self._update_storage, stats),
+                     blocking=True, jitter=self._jitter(self.storage_interval))
+            register(f"snapshot_topic_tree{suffix}", self.topic_snapshot_interval,
+                     functools.partial(self._snapshot_topic_tree, stats),
+                     blocking=True, jitter=self._jitter(self.topic_snapshot_interval))
+            register(f"store_payload_sizes{suffix}", self.payload_size_interval,
+                     functools.partial(self._store_payload_sizes, stats),
+                     blocking=True, jitter=self._jitter(self.payload_size_interval))
+            register(f"apply_retention{suffix}", self.retention_interval,
+                     functools.partial(self._apply_retention, stats),
+                     blocking=True, initial_delay=0)
+            register(f"detect_anomalies{suffix}", self.anomaly_interval,
+                     functools.partial(self._detect_anomalies, stats), blocking=True)
+            if HISTORY_COMPRESS_AFTER_HOURS > 0:
+                register(f"compress_raw_history{suffix}", self.compression_interval,
+                         functools.partial(self._compress_raw_history, stats),
+                         blocking=True, jitter=self._jitter(self.compression_interval))
+            if self.latency_probe_interval > 0:
+                register(f"latency_probe{suffix}", self.latency_probe_interval,
+                         functools.partial(self._run_latency_probe, stats),
+                         blocking=True, initial_delay=0)
+    
     async def start(self):
         """Start the background data collection"""
         if not self.is_running:
             self.is_running = True
-            self.task = asyncio.create_task(self._collection_loop())
+            self.scheduler.start()
             logger.info("Background data collector started")
     
     async def stop(self):
         """Stop the background data collection"""
-        self.is_running = False
-        if self.task:
-            self.task.cancel()
-            try:
-                await self.task
-            except asyncio.CancelledError:
-                pass
+        if self.is_running:
+            self.is_running = False
+            await self.scheduler.stop()
             logger.info("Background data collector stopped")
+        # Persist whatever the message counters and anomaly baselines still hold in memory
+        for stats in self.brokers.values():
+            await asyncio.to_thread(self._flush_message_counts, stats)
+            await asyncio.to_thread(self._save_anomaly_state, stats)
+        await asyncio.to_thread(self.notifier.flush)
     
-    async def _collection_loop(self):
-        """Main collection loop that runs continuously"""
-        last_storage_update = datetime.now()
-        last_message_rate_update = datetime.now()
+    async def _publish_snapshots(self):
+        """Publish new stats snapshots where anything changed and push them to stream subscribers"""
+        for stats in self.brokers.values():
+            # Advance sampled ingestion and re-subscribe when its prefixes change
+            stats.sampler.tick()
         
-        while self.is_running:
-            try:
-                now = datetime.now()
-                
-                # Update message rates every minute
-                if (now - last_message_rate_update).total_seconds() >= self.message_rate_interval:
-                    self._update_message_rates()
-                    last_message_rate_update = now
-                
-                # Update storage every 3 minutes
-                if (now - last_storage_update).total_seconds() >= self.storage_interval:
-                    self._update_storage()
-                    last_storage_update = now
-                
-                # Sleep for 30 seconds before next check
-                await asyncio.sleep(30)
-                
-            except asyncio.CancelledError:
-                logger.info("Background collection loop cancelled")
-                break
-            except Exception as e:
-                logger.error(f"Error in background collection loop: {e}")
-                await asyncio.sleep(30)  # Wait before retrying
+        snapshots = await asyncio.gather(*(stats.publish_snapshot() for stats in self.brokers.values()))
+        for name, snapshot in zip(self.brokers, snapshots):
+            self.broadcasters[name].publish(snapshot.version, snapshot.body)
+        
+        # Pre-render the Prometheus exposition so scrapes are a memory copy
+        self.exporter.update([
+            sample for stats in self.brokers.values() for sample in stats.metric_samples()
+        ])
+    
+    async def _evaluate_alerts(self):
+        """Check alert rules against in-memory stats; storage and webhooks only see transitions"""
+        for stats in self.brokers.values():
+            # Values go stale while disconnected and would fire or resolve rules spuriously
+            if not stats.alerts.rules or stats.connected_clients == 0:
+                continue
+            events = stats.alerts.evaluate(stats.alert_values())
+            if not events:
+                continue
+            await stats.data_storage.aio.add_alert_events(events)
+            self.notifier.enqueue(events, broker=stats.name)
+            for event in events:
+                logger.warning(
+                    f"Alert {event['status']} on broker {stats.name}: {event['name']} "
+                    f"({event['expression']}), value {event['value']}"
+                )
+    
+    def _flush_message_counts(self, stats: "MQTTStats"):
+        """Write buffered message count deltas to historical storage"""
+        # Reload before flushing, in the same job, so a batch is never counted twice
+        reloaded = stats.message_counter.reload_if_due()
+        flushed = stats.message_counter.flush()
+        if flushed or reloaded:
+            stats.mark_changed(history=True)
+            logger.debug(f"Flushed {flushed} message counts to storage for broker {stats.name}")
     
     def _update_message_rates(self):
         """Update message rates (same logic as original)"""
-        with self.mqtt_stats._lock:
-            published_rate = max(0, self.mqtt_stats.messages_sent - self.mqtt_stats.last_messages_sent)
-            self.mqtt_stats.published_history.append(published_rate)
-            self.mqtt_stats.last_messages_sent = self.mqtt_stats.messages_sent
-            self.mqtt_stats.last_update = datetime.now()
-            logger.debug(f"Updated message rates: {published_rate} messages/min")
-    
-    def _update_storage(self):
+        for stats in self.brokers.values():
+            with stats._lock:
+                published_rate = max(0, stats.messages_sent - stats.last_messages_sent)
+                stats.published_history.append(published_rate)
+                stats.last_messages_sent = stats.messages_sent
+                stats.last_update = datetime.now()
+                stats.mark_changed()
+                logger.debug(f"Updated message rates for broker {stats.name}: {published_rate} messages/min")
+    
+    def _update_storage(self, stats: "MQTTStats"):
         """Update historical storage (same logic as original)"""
-        try:
-            self.mqtt_stats.data_storage.add_hourly_data(
-                float(self.mqtt_stats.bytes_received_15min),
-                float(self.mqtt_stats.bytes_sent_15min)
-            )
-            logger.info(f"Stored hourly data: RX={self.mqtt_stats.bytes_received_15min}, TX={self.mqtt_stats.bytes_sent_15min}")
-        except Exception as e:
-            logger.error(f"Error updating storage: {e}")
+        stats.data_storage.add_hourly_data(
+            float(stats.bytes_received_15min),
+            float(stats.bytes_sent_15min)
+        )
+        stats.mark_changed(history=True)
+        logger.info(f"Stored hourly data for broker {stats.name}: RX={stats.bytes_received_15min}, TX={stats.bytes_sent_15min}")
+    
+    def _snapshot_topic_tree(self, stats: "MQTTStats"):
+        """Persist per-prefix traffic since the previous snapshot"""
+        rows = stats.topic_tree.snapshot_deltas(TOPIC_HISTORY_DEPTH)
+        if rows:
+            stats.data_storage.add_topic_traffic(rows, retention_days=TOPIC_HISTORY_DAYS)
+            logger.info(f"Stored topic traffic snapshot for broker {stats.name}: {len(rows)} prefixes")
+
+    def _store_payload_sizes(self, stats: "MQTTStats"):
+        """Write payload size percentiles of the last interval to the rollup tiers"""
+        samples = stats.payload_sizes.drain_interval()
+        if samples:
+            stats.data_storage.add_metric_samples(samples)
+
+    def _apply_retention(self, stats: "MQTTStats"):
+        """Drop history older than each tier's retention"""
+        stats.data_storage.apply_retention()
+        stats.mark_changed(history=True)
+
+    def _detect_anomalies(self, stats: "MQTTStats"):
+        """Feed current rates to the anomaly detectors and store episodes that started or ended"""
+        # Values go stale while disconnected; learning them would skew the baselines
+        if stats.connected_clients == 0:
+            return
+        now = time.time()
+        changed = stats.anomalies.observe(stats.anomaly_samples(), now)
+        if changed:
+            stats.data_storage.add_anomalies(changed)
+            for episode in changed:
+                state = "ended" if episode["ended_at"] else "started"
+                logger.warning(
+                    f"Anomaly {state} on broker {stats.name}: {episode['metric']} {episode['kind']}, "
+                    f"value {episode['value']:.2f}, expected {episode['expected']:.2f}"
+                )
+        if now - self._anomaly_state_saved.setdefault(stats.name, now) >= self.anomaly_state_interval:
+            self._save_anomaly_state(stats)
+
+    def _save_anomaly_state(self, stats: "MQTTStats"):
+        """Persist learned baselines so a restart doesn't discard weeks of seasonal history"""
+        stats.data_storage.set_monitor_state("anomaly_models", stats.anomalies.state())
+        self._anomaly_state_saved[stats.name] = time.time()
+
+    def _compress_raw_history(self, stats: "MQTTStats"):
+        """Move raw samples older than HISTORY_COMPRESS_AFTER_HOURS into compressed chunks"""
+        compressed = stats.data_storage.compress_raw_history()
+        if compressed:
+            logger.info(f"Compressed {compressed} raw history samples for broker {stats.name}")
+
+    def _run_latency_probe(self, stats: "MQTTStats"):
+        """Run one round of latency probes and store the window percentiles"""
+        samples = stats.latency_probe.run_once()
+        stats.data_storage.add_metric_samples(samples)
+
+class StatsSnapshot(NamedTuple):
+    """Immutable, pre-serialized /api/v1/stats payload"""
+    version: int
+    etag: str
+    body: bytes
 
 class MQTTStats:
-    def __init__(self):
-        self._lock = threading.Lock()
+    def __init__(self, target: BrokerTarget, storage_writer: Optional[StorageWriter] = None):
+        self.name = target.name
+        self.target = target
+        self._lock = TimedLock()
+        # Self-instrumentation of the ingest path, see debug_metrics()
+        self.on_message_latency = LatencyHistogram()
+        self.batch_latency = LatencyHistogram()
+        self.messages_seen = 0  # non-$SYS messages delivered by the broker, before filtering
+        self.ingest_completeness = IngestCompleteness()
         self.messages_sent = 0
         self.subscriptions = 0
         self.retained_messages = 0
         self.connected_clients = 0
         self.bytes_received_15min = 0.0
         self.bytes_sent_15min = 0.0
-        self.message_counter = MessageCounter()
-        self.data_storage = HistoricalDataStorage()
+        self.data_storage = HistoricalDataStorage(
+            db_path=target.db_path,
+            retention_days=HISTORY_RETENTION_DAYS,
+            raw_resolution=STATS_SAMPLE_INTERVAL,
+            writer=storage_writer,
+            compress_after=HISTORY_COMPRESS_AFTER_HOURS * 3600 or None
+        )
+        self.message_counter = MessageCounter(self.data_storage, file_path=target.counter_file,
+                                              reload_interval=MESSAGE_COUNT_RELOAD_INTERVAL)
+        self.top_topics = TopTopicsTracker(capacity=TOP_TOPICS_CAPACITY)
+        self.topic_tree = TopicTree(max_nodes=TOPIC_TREE_MAX_NODES)
+        self.sys_metrics = SysMetricRegistry(max_metrics=SYS_METRICS_MAX)
+        self.payload_sizes = PayloadSizeStats(PAYLOAD_SIZE_PREFIXES)
+        self.sampler = TopicSampler(
+            MQTT_SAMPLING_MODE,
+            fraction=MQTT_SAMPLING_FRACTION,
+            depth=MQTT_SAMPLING_DEPTH,
+            period=MQTT_SAMPLING_PERIOD,
+            discovery_interval=MQTT_SAMPLING_DISCOVERY_INTERVAL,
+            discovery_seconds=MQTT_SAMPLING_DISCOVERY_SECONDS
+        )
+        self.latency_probe = LatencyProbe(
+            target.host, target.port, target.username, target.password,
+            topic=LATENCY_PROBE_TOPIC, round_trips=LATENCY_PROBE_ROUND_TRIPS, window=LATENCY_PROBE_WINDOW
+        )
+        self.anomalies = AnomalyMonitor(
+            ANOMALY_METRICS,
+            threshold=ANOMALY_THRESHOLD,
+            seasonal_threshold=ANOMALY_SEASONAL_THRESHOLD,
+            # One week of samples in a seasonal slot before it is trusted
+            seasonal_warmup=max(1, 3600 // ANOMALY_DETECTION_INTERVAL)
+        )
+        self.anomalies.load_state(self.data_storage.get_monitor_state("anomaly_models") or {})
+        self.data_storage.close_open_anomalies()
+        self.alerts = AlertEngine(self._load_alert_rules())
+        # Network I/O: a paho client with its own loop thread, or an asyncio ingest
+        self.client: Optional[mqtt_client.Client] = None
+        self.ingest: Optional[AsyncioMQTTIngest] = None
         self.last_storage_update = datetime.now()
         self.messages_history = deque(maxlen=15)
         self.published_history = deque(maxlen=15)
@@ -177,6 +471,13 @@ class MQTTStats:
         for _ in range(15):
             self.messages_history.append(0)
             self.published_history.append(0)
+        
+        # Published snapshot; replaced as a whole, never mutated
+        self.snapshot: Optional[StatsSnapshot] = None
+        self._snapshot_id = os.urandom(4).hex()  # keeps ETags unique across restarts
+        self._snapshot_dirty = True
+        self._history_stale = True
+        self._history = ({}, {})
 
     def format_number(self, number: int) -> str:
         if number >= 1_000_000:
@@ -185,18 +486,218 @@ class MQTTStats:
             return f"{number/1_000:.1f}K"
         return str(number)
 
-    def increment_user_messages(self):
-        with self._lock:
-            self.message_counter.increment_count()
+    def increment_user_messages(self, amount: int = 1):
+        # MessageCounter has its own lock; keep the stats lock off the per-message path
+        self.message_counter.increment_count(amount)
+
+    def record_user_message(self, topic: str, payload_size: int):
+        # With sampling, message totals come from $SYS rather than the sample
+        if not self.sampler.enabled:
+            self.increment_user_messages()
+        self.top_topics.record(topic, payload_size)
+        self.topic_tree.record(topic, payload_size)
+        self.payload_sizes.record(topic, payload_size)
+        self._snapshot_dirty = True
+
+    def record_user_batch(self, batch: MessageBatch):
+        """Apply a batch of user messages, taking each tracker's lock once"""
+        with self.batch_latency.time():
+            self._apply_user_batch(batch)
+
+    def _apply_user_batch(self, batch: MessageBatch):
+        if not self.sampler.enabled:
+            self.increment_user_messages(batch.messages)
+        totals = {topic: (entry[0], entry[1]) for topic, entry in batch.topics.items()}
+        self.top_topics.record_batch(totals)
+        self.topic_tree.record_batch(totals)
+        self.payload_sizes.record_batch({topic: entry[2] for topic, entry in batch.topics.items()})
+        self._snapshot_dirty = True
+
+    def mark_changed(self, history: bool = False):
+        """Make the next publish_snapshot() rebuild; history=True also re-reads storage"""
+        if history:
+            self._history_stale = True
+        self._snapshot_dirty = True
 
     def get_stats(self) -> Dict:
         """Get current stats without forcing updates (background handles updates)"""
+        return self._build_stats(
+            self.data_storage.get_hourly_data(),
+            self.data_storage.get_daily_messages()
+        )
+
+    async def publish_snapshot(self) -> StatsSnapshot:
+        """Serialize and publish current stats if anything changed since the last snapshot"""
+        if not self._snapshot_dirty and self.snapshot is not None:
+            return self.snapshot
+        # Cleared before building, so changes made meanwhile trigger another rebuild
+        self._snapshot_dirty = False
+        if self._history_stale:
+            self._history_stale = False
+            self._history = await asyncio.gather(
+                self.data_storage.aio.get_hourly_data(),
+                self.data_storage.aio.get_daily_messages()
+            )
+        
+        stats = self._build_stats(*self._history)
+        stats["mqtt_connected"] = self.connected_clients > 0
+        if not stats["mqtt_connected"]:
+            stats["connection_error"] = f"MQTT broker connection failed. Check if Mosquitto is running on {self.target.host}:{self.target.port}"
+        body = json.dumps(stats, separators=(',', ':')).encode()
+        
+        if self.snapshot is None or body != self.snapshot.body:
+            version = self.snapshot.version + 1 if self.snapshot else 1
+            self.snapshot = StatsSnapshot(version, f'"{self._snapshot_id}-{version}"', body)
+        return self.snapshot
+
+    def metric_samples(self) -> List[MetricSample]:
+        """Current broker and monitor metrics for the Prometheus exposition"""
+        with self._lock:
+            samples = [
+                MetricSample("bunkerm_mqtt_connected", "gauge",
+                             "Whether the monitor is connected to the broker", float(self.connected_clients > 0)),
+                MetricSample("bunkerm_broker_clients_connected", "gauge",
+                             "Connected clients, excluding the monitor itself", max(0, self.connected_clients - 1)),
+                MetricSample("bunkerm_broker_subscriptions", "gauge",
+                             "Active subscriptions, excluding the monitor's own", max(0, self.subscriptions - 2)),
+                MetricSample("bunkerm_broker_retained_messages", "gauge",
+                             "Retained messages held by the broker", self.retained_messages),
+                MetricSample("bunkerm_broker_messages_sent", "counter",
+                             "Messages sent by the broker since it started", self.messages_sent),
+                MetricSample("bunkerm_broker_load_bytes_received_15min", "gauge",
+                             "Broker receive rate in bytes per minute, 15 minute average", self.bytes_received_15min),
+                MetricSample("bunkerm_broker_load_bytes_sent_15min", "gauge",
+                             "Broker send rate in bytes per minute, 15 minute average", self.bytes_sent_15min),
+            ]
+        samples += [
+            MetricSample("bunkerm_monitor_messages_received", "counter",
+                         "User messages received by the monitor since it started", self.topic_tree.root.messages),
+            MetricSample("bunkerm_monitor_payload_bytes_received", "counter",
+                         "User message payload bytes received by the monitor since it started", self.topic_tree.root.bytes),
+            MetricSample("bunkerm_monitor_topic_tree_nodes", "gauge",
+                         "Nodes in the in-memory topic tree", self.topic_tree.node_count),
+            MetricSample("bunkerm_monitor_stats_version", "gauge",
+                         "Version of the published /api/v1/stats snapshot", self.snapshot.version if self.snapshot else 0),
+        ]
+        for name, probe in self.latency_probe.summary()["probes"].items():
+            if probe["count"]:
+                samples += [
+                    MetricSample(f"bunkerm_probe_{name}_p50_seconds", "gauge",
+                                 f"Median {name} probe latency over the probe window", probe["p50_ms"] / 1000),
+                    MetricSample(f"bunkerm_probe_{name}_p99_seconds", "gauge",
+                                 f"99th percentile {name} probe latency over the probe window", probe["p99_ms"] / 1000),
+                ]
+            samples.append(MetricSample(f"bunkerm_probe_{name}_failures", "counter",
+                                        f"Failed {name} probes since the monitor started", probe["failures"]))
+        for name, topic, kind, value in self.sys_metrics.latest_values():
+            samples.append(MetricSample(
+                metric_name("mosquitto", name),
+                kind if kind in ("counter", "gauge") else "untyped",
+                f"Mosquitto {topic}",
+                value
+            ))
+        completeness = self.ingest_completeness.ratio()
+        if completeness is not None:
+            samples.append(MetricSample("bunkerm_monitor_ingest_completeness_ratio", "gauge",
+                                        "Share of the broker's received publishes seen by the monitor",
+                                        completeness))
+        active = {episode["metric"] for episode in self.anomalies.active()}
+        samples += [
+            MetricSample("bunkerm_anomaly_active", "gauge",
+                         "Whether an anomaly episode is open for the series", float(metric in active),
+                         (("metric", metric),))
+            for metric in ANOMALY_METRICS
+        ]
+        labels = (("broker", self.name),)
+        return [sample._replace(labels=labels + sample.labels) for sample in samples]
+
+    def anomaly_samples(self) -> Dict[str, float]:
+        """Current value of every series watched by the anomaly detectors"""
+        with self._lock:
+            return {
+                "published_rate": self.published_history[-1],
+                "bytes_received_rate": self.bytes_received_15min,
+                "bytes_sent_rate": self.bytes_sent_15min,
+                "connected_clients": max(0, self.connected_clients - 1),
+            }
+
+    def alert_values(self) -> Dict[str, float]:
+        """Current value of every metric referenced by an alert rule"""
+        metrics = self.alerts.metrics
+        values = {}
+        if "messages_received" in metrics:
+            values["messages_received"] = self.message_counter.get_total_count()
+        with self._lock:
+            values.update(
+                connected_clients=max(0, self.connected_clients - 1),
+                subscriptions=max(0, self.subscriptions - 2),
+                retained_messages=self.retained_messages,
+                messages_sent=self.messages_sent,
+                published_rate=self.published_history[-1],
+                bytes_received_15min=self.bytes_received_15min,
+                bytes_sent_15min=self.bytes_sent_15min,
+            )
+        for metric in metrics:
+            if metric not in values:
+                value = self.sys_metrics.value(metric)
+                if value is not None:
+                    values[metric] = value
+        return values
+
+    def _load_alert_rules(self) -> List[AlertRule]:
+        rules = []
+        for row in self.data_storage.get_alert_rules():
+            try:
+                rules.append(AlertRule(
+                    row["id"], row["name"], row["expression"],
+                    hysteresis=row["hysteresis"],
+                    webhook_url=row["webhook_url"],
+                    for_seconds=row["for_seconds"],
+                    # Rules firing before a restart stay firing, so they aren't notified again
+                    state=row["state"],
+                    since=row["state_since"]
+                ))
+            except ValueError as e:
+                logger.error(f"Skipping invalid alert rule {row['id']} on broker {self.name}: {e}")
+        return rules
+
+    def debug_metrics(self) -> Dict:
+        """Timings of this broker's hot paths and how much of its traffic was ingested"""
+        return {
+            "on_message": self.on_message_latency.summary(),
+            "ingest_batches": self.batch_latency.summary() if self.ingest is not None else None,
+            "stats_lock": self._lock.summary(),
+            "storage": self.data_storage.latency_summary(),
+            "ingest_completeness": {
+                **self.ingest_completeness.summary(),
+                "sampling": self.sampler.enabled,
+            },
+        }
+
+    def summary(self) -> Dict:
+        """Headline numbers of this broker for the multi-broker overview"""
+        total_messages = self.message_counter.get_total_count()
+        with self._lock:
+            return {
+                "name": self.name,
+                "address": f"{self.target.host}:{self.target.port}",
+                "mqtt_connected": self.connected_clients > 0,
+                "connected_clients": max(0, self.connected_clients - 1),
+                "subscriptions": max(0, self.subscriptions - 2),
+                "retained_messages": self.retained_messages,
+                "messages_sent": self.messages_sent,
+                "messages_received": total_messages,
+                "bytes_received_15min": self.bytes_received_15min,
+                "bytes_sent_15min": self.bytes_sent_15min,
+                "last_update": self.last_update.isoformat(),
+            }
+
+    def _build_stats(self, hourly_data: Dict, daily_messages: Dict) -> Dict:
+        # History is read before taking the lock so collector updates never wait on SQLite
+        total_messages = self.message_counter.get_total_count()
         with self._lock:
             actual_subscriptions = max(0, self.subscriptions - 2)
             actual_connected_clients = max(0, self.connected_clients - 1)
-            total_messages = self.message_counter.get_total_count()
-            hourly_data = self.data_storage.get_hourly_data()
-            daily_messages = self.data_storage.get_daily_messages()
             
             return {
                 "total_connected_clients": actual_connected_clients,
@@ -211,54 +712,198 @@ class MQTTStats:
             }
 
 class MessageCounter:
-    def __init__(self, file_path="message_counts.json"):
+    """Write-behind daily message counter.
+
+    Increments only touch memory. Deltas are flushed in batches into the
+    `daily_message_counts` table by the background collector. Each batch is
+    spooled to `file_path` before it is written, so a batch interrupted by a
+    crash is replayed on the next start. The persisted totals are re-read
+    every `reload_interval` seconds to pick up rows written by other
+    processes, such as log_backfill.py.
+    """
+
+    def __init__(self, data_storage: HistoricalDataStorage, file_path="message_counts.json",
+                 reload_interval: float = 300):
         self.file_path = file_path
-        self.daily_counts = self._load_counts()
+        self.data_storage = data_storage
+        self.reload_interval = reload_interval
+        self._lock = threading.Lock()
+        self._pending: Dict[str, int] = {}
+        self._current_day = ""
+        self._current_day_end = 0.0
+        self._current_count = 0
+        self._flush_seq = self.data_storage.get_message_flush_seq()
+        self._replay_spool()
+        self._flushed_counts = self.data_storage.get_daily_message_counts(days=7)
+        self._next_reload = time.monotonic() + reload_interval
 
-    def _load_counts(self) -> Dict[str, int]:
-        if os.path.exists(self.file_path):
-            try:
-                with open(self.file_path, 'r') as f:
-                    data = json.load(f)
-                    return {item['timestamp'].split()[0]: item['message_counter'] 
-                           for item in data}
-            except json.JSONDecodeError:
-                return {}
-        return {}
-
-    def _save_counts(self):
-        data = [
-            {"timestamp": f"{date} 00:00", "message_counter": count}
-            for date, count in self.daily_counts.items()
-        ]
-        with open(self.file_path, 'w') as f:
-            json.dump(data, f, indent=2)
-
-    def increment_count(self):
-        today = datetime.now().date().isoformat()
-        self.daily_counts[today] = self.daily_counts.get(today, 0) + 1
-        cutoff_date = (datetime.now() - timedelta(days=7)).date().isoformat()
-        self.daily_counts = {
-            date: count 
-            for date, count in self.daily_counts.items() 
-            if date >= cutoff_date
-        }
-        self._save_counts()
+    def reload_if_due(self) -> bool:
+        """Replace the cached persisted counts with the stored ones; returns True if they changed.
+
+        Must run on the flush thread, between flushes: a flush adds its
+        deltas to the cache only after committing them.
+        """
+        if time.monotonic() < self._next_reload:
+            return False
+        self._next_reload = time.monotonic() + self.reload_interval
+        counts = self.data_storage.get_daily_message_counts(days=7)
+        if not counts and self._flushed_counts:
+            return False  # a failed read also returns {}; keep what we have
+        with self._lock:
+            changed = counts != self._flushed_counts
+            self._flushed_counts = counts
+        return changed
+
+    def _roll_day(self, now: float):
+        """Start counting into a new UTC day, parking the old day's count as pending"""
+        if self._current_count:
+            self._pending[self._current_day] = self._pending.get(self._current_day, 0) + self._current_count
+        self._current_count = 0
+        day = datetime.fromtimestamp(now, timezone.utc).date()
+        self._current_day = day.isoformat()
+        self._current_day_end = datetime(day.year, day.month, day.day, tzinfo=timezone.utc).timestamp() + 86400
+
+    def _read_spool(self) -> Dict:
+        if not os.path.exists(self.file_path):
+            return {}
+        try:
+            with open(self.file_path, 'r') as f:
+                data = json.load(f)
+        except (json.JSONDecodeError, OSError) as e:
+            logger.error(f"Error reading message count spool {self.file_path}: {e}")
+            return {}
+
+        # Legacy format: list of full daily totals written on every message
+        if isinstance(data, list):
+            return {
+                "seq": self._flush_seq + 1,
+                "deltas": {item['timestamp'].split()[0]: item['message_counter'] for item in data}
+            }
+        return data
+
+    def _write_spool(self, seq: int, deltas: Dict[str, int]):
+        tmp_path = f"{self.file_path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({"seq": seq, "deltas": deltas}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.file_path)
+
+    def _clear_spool(self):
+        try:
+            os.remove(self.file_path)
+        except FileNotFoundError:
+            pass
+
+    def _replay_spool(self):
+        """Apply a batch left behind by a crash between spooling and committing it"""
+        spool = self._read_spool()
+        if not spool:
+            return
+        seq = int(spool.get("seq", 0))
+        deltas = spool.get("deltas", {})
+        if seq > self._flush_seq and deltas:
+            if not self.data_storage.apply_daily_message_deltas(deltas, seq):
+                # Keep the spool; the next flush retries it under the same sequence
+                self._pending = dict(deltas)
+                self._flush_seq = seq - 1
+                return
+            logger.info(f"Replayed {sum(deltas.values())} unflushed messages from {self.file_path}")
+        self._flush_seq = max(self._flush_seq, seq)
+        self._clear_spool()
+
+    def increment_count(self, amount: int = 1):
+        now = time.time()
+        with self._lock:
+            if now >= self._current_day_end:
+                self._roll_day(now)
+            self._current_count += amount
+
+    def flush(self) -> int:
+        """Persist pending deltas; returns the number of messages flushed"""
+        with self._lock:
+            if self._current_count:
+                self._pending[self._current_day] = self._pending.get(self._current_day, 0) + self._current_count
+                self._current_count = 0
+            deltas, self._pending = self._pending, {}
+        if not deltas:
+            return 0
+
+        seq = self._flush_seq + 1
+        try:
+            self._write_spool(seq, deltas)
+        except OSError as e:
+            logger.error(f"Error writing message count spool: {e}")
+
+        if not self.data_storage.apply_daily_message_deltas(deltas, seq):
+            # Merge back so the next flush retries; the spool still covers a crash
+            with self._lock:
+                for date, count in deltas.items():
+                    self._pending[date] = self._pending.get(date, 0) + count
+            return 0
+
+        self._flush_seq = seq
+        self._clear_spool()
+
+        cutoff_date = (datetime.now(timezone.utc) - timedelta(days=7)).date().isoformat()
+        with self._lock:
+            for date, count in deltas.items():
+                self._flushed_counts[date] = self._flushed_counts.get(date, 0) + count
+            self._flushed_counts = {
+                date: count
+                for date, count in self._flushed_counts.items()
+                if date >= cutoff_date
+            }
+        return sum(deltas.values())
 
     def get_total_count(self) -> int:
-        return sum(self.daily_counts.values())
+        with self._lock:
+            return (
+                sum(self._flushed_counts.values())
+                + sum(self._pending.values())
+                + self._current_count
+            )
 
 # Initialize MQTT Stats and Background Collector
-mqtt_stats = MQTTStats()
-background_collector = BackgroundDataCollector(mqtt_stats)
+broker_targets = parse_broker_targets(
+    MONITOR_BROKERS, MOSQUITTO_IP, MOSQUITTO_PORT, MOSQUITTO_ADMIN_USERNAME, MOSQUITTO_ADMIN_PASSWORD,
+    data_dir=MONITOR_DATA_DIR
+)
+# One writer thread serves every broker's history database
+storage_writer = StorageWriter()
+brokers: Dict[str, MQTTStats] = {target.name: MQTTStats(target, storage_writer) for target in broker_targets}
+# Requests that don't name a broker are answered for the first one
+mqtt_stats = brokers[broker_targets[0].name]
+stats_broadcasters = {
+    name: StatsBroadcaster(
+        queue_size=STATS_STREAM_QUEUE_SIZE,
+        max_subscribers=STATS_STREAM_MAX_SUBSCRIBERS
+    )
+    for name in brokers
+}
+prometheus_exporter = PrometheusExporter()
+alert_notifier = WebhookNotifier(ALERT_WEBHOOK_URLS, max_attempts=ALERT_WEBHOOK_MAX_ATTEMPTS)
+background_collector = BackgroundDataCollector(brokers, stats_broadcasters, prometheus_exporter, alert_notifier)
 limiter = Limiter(key_func=get_remote_address)
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Application lifespan manager"""
     # Startup
-    client = connect_mqtt()
-    client.loop_start()
+    # Several brokers share the event loop rather than each running a network thread
+    use_asyncio_ingest = MQTT_INGEST_MODE == "asyncio" or len(brokers) > 1
+    for stats in brokers.values():
+        if use_asyncio_ingest:
+            stats.ingest = AsyncioMQTTIngest(
+                create_mqtt_client(stats), stats.target.host, stats.target.port,
+                on_message=on_message_batched,
+                on_batch=stats.record_user_batch,
+                batch_interval=MQTT_INGEST_BATCH_INTERVAL
+            )
+            await stats.ingest.start()
+        else:
+            stats.client = connect_mqtt(stats)
+            stats.client.loop_start()
     
     # Start background data collection
     await background_collector.start()
@@ -269,7 +914,13 @@ async def lifespan(app: FastAPI):
     
     # Shutdown
     await background_collector.stop()
-    client.loop_stop()
+    for stats in brokers.values():
+        if stats.ingest is not None:
+            await stats.ingest.stop()
+        else:
+            stats.client.loop_stop()
+        await asyncio.to_thread(stats.data_storage.close)
+    await asyncio.to_thread(storage_writer.close)
     
     logger.info("Application shutdown complete")
 
@@ -297,7 +948,7 @@ app.add_middleware(TrustedHostMiddleware, allowed_hosts=ALLOWED_HOSTS)
 async def verify_firebase_token(credentials: HTTPAuthorizationCredentials = Depends(security)) -> dict:
     try:
         token = credentials.credentials
-        decoded_token = auth.verify_id_token(token)
+        decoded_token = verify_id_token(token)
         user_role = decoded_token.get('role', 'user')
         
         logger.info(f"Authenticated user: {decoded_token.get('email', 'unknown')}")
@@ -356,7 +1007,20 @@ async def add_security_headers(request: Request, call_next):
     response.headers["X-XSS-Protection"] = "1; mode=block"
     return response
 
-def on_message(client, userdata, msg):
+def handle_sys_message(stats: MQTTStats, msg):
+    stats.sys_metrics.record(msg.topic, msg.payload)
+    
+    if msg.topic == SYS_PUBLISH_RECEIVED_TOPIC:
+        try:
+            total = int(msg.payload.decode())
+            stats.ingest_completeness.observe(total, stats.messages_seen)
+            if stats.sampler.enabled:
+                received = stats.sampler.observe_sys_total(total)
+                if received:
+                    stats.increment_user_messages(received)
+        except ValueError as e:
+            logger.error(f"Error processing message from {msg.topic}: {e}")
+    
     if msg.topic in MONITORED_TOPICS:
         try:
             if msg.topic in ["$SYS/broker/load/bytes/received/15min", "$SYS/broker/load/bytes/sent/15min"]:
@@ -365,60 +1029,614 @@ def on_message(client, userdata, msg):
                 value = int(msg.payload.decode())
                 
             attr_name = MONITORED_TOPICS[msg.topic]
-            with mqtt_stats._lock:
-                setattr(mqtt_stats, attr_name, value)
+            with stats._lock:
+                if getattr(stats, attr_name) != value:
+                    setattr(stats, attr_name, value)
+                    stats.mark_changed()
         except ValueError as e:
             logger.error(f"Error processing message from {msg.topic}: {e}")
-    elif not msg.topic.startswith('$SYS/'):
-        mqtt_stats.increment_user_messages()
 
-def connect_mqtt():
-    try:
-        def on_connect(client, userdata, flags, rc, properties=None):
-            if rc == 0:
-                logger.info(f"Connected to MQTT Broker at {MOSQUITTO_IP}:{MOSQUITTO_PORT}!")
-                client.subscribe([("$SYS/broker/#", 0), ("#", 0)])
+def accept_user_message(stats: MQTTStats, msg) -> bool:
+    """Whether a non-$SYS message counts as user traffic"""
+    if stats.latency_probe.is_probe_topic(msg.topic):
+        return False
+    if stats.sampler.enabled:
+        # Retained messages are replayed every time the sampler re-subscribes
+        return not msg.retain and stats.sampler.accept(msg.topic)
+    return True
+
+# Each broker's client carries its MQTTStats as paho userdata
+def on_message(client, userdata, msg):
+    started = time.perf_counter_ns()
+    if msg.topic.startswith('$SYS/'):
+        handle_sys_message(userdata, msg)
+    else:
+        userdata.messages_seen += 1
+        if accept_user_message(userdata, msg):
+            userdata.record_user_message(msg.topic, len(msg.payload))
+    userdata.on_message_latency.record(time.perf_counter_ns() - started)
+
+def on_message_batched(client, userdata, msg):
+    """on_message for the asyncio ingest mode, called on the event loop thread"""
+    started = time.perf_counter_ns()
+    if msg.topic.startswith('$SYS/'):
+        handle_sys_message(userdata, msg)
+    else:
+        userdata.messages_seen += 1
+        if accept_user_message(userdata, msg):
+            userdata.ingest.add(msg.topic, len(msg.payload))
+    userdata.on_message_latency.record(time.perf_counter_ns() - started)
+
+def create_mqtt_client(stats: MQTTStats):
+    def on_connect(client, userdata, flags, rc, properties=None):
+        if rc == 0:
+            logger.info(f"Connected to MQTT Broker '{stats.name}' at {stats.target.host}:{stats.target.port}!")
+            if stats.sampler.enabled:
+                client.subscribe("$SYS/broker/#", 0)
+                stats.sampler.attach(client)
             else:
-                logger.error(f"Failed to connect to MQTT broker, return code {rc}")
+                client.subscribe([("$SYS/broker/#", 0), ("#", 0)])
+        else:
+            logger.error(f"Failed to connect to MQTT broker '{stats.name}', return code {rc}")
+
+    client = mqtt_client.Client(mqtt_client.CallbackAPIVersion.VERSION2, userdata=stats)
+    client.username_pw_set(stats.target.username, stats.target.password)
+    client.on_connect = on_connect
+    client.on_message = on_message
+    return client
 
-        client = mqtt_client.Client(mqtt_client.CallbackAPIVersion.VERSION2)
-        client.username_pw_set(MOSQUITTO_ADMIN_USERNAME, MOSQUITTO_ADMIN_PASSWORD)
-        client.on_connect = on_connect
-        client.on_message = on_message
-        client.connect(MOSQUITTO_IP, MOSQUITTO_PORT, 60)
+def connect_mqtt(stats: MQTTStats):
+    try:
+        client = create_mqtt_client(stats)
+        client.connect(stats.target.host, stats.target.port, 60)
         return client
     
     except Exception as e:
-        logger.error(f"Connection to MQTT broker failed: {e}")
+        logger.error(f"Connection to MQTT broker '{stats.name}' failed: {e}")
         dummy_client = mqtt_client.Client(mqtt_client.CallbackAPIVersion.VERSION2)
         dummy_client.loop_start = lambda: None
         dummy_client.loop_stop = lambda: None
         return dummy_client
 
+def get_broker(broker: Optional[str]) -> MQTTStats:
+    """Stats of the named broker, or of the first configured broker when none is named"""
+    if broker is None:
+        return mqtt_stats
+    stats = brokers.get(broker)
+    if stats is None:
+        raise HTTPException(status_code=404, detail=f"Unknown broker '{broker}'")
+    return stats
+
+def with_sampling(stats: MQTTStats, result: Dict) -> Dict:
+    """Attach the sampling state to topic statistics computed from a sample"""
+    if stats.sampler.enabled:
+        result["sampling"] = stats.sampler.summary()
+    return result
 @app.get("/api/v1/stats")
 @limiter.limit("30/minute")
 async def get_mqtt_stats(
     request: Request,
+    broker: Optional[str] = None,
     user: dict = Depends(require_stats_access)
 ):
-    """Get MQTT statistics - requires stats viewing permission"""
+    """Get MQTT statistics - requires stats viewing permission
+    
+    Serves the snapshot published by the background collector. Clients that
+    send the snapshot's ETag in If-None-Match get a 304 until it changes.
+    """
     await log_request(request)
+    stats = get_broker(broker)
     
     try:
-        stats = mqtt_stats.get_stats()
-        stats["mqtt_connected"] = mqtt_stats.connected_clients > 0
+        snapshot = stats.snapshot or await stats.publish_snapshot()
+        headers = {
+            "ETag": snapshot.etag,
+            "Cache-Control": "no-cache",
+            "X-Stats-Version": str(snapshot.version),
+            "Access-Control-Allow-Headers": "Content-Type, Authorization, If-None-Match",
+            "Access-Control-Expose-Headers": "ETag, X-Stats-Version"
+        }
         
-        if not stats["mqtt_connected"]:
-            stats["connection_error"] = f"MQTT broker connection failed. Check if Mosquitto is running on {MOSQUITTO_IP}:{MOSQUITTO_PORT}"
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match:
+            etags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+            if "*" in etags or snapshot.etag in etags:
+                return Response(status_code=304, headers=headers)
         
-        response = JSONResponse(content=stats)
-        response.headers["Access-Control-Allow-Headers"] = "Content-Type, Authorization"
-        return response
+        return Response(content=snapshot.body, media_type="application/json", headers=headers)
         
     except Exception as e:
         logger.error(f"Unexpected error in get_stats endpoint: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
+@app.get("/api/v1/stats/stream")
+@limiter.limit("10/minute")
+async def stream_mqtt_stats(
+    request: Request,
+    broker: Optional[str] = None,
+    user: dict = Depends(require_stats_access)
+):
+    """Stream live MQTT statistics as Server-Sent Events
+    
+    The first event is a full `snapshot`; later `delta` events carry only
+    the fields that changed. Clients that fall behind are resynced with a
+    fresh snapshot instead of queued deltas.
+    """
+    await log_request(request)
+    broadcaster = stats_broadcasters[get_broker(broker).name]
+    
+    if broadcaster.is_full():
+        raise HTTPException(status_code=503, detail="Too many live stats subscribers")
+    
+    return StreamingResponse(
+        broadcaster.events(request.is_disconnected),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",
+            "Access-Control-Allow-Headers": "Content-Type, Authorization"
+        }
+    )
+
+@app.get("/api/v1/stats/top-topics")
+@limiter.limit("30/minute")
+async def get_top_topics(
+    request: Request,
+    window: str = "15m",
+    limit: int = 10,
+    broker: Optional[str] = None,
+    user: dict = Depends(require_stats_access)
+):
+    """Get the busiest topics by message count and payload bytes over a sliding window"""
+    await log_request(request)
+    stats = get_broker(broker)
+    
+    if window not in TopTopicsTracker.WINDOWS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid window. Use one of: {', '.join(TopTopicsTracker.WINDOWS)}"
+        )
+    
+    try:
+        return with_sampling(stats, stats.top_topics.top(window=window, limit=limit))
+    except Exception as e:
+        logger.error(f"Error getting top topics: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+@app.get("/api/v1/stats/topic-tree")
+@limiter.limit("60/minute")
+async def get_topic_tree(
+    request: Request,
+    prefix: str = "",
+    limit: int = 100,
+    offset: int = 0,
+    broker: Optional[str] = None,
+    user: dict = Depends(require_stats_access)
+):
+    """Get traffic totals of a topic prefix and one page of its direct children"""
+    await log_request(request)
+    stats = get_broker(broker)
+    
+    result = stats.topic_tree.children(
+        prefix.strip('/'),
+        limit=max(1, min(limit, 1000)),
+        offset=max(0, offset)
+    )
+    if result is None:
+        raise HTTPException(status_code=404, detail=f"No traffic seen under topic prefix '{prefix}'")
+    return with_sampling(stats, result)
+
+@app.get("/api/v1/stats/topic-tree/match")
+@limiter.limit("60/minute")
+async def match_topic_tree(
+    request: Request,
+    pattern: str,
+    broker: Optional[str] = None,
+    user: dict = Depends(require_stats_access)
+):
+    """Get aggregated traffic of all topics matching an MQTT filter, e.g. factory/+/line3/#"""
+    await log_request(request)
+    stats = get_broker(broker)
+    
+    levels = pattern.split('/')
+    if '#' in levels[:-1] or any(('#' in level or '+' in level) and len(level) > 1 for level in levels):
+        raise HTTPException(status_code=400, detail="Invalid topic filter")
+    return with_sampling(stats, stats.topic_tree.match(pattern))
+
+@app.get("/api/v1/stats/topic-history")
+@limiter.limit("30/minute")
+async def get_topic_history(
+    request: Request,
+    prefix: str = "",
+    hours: int = 24,
+    broker: Optional[str] = None,
+    user: dict = Depends(require_stats_access)
+):
+    """Get stored traffic snapshots of a topic prefix"""
+    await log_request(request)
+    stats = get_broker(broker)
+    
+    prefix = prefix.strip('/')
+    if prefix and len(prefix.split('/')) > TOPIC_HISTORY_DEPTH:
+        raise HTTPException(
+            status_code=400,
+            detail=f"History is only kept for prefixes up to {TOPIC_HISTORY_DEPTH} levels deep"
+        )
+    return await stats.data_storage.aio.get_topic_traffic(
+        prefix,
+        hours=max(1, min(hours, TOPIC_HISTORY_DAYS * 24))
+    )
+
+@app.get("/api/v1/stats/payload-sizes")
+@limiter.limit("30/minute")
+async def get_payload_sizes(
+    request: Request,
+    buckets: bool = False,
+    broker: Optional[str] = None,
+    user: dict = Depends(require_stats_access)
+):
+    """Get payload size percentiles overall and per configured topic prefix
+    
+    History is available from /api/v1/stats/history, e.g. metric=payload_size_p99:sensors
+    """
+    await log_request(request)
+    stats = get_broker(broker)
+    
+    return stats.payload_sizes.summaries(include_buckets=buckets)
+
+@app.get("/api/v1/stats/latency")
+@limiter.limit("30/minute")
+async def get_latency_stats(
+    request: Request,
+    broker: Optional[str] = None,
+    user: dict = Depends(require_stats_access)
+):
+    """Get broker latency percentiles measured by the synthetic probes
+    
+    History is available from /api/v1/stats/history, e.g. metric=probe_qos1_rtt_p99_ms
+    """
+    await log_request(request)
+    stats = get_broker(broker)
+    
+    return {
+        "enabled": LATENCY_PROBE_INTERVAL > 0,
+        "interval_seconds": LATENCY_PROBE_INTERVAL,
+        **stats.latency_probe.summary()
+    }
+
+@app.get("/api/v1/stats/sampling")
+@limiter.limit("30/minute")
+async def get_sampling_stats(
+    request: Request,
+    broker: Optional[str] = None,
+    user: dict = Depends(require_stats_access)
+):
+    """Get the sampled-ingestion state and the latest scaled-up traffic estimate
+    
+    `last_period.estimated_messages` ± `error_bound_95` is the cluster-sample
+    estimate of all user messages in the period; `sys_messages` is the exact
+    broker count from $SYS it can be checked against.
+    """
+    await log_request(request)
+    stats = get_broker(broker)
+    
+    return stats.sampler.summary()
+
+@app.get("/api/v1/stats/history")
+@limiter.limit("30/minute")
+async def get_metric_history(
+    request: Request,
+    metric: str = "bytes_received",
+    start: Optional[int] = None,
+    end: Optional[int] = None,
+    max_points: int = 500,
+    broker: Optional[str] = None,
+    user: dict = Depends(require_stats_access)
+):
+    """Get a metric's history from the rollup tier that fits the requested epoch range"""
+    await log_request(request)
+    stats = get_broker(broker)
+    
+    end = end if end is not None else int(time.time())
+    start = start if start is not None else end - 86400
+    if start > end:
+        raise HTTPException(status_code=400, detail="start must not be after end")
+    
+    try:
+        return await stats.data_storage.aio.get_metric_history(
+            metric, start, end, max_points=max(1, min(max_points, 5000))
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/api/v1/stats/connections")
+@limiter.limit("30/minute")
+async def get_connection_history(
+    request: Request,
+    hours: int = 168,
+    broker: Optional[str] = None,
+    user: dict = Depends(require_stats_access)
+):
+    """Get hourly client connects, disconnects and distinct clients
+    
+    This history is rebuilt from the broker's logs with log_backfill.py.
+    """
+    await log_request(request)
+    stats = get_broker(broker)
+    
+    end = int(time.time())
+    start = end - max(1, min(hours, HISTORY_RETENTION_DAYS["connections"] * 24)) * 3600
+    return {"hours": await stats.data_storage.aio.get_connection_history(start, end)}
+
+@app.get("/api/v1/stats/export")
+@limiter.limit("10/minute")
+async def export_metric_history(
+    request: Request,
+    metric: str = "bytes_received",
+    start: Optional[int] = Query(None, alias="from"),
+    end: Optional[int] = Query(None, alias="to"),
+    step: Optional[int] = None,
+    tier: Optional[str] = None,
+    format: str = "csv",
+    broker: Optional[str] = None,
+    user: dict = Depends(require_stats_access)
+):
+    """Stream a metric's history between two epoch timestamps as CSV or NDJSON
+    
+    Rows are read from SQLite in batches while the response is sent, so any
+    range can be exported. `step` aggregates rows into buckets of that many
+    seconds; `tier` (raw, hour, day, month) forces the source resolution.
+    """
+    await log_request(request)
+    stats = get_broker(broker)
+    
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Invalid format. Use one of: {', '.join(EXPORT_FORMATS)}")
+    end = end if end is not None else int(time.time())
+    start = start if start is not None else end - 86400
+    if start > end:
+        raise HTTPException(status_code=400, detail="from must not be after to")
+    
+    try:
+        rows = stats.data_storage.export_metric_rows(metric, start, end, step=step, tier=tier)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    filename = re.sub(r'[^A-Za-z0-9_.-]+', '_', f"{stats.name}-{metric}-{start}-{end}.{format}")
+    return StreamingResponse(
+        encode_rows(format, metric, rows),
+        media_type=EXPORT_FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+@app.get("/api/v1/anomalies")
+@limiter.limit("30/minute")
+async def get_anomalies(
+    request: Request,
+    hours: int = 24,
+    metric: Optional[str] = None,
+    limit: int = 100,
+    broker: Optional[str] = None,
+    user: dict = Depends(require_stats_access)
+):
+    """Get open anomaly episodes, stored episodes of the last `hours`, and detector state
+    
+    Watched series: published_rate, bytes_received_rate, bytes_sent_rate and
+    connected_clients. An episode is a run of consecutive anomalous samples.
+    """
+    await log_request(request)
+    stats = get_broker(broker)
+    
+    if metric is not None and metric not in ANOMALY_METRICS:
+        raise HTTPException(status_code=400, detail=f"Invalid metric. Use one of: {', '.join(ANOMALY_METRICS)}")
+    end = int(time.time())
+    start = end - max(1, min(hours, HISTORY_RETENTION_DAYS["anomalies"] * 24)) * 3600
+    return {
+        "active": [e for e in stats.anomalies.active() if metric is None or e["metric"] == metric],
+        "episodes": await stats.data_storage.aio.get_anomalies(
+            start, end, metric=metric, limit=max(1, min(limit, 1000))
+        ),
+        "detectors": stats.anomalies.summary()
+    }
+
+class AlertRuleRequest(BaseModel):
+    name: str
+    expression: str
+    for_seconds: Optional[int] = None
+    hysteresis: float = ALERT_HYSTERESIS
+    webhook_url: Optional[str] = None
+
+@app.get("/api/v1/alerts")
+@limiter.limit("30/minute")
+async def get_alerts(
+    request: Request,
+    hours: int = 24,
+    limit: int = 100,
+    broker: Optional[str] = None,
+    user: dict = Depends(require_stats_access)
+):
+    """Get firing alerts, alert transitions of the last `hours`, and webhook delivery status"""
+    await log_request(request)
+    stats = get_broker(broker)
+    
+    end = int(time.time())
+    start = end - max(1, min(hours, HISTORY_RETENTION_DAYS["alerts"] * 24)) * 3600
+    return {
+        "firing": stats.alerts.firing(),
+        "events": await stats.data_storage.aio.get_alert_events(start, end, limit=max(1, min(limit, 1000))),
+        "last_evaluated": stats.alerts.last_evaluated,
+        "webhooks": alert_notifier.stats()
+    }
+
+@app.get("/api/v1/alerts/rules")
+@limiter.limit("30/minute")
+async def list_alert_rules(
+    request: Request,
+    broker: Optional[str] = None,
+    user: dict = Depends(require_stats_access)
+):
+    """List the alert rules of a broker with their current state"""
+    await log_request(request)
+    stats = get_broker(broker)
+    
+    return {"rules": stats.alerts.list_rules(), "metrics": list(ALERT_METRICS)}
+
+@app.post("/api/v1/alerts/rules")
+@limiter.limit("30/minute")
+async def create_alert_rule(
+    request: Request,
+    rule: AlertRuleRequest,
+    broker: Optional[str] = None,
+    admin_user: dict = Depends(require_admin)
+):
+    """Create an alert rule (Admin only)
+    
+    Expressions take the forms `bytes_sent_15min > 5M for 2m` (operators
+    >, >=, <, <=) and `connected_clients drops 20% in 5m` (drops or rises).
+    A firing rule resolves once its metric is back past the threshold by
+    `hysteresis` of it.
+    """
+    await log_request(request)
+    stats = get_broker(broker)
+    
+    try:
+        metric = parse_rule_expression(rule.expression)["metric"]
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if metric not in ALERT_METRICS and "/" not in metric:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid metric. Use one of: {', '.join(ALERT_METRICS)}, or a $SYS metric name"
+        )
+    if not rule.name.strip() or len(rule.name) > 200:
+        raise HTTPException(status_code=400, detail="Rule name must be 1-200 characters")
+    if not 0 <= rule.hysteresis < 1:
+        raise HTTPException(status_code=400, detail="hysteresis must be between 0 and 1")
+    if rule.for_seconds is not None and rule.for_seconds < 0:
+        raise HTTPException(status_code=400, detail="for_seconds must not be negative")
+    if rule.webhook_url and not re.match(r'^https?://', rule.webhook_url):
+        raise HTTPException(status_code=400, detail="webhook_url must be an http(s) URL")
+    
+    rule_id = await stats.data_storage.aio.add_alert_rule(
+        rule.name.strip(), rule.expression, rule.hysteresis,
+        for_seconds=rule.for_seconds, webhook_url=rule.webhook_url or None
+    )
+    alert_rule = AlertRule(
+        rule_id, rule.name.strip(), rule.expression, hysteresis=rule.hysteresis,
+        webhook_url=rule.webhook_url or None, for_seconds=rule.for_seconds
+    )
+    stats.alerts.add(alert_rule)
+    logger.info(f"Alert rule {rule_id} created on broker {stats.name} by {admin_user.get('email')}: {rule.expression}")
+    return alert_rule.describe()
+
+@app.delete("/api/v1/alerts/rules/{rule_id}")
+@limiter.limit("30/minute")
+async def delete_alert_rule(
+    request: Request,
+    rule_id: int,
+    broker: Optional[str] = None,
+    admin_user: dict = Depends(require_admin)
+):
+    """Delete an alert rule (Admin only)"""
+    await log_request(request)
+    stats = get_broker(broker)
+    
+    if not await stats.data_storage.aio.delete_alert_rule(rule_id):
+        raise HTTPException(status_code=404, detail=f"Unknown alert rule {rule_id}")
+    stats.alerts.remove(rule_id)
+    logger.info(f"Alert rule {rule_id} deleted on broker {stats.name} by {admin_user.get('email')}")
+    return {"deleted": rule_id}
+
+@app.get("/api/v1/sys-metrics")
+@limiter.limit("30/minute")
+async def list_sys_metrics(
+    request: Request,
+    broker: Optional[str] = None,
+    user: dict = Depends(require_stats_access)
+):
+    """List every discovered $SYS metric with its inferred type and latest value"""
+    await log_request(request)
+    stats = get_broker(broker)
+    
+    return {"metrics": stats.sys_metrics.list_metrics()}
+
+@app.get("/api/v1/sys-metrics/query")
+@limiter.limit("60/minute")
+async def query_sys_metric(
+    request: Request,
+    metric: str,
+    seconds: int = 3600,
+    resolution: Optional[int] = None,
+    broker: Optional[str] = None,
+    user: dict = Depends(require_stats_access)
+):
+    """Get the recent series of one $SYS metric, e.g. metric=load/messages/received/1min"""
+    await log_request(request)
+    stats = get_broker(broker)
+    
+    try:
+        result = stats.sys_metrics.query(metric, seconds=max(1, seconds), resolution=resolution)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if result is None:
+        raise HTTPException(status_code=404, detail=f"Unknown $SYS metric '{metric}'")
+    return result
+
+@app.get("/api/v1/brokers")
+@limiter.limit("30/minute")
+async def list_brokers(
+    request: Request,
+    user: dict = Depends(require_stats_access)
+):
+    """List the monitored brokers with their headline stats, and totals across all of them
+    
+    Per-broker detail is served by the other stats endpoints with `?broker=<name>`.
+    """
+    await log_request(request)
+    
+    summaries = [stats.summary() for stats in brokers.values()]
+    totals = {
+        key: sum(summary[key] for summary in summaries)
+        for key in ("connected_clients", "subscriptions", "retained_messages", "messages_sent",
+                    "messages_received", "bytes_received_15min", "bytes_sent_15min")
+    }
+    totals["brokers_connected"] = sum(summary["mqtt_connected"] for summary in summaries)
+    return {"default": mqtt_stats.name, "brokers": summaries, "totals": totals}
+
+@app.get("/metrics")
+async def prometheus_metrics(request: Request):
+    """Prometheus text exposition, pre-rendered by the background collector
+    
+    Requires `Authorization: Bearer <METRICS_TOKEN>` when METRICS_TOKEN is set.
+    """
+    if METRICS_TOKEN and not secrets.compare_digest(
+        request.headers.get("authorization", ""), f"Bearer {METRICS_TOKEN}"
+    ):
+        raise HTTPException(status_code=401, detail="Invalid metrics token")
+    return Response(content=prometheus_exporter.body, media_type=PrometheusExporter.CONTENT_TYPE)
+
+@app.get("/api/v1/debug/metrics")
+@limiter.limit("30/minute")
+async def get_debug_metrics(
+    request: Request,
+    admin_user: dict = Depends(require_admin)
+):
+    """Self-instrumentation of the monitor (Admin only)
+    
+    Per broker: on_message and ingest batch timing histograms, wait time on
+    the stats lock, SQLite read/write latencies, and the share of the
+    broker's received publishes the monitor saw. Also per collector task
+    durations. Histogram buckets are keyed by their upper bound in ms.
+    """
+    await log_request(request)
+    
+    return {
+        "brokers": {name: stats.debug_metrics() for name, stats in brokers.items()},
+        "collector_tasks": background_collector.scheduler.stats(),
+        "alert_webhooks": alert_notifier.stats(),
+        "auth": get_verifier().stats(),
+    }
+
 @app.get("/api/v1/admin/users")
 async def list_users(
     admin_user: dict = Depends(require_admin),
@@ -447,8 +1665,11 @@ async def health_check():
     return {
         "status": "healthy",
         "background_collector_running": background_collector.is_running,
+        "collector_tasks": background_collector.scheduler.stats(),
         "mqtt_connected": mqtt_stats.connected_clients > 0,
-        "last_data_update": mqtt_stats.last_update.isoformat()
+        "last_data_update": mqtt_stats.last_update.isoformat(),
+        "brokers": {name: stats.connected_clients > 0 for name, stats in brokers.items()},
+        "ingest_completeness": {name: stats.ingest_completeness.ratio() for name, stats in brokers.items()}
     }
 
 if __name__ == "__main__":
@@ -47,7 +47,7 @@ class DataCollectionMonitor:
             cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
             tables = [row[0] for row in cursor.fetchall()]
             
-            required_tables = ['stats', 'daily_message_counts']
+            required_tables = ['stats', 'hourly_stats', 'daily_message_counts']
             missing_tables = [table for table in required_tables if table not in tables]
             
             print(f"Database tables: {tables}")
@@ -61,6 +61,10 @@ class DataCollectionMonitor:
             stats_columns = [col[1] for col in cursor.fetchall()]
             print(f"Stats table columns: {stats_columns}")
             
+            cursor.execute("PRAGMA table_info(hourly_stats)")
+            hourly_columns = [col[1] for col in cursor.fetchall()]
+            print(f"Hourly stats table columns: {hourly_columns}")
+            
             cursor.execute("PRAGMA table_info(daily_message_counts)")
             daily_columns = [col[1] for col in cursor.fetchall()]
             print(f"Daily message counts columns: {daily_columns}")
@@ -82,27 +86,25 @@ class DataCollectionMonitor:
             
             # Check hourly data from last 24 hours
             cursor.execute("""
-                SELECT COUNT(*) FROM stats 
-                WHERE data_type = 'hourly' 
-                AND timestamp >= datetime('now', '-24 hours')
+                SELECT COUNT(*) FROM hourly_stats 
+                WHERE timestamp >= CAST(strftime('%s', 'now', '-24 hours') AS INTEGER)
             """)
             hourly_count = cursor.fetchone()[0]
             results['hourly_records_24h'] = hourly_count
             
             # Get latest hourly record
             cursor.execute("""
-                SELECT timestamp, json_data FROM stats 
-                WHERE data_type = 'hourly' 
+                SELECT strftime('%Y-%m-%dT%H:%M:%SZ', timestamp, 'unixepoch'), bytes_received, bytes_sent
+                FROM hourly_stats 
                 ORDER BY timestamp DESC LIMIT 1
             """)
             latest_hourly = cursor.fetchone()
             if latest_hourly:
                 results['latest_hourly_timestamp'] = latest_hourly[0]
-                try:
-                    data = json.loads(latest_hourly[1])
-                    results['latest_hourly_data'] = data
-                except:
-                    results['latest_hourly_data'] = "Error parsing JSON"
+                results['latest_hourly_data'] = {
+                    'bytes_received': latest_hourly[1],
+                    'bytes_sent': latest_hourly[2]
+                }
             
             # Check daily message data
             cursor.execute("SELECT COUNT(*) FROM daily_message_counts")
@@ -0,0 +1,178 @@
+# Copyright (c) 2025 BunkerM
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# You may not use this file except in compliance with the License.
+# http://www.apache.org/licenses/LICENSE-2.0
+# Distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND.
+#
+# mqtt_ingest.py
+import asyncio
+import logging
+from typing import Callable, Dict, List, Optional
+
+from paho.mqtt import client as mqtt_client
+
+logger = logging.getLogger(__name__)
+
+# Packets read per socket wake-up before yielding back to the event loop
+_MAX_READS_PER_WAKEUP = 64
+
+
+class MessageBatch:
+    """User messages received during one batch interval, grouped by topic"""
+
+    __slots__ = ("topics", "messages")
+
+    def __init__(self):
+        self.topics: Dict[str, List] = {}  # topic -> [messages, bytes, [sizes]]
+        self.messages = 0
+
+    def add(self, topic: str, payload_size: int):
+        entry = self.topics.get(topic)
+        if entry is None:
+            self.topics[topic] = [1, payload_size, [payload_size]]
+        else:
+            entry[0] += 1
+            entry[1] += payload_size
+            entry[2].append(payload_size)
+        self.messages += 1
+
+
+class AsyncioMQTTIngest:
+    """Runs a paho client's network I/O on the asyncio event loop.
+
+    Instead of `loop_start()`'s thread, the client socket is registered with
+    `loop.add_reader()`/`add_writer()` and keep-alives and reconnects are
+    driven by a supervisor task. Callbacks therefore run on the event loop
+    thread, so `on_message` can append to the current `MessageBatch` via
+    `add()` without locking. Only the blocking connect (DNS lookup and TCP
+    handshake) runs in a worker thread, so an unreachable broker does not
+    stall the loop; the socket is registered back on the loop. Every
+    `batch_interval` seconds the batch is swapped out and handed to
+    `on_batch`, which applies it to shared state once.
+    """
+
+    def __init__(self, client: mqtt_client.Client, host: str, port: int,
+                 on_message: Callable, on_batch: Callable[[MessageBatch], None],
+                 batch_interval: float = 0.1, keepalive: int = 60, reconnect_delay: float = 5.0):
+        self.client = client
+        self.host = host
+        self.port = port
+        self.on_batch = on_batch
+        self.batch_interval = batch_interval
+        self.keepalive = keepalive
+        self.reconnect_delay = reconnect_delay
+        self.batch = MessageBatch()
+        self.messages_read = 0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._tasks: List[asyncio.Task] = []
+        self._connected_once = False
+
+        self._on_message = on_message
+        client.on_message = self._dispatch
+        client.on_socket_open = self._on_socket_open
+        client.on_socket_close = self._on_socket_close
+        client.on_socket_register_write = self._on_socket_register_write
+        client.on_socket_unregister_write = self._on_socket_unregister_write
+
+    def add(self, topic: str, payload_size: int):
+        """Queue one user message; must be called from the event loop thread"""
+        self.batch.add(topic, payload_size)
+
+    def _dispatch(self, client, userdata, msg):
+        self.messages_read += 1
+        self._on_message(client, userdata, msg)
+
+    def _on_loop(self, callback: Callable, sock):
+        """Run `callback(sock)` on the event loop thread.
+
+        connect()/reconnect() run in a worker thread, and paho opens the
+        socket and queues CONNECT from there.
+        """
+        try:
+            on_loop = asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            on_loop = False
+        if on_loop:
+            callback(sock)
+        else:
+            self._loop.call_soon_threadsafe(callback, sock)
+
+    def _add_reader(self, sock):
+        if self.client.socket() is sock:
+            self._loop.add_reader(sock, self._read)
+
+    def _add_writer(self, sock):
+        if self.client.socket() is sock:
+            self._loop.add_writer(sock, self.client.loop_write)
+
+    def _remove(self, sock):
+        if sock.fileno() < 0:
+            return  # closed by a failed connect before it was ever registered
+        self._loop.remove_reader(sock)
+        self._loop.remove_writer(sock)
+
+    def _on_socket_open(self, client, userdata, sock):
+        self._on_loop(self._add_reader, sock)
+
+    def _on_socket_close(self, client, userdata, sock):
+        self._on_loop(self._remove, sock)
+
+    def _on_socket_register_write(self, client, userdata, sock):
+        self._on_loop(self._add_writer, sock)
+
+    def _on_socket_unregister_write(self, client, userdata, sock):
+        self._on_loop(self._loop.remove_writer, sock)
+
+    def _read(self):
+        # loop_read() handles one packet per call; keep reading while messages
+        # arrive so a busy socket costs one event loop wake-up per burst
+        for _ in range(_MAX_READS_PER_WAKEUP):
+            before = self.messages_read
+            if self.client.loop_read() != mqtt_client.MQTT_ERR_SUCCESS or self.messages_read == before:
+                break
+
+    def flush(self):
+        """Hand the current batch to `on_batch` and start a new one"""
+        batch, self.batch = self.batch, MessageBatch()
+        if batch.messages:
+            self.on_batch(batch)
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.batch_interval)
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Error applying ingest batch: {e}")
+
+    async def _supervise(self):
+        """Keep the connection alive and reconnect when it drops"""
+        while True:
+            if self.client.socket() is None:
+                try:
+                    if self._connected_once:
+                        await asyncio.to_thread(self.client.reconnect)
+                    else:
+                        await asyncio.to_thread(self.client.connect, self.host, self.port, self.keepalive)
+                        self._connected_once = True
+                except OSError as e:
+                    logger.error(f"Connection to MQTT broker failed: {e}")
+                    await asyncio.sleep(self.reconnect_delay)
+                    continue
+            self.client.loop_misc()
+            await asyncio.sleep(1)
+
+    async def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._tasks = [
+            asyncio.create_task(self._supervise()),
+            asyncio.create_task(self._flush_loop()),
+        ]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self.flush()
+        self.client.disconnect()
@@ -0,0 +1,187 @@
+# Copyright (c) 2025 BunkerM
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# You may not use this file except in compliance with the License.
+# http://www.apache.org/licenses/LICENSE-2.0
+# Distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND.
+#
+# payload_stats.py
+import threading
+from array import array
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# MQTT caps payloads at 256 MB, so sizes never need more than 28 bits
+_MAX_VALUE_BITS = 28
+
+
+class LogHistogram:
+    """HDR-style histogram of non-negative integers with fixed memory.
+
+    Values below 2**SUB_BUCKET_BITS get exact buckets. Each larger power of
+    two is split into 2**SUB_BUCKET_BITS linear sub-buckets, so a reported
+    percentile is within 1 / 2**SUB_BUCKET_BITS (12.5%) of the true value.
+    """
+
+    SUB_BUCKET_BITS = 3
+    SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+    NUM_BUCKETS = SUB_BUCKETS + (_MAX_VALUE_BITS - SUB_BUCKET_BITS) * SUB_BUCKETS
+
+    __slots__ = ("counts", "count", "total", "max")
+
+    def __init__(self):
+        self.counts = array('q', [0]) * self.NUM_BUCKETS
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    @classmethod
+    def bucket_index(cls, value: int) -> int:
+        if value < cls.SUB_BUCKETS:
+            return value
+        shift = value.bit_length() - cls.SUB_BUCKET_BITS - 1
+        index = cls.SUB_BUCKETS * (shift + 1) + (value >> shift) - cls.SUB_BUCKETS
+        return min(index, cls.NUM_BUCKETS - 1)
+
+    @classmethod
+    def bucket_upper_bound(cls, index: int) -> int:
+        """Largest value that falls into bucket `index`"""
+        if index < cls.SUB_BUCKETS:
+            return index
+        shift, sub_bucket = divmod(index - cls.SUB_BUCKETS, cls.SUB_BUCKETS)
+        return ((cls.SUB_BUCKETS + sub_bucket + 1) << shift) - 1
+
+    def record(self, value: int):
+        self.counts[self.bucket_index(value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def reset(self):
+        for i in range(self.NUM_BUCKETS):
+            self.counts[i] = 0
+        self.count = self.total = self.max = 0
+
+    def percentiles(self, quantiles: Iterable[float]) -> List[int]:
+        """Return the value at each quantile (ascending, in [0, 1]) in a single pass"""
+        results = []
+        if not self.count:
+            return [0 for _ in quantiles]
+        targets = iter(quantiles)
+        target = next(targets, None)
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            if not bucket_count:
+                continue
+            seen += bucket_count
+            while target is not None and seen >= max(1, target * self.count):
+                results.append(min(self.bucket_upper_bound(index), self.max))
+                target = next(targets, None)
+            if target is None:
+                break
+        return results
+
+    def summary(self) -> Dict:
+        p50, p90, p99 = self.percentiles((0.5, 0.9, 0.99))
+        return {
+            "count": self.count,
+            "total_bytes": self.total,
+            "p50": p50,
+            "p90": p90,
+            "p99": p99,
+            "max": self.max,
+        }
+
+    def buckets(self) -> List[Tuple[int, int]]:
+        """Non-empty buckets as (upper bound, count) pairs"""
+        return [
+            (self.bucket_upper_bound(index), bucket_count)
+            for index, bucket_count in enumerate(self.counts)
+            if bucket_count
+        ]
+
+
+class PayloadSizeStats:
+    """Payload size histograms for all traffic and for configured topic prefixes.
+
+    A message is counted in the overall histogram and in the histogram of
+    the longest configured prefix that contains its topic. Each prefix has a
+    cumulative histogram for the API and an interval histogram that
+    `drain_interval()` hands to the history rollups and then resets.
+    """
+
+    ALL = ""
+
+    def __init__(self, prefixes: Iterable[str] = ()):
+        self.prefixes = sorted({p.strip('/') for p in prefixes if p.strip('/')}, key=len, reverse=True)
+        self._match = [(prefix, prefix + '/') for prefix in self.prefixes]
+        keys = [self.ALL, *self.prefixes]
+        self.cumulative: Dict[str, LogHistogram] = {key: LogHistogram() for key in keys}
+        self.interval: Dict[str, LogHistogram] = {key: LogHistogram() for key in keys}
+        self.started_at = datetime.now(timezone.utc).isoformat().replace('+00:00', 'Z')
+        self._lock = threading.Lock()
+
+    def _prefix_of(self, topic: str) -> Optional[str]:
+        for prefix, prefix_with_slash in self._match:
+            if topic.startswith(prefix_with_slash) or topic == prefix:
+                return prefix
+        return None
+
+    def record(self, topic: str, payload_size: int):
+        prefix = self._prefix_of(topic) if self._match else None
+        with self._lock:
+            self.cumulative[self.ALL].record(payload_size)
+            self.interval[self.ALL].record(payload_size)
+            if prefix is not None:
+                self.cumulative[prefix].record(payload_size)
+                self.interval[prefix].record(payload_size)
+
+    def record_batch(self, sizes_by_topic: Dict[str, List[int]]):
+        """Record the payload sizes of a batch of messages, grouped by topic"""
+        grouped = [
+            (self._prefix_of(topic) if self._match else None, sizes)
+            for topic, sizes in sizes_by_topic.items()
+        ]
+        with self._lock:
+            overall = self.cumulative[self.ALL], self.interval[self.ALL]
+            for prefix, sizes in grouped:
+                histograms = overall if prefix is None else (
+                    *overall, self.cumulative[prefix], self.interval[prefix]
+                )
+                for histogram in histograms:
+                    for size in sizes:
+                        histogram.record(size)
+
+    def summaries(self, include_buckets: bool = False) -> Dict:
+        with self._lock:
+            prefixes = []
+            for key, histogram in self.cumulative.items():
+                entry = {"prefix": key, **histogram.summary()}
+                if include_buckets:
+                    entry["buckets"] = histogram.buckets()
+                prefixes.append(entry)
+        return {"since": self.started_at, "prefixes": prefixes}
+
+    def drain_interval(self) -> Dict[str, float]:
+        """Summarise traffic since the previous drain as rollup metric samples.
+
+        Metrics are named `payload_size_<stat>` for all traffic and
+        `payload_size_<stat>:<prefix>` per prefix. Prefixes without traffic
+        in the interval produce no samples.
+        """
+        samples = {}
+        with self._lock:
+            for key, histogram in self.interval.items():
+                if not histogram.count:
+                    continue
+                summary = histogram.summary()
+                suffix = f":{key}" if key else ""
+                samples[f"payload_size_p50{suffix}"] = summary["p50"]
+                samples[f"payload_size_p90{suffix}"] = summary["p90"]
+                samples[f"payload_size_p99{suffix}"] = summary["p99"]
+                samples[f"payload_size_max{suffix}"] = summary["max"]
+                samples[f"payload_bytes{suffix}"] = summary["total_bytes"]
+                samples[f"payload_messages{suffix}"] = summary["count"]
+                histogram.reset()
+        return samples
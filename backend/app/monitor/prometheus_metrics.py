@@ -0,0 +1,89 @@
+# Copyright (c) 2025 BunkerM
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# You may not use this file except in compliance with the License.
+# http://www.apache.org/licenses/LICENSE-2.0
+# Distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND.
+#
+# prometheus_metrics.py
+import re
+import time
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+_INVALID_NAME_CHARS = re.compile(r'[^a-zA-Z0-9_]')
+_REPEATED_UNDERSCORES = re.compile(r'__+')
+
+
+class MetricSample(NamedTuple):
+    name: str
+    kind: str  # "counter", "gauge" or "untyped"
+    help: str
+    value: float
+    labels: Tuple[Tuple[str, str], ...] = ()
+
+
+def metric_name(*parts: str) -> str:
+    """Build a valid Prometheus metric name, e.g. ("mosquitto", "load/bytes/sent/1min")"""
+    name = _INVALID_NAME_CHARS.sub('_', '_'.join(parts))
+    return _REPEATED_UNDERSCORES.sub('_', name).strip('_').lower()
+
+
+def _format_value(value: float) -> str:
+    if value != value:
+        return "NaN"
+    if value in (float('inf'), float('-inf')):
+        return "+Inf" if value > 0 else "-Inf"
+    if float(value).is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape_label_value(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels: Tuple[Tuple[str, str], ...]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape_label_value(str(value))}"' for key, value in labels) + "}"
+
+
+class PrometheusExporter:
+    """Holds the Prometheus text exposition of the monitor's metrics.
+
+    The background collector calls `update()` once per tick; a scrape of
+    `/metrics` only returns the already-encoded `body`, so scrape cost does
+    not depend on how many metrics are exported.
+    """
+
+    CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+    def __init__(self):
+        self.body = b""
+        self.rendered_at: Optional[float] = None
+
+    @staticmethod
+    def render(samples: Iterable[MetricSample]) -> bytes:
+        # Series of the same metric are grouped under one HELP/TYPE header
+        families: Dict[str, List] = {}
+        for sample in samples:
+            name = sample.name
+            if sample.kind == "counter" and not name.endswith("_total"):
+                name += "_total"
+            family = families.setdefault(name, [sample, {}])
+            # Two $SYS topics can sanitize to the same name; keep the first
+            family[1].setdefault(sample.labels, sample.value)
+
+        lines: List[str] = []
+        for name, (first, series) in families.items():
+            help_text = first.help.replace('\\', '\\\\').replace('\n', '\\n')
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {first.kind}")
+            for labels, value in series.items():
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        lines.append("")
+        return "\n".join(lines).encode()
+
+    def update(self, samples: Iterable[MetricSample]):
+        self.body = self.render(samples)
+        self.rendered_at = time.time()
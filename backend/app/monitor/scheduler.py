@@ -0,0 +1,155 @@
+# Copyright (c) 2025 BunkerM
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# You may not use this file except in compliance with the License.
+# http://www.apache.org/licenses/LICENSE-2.0
+# Distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND.
+#
+# scheduler.py
+import asyncio
+import logging
+import random
+import time
+from typing import Callable, Dict, List, Optional
+
+from instrumentation import LatencyHistogram
+
+logger = logging.getLogger(__name__)
+
+
+class PeriodicTask:
+    """A registered job with its cadence and timing statistics"""
+
+    def __init__(self, name: str, interval: float, func: Callable, blocking: bool,
+                 jitter: float, initial_delay: float):
+        self.name = name
+        self.interval = interval
+        self.func = func
+        self.blocking = blocking
+        self.jitter = jitter
+        self.initial_delay = initial_delay
+        self.runs = 0
+        self.failures = 0
+        self.overruns = 0
+        self.skipped = 0
+        self.last_duration = 0.0
+        self.max_duration = 0.0
+        self.total_duration = 0.0
+        self.durations = LatencyHistogram()
+        self.last_run_at: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self.in_flight: Optional[asyncio.Future] = None
+
+    def stats(self) -> Dict:
+        return {
+            "name": self.name,
+            "interval_seconds": self.interval,
+            "blocking": self.blocking,
+            "runs": self.runs,
+            "failures": self.failures,
+            "overruns": self.overruns,
+            "skipped_runs": self.skipped,
+            "last_duration_ms": round(self.last_duration * 1000, 3),
+            "avg_duration_ms": round(self.total_duration / self.runs * 1000, 3) if self.runs else None,
+            "p99_duration_ms": self.durations.summary()["p99_ms"],
+            "max_duration_ms": round(self.max_duration * 1000, 3),
+            "last_run_at": self.last_run_at,
+            "last_error": self.last_error,
+        }
+
+
+class TaskScheduler:
+    """Runs periodic jobs on fixed monotonic-clock cadences.
+
+    Each job's due times are `start + k * interval`, so a slow run never
+    shifts later ones; random jitter delays an individual run but is never
+    carried over. A run that lasts past its next due time is an overrun: the
+    missed runs are skipped rather than queued. Jobs run concurrently with
+    each other; `blocking` jobs (SQLite, network I/O) are executed on a
+    worker thread so they never stall the event loop.
+    """
+
+    def __init__(self):
+        self.tasks: Dict[str, PeriodicTask] = {}
+        self._runners: List[asyncio.Task] = []
+
+    def register(self, name: str, interval: float, func: Callable, blocking: bool = False,
+                 jitter: float = 0.0, initial_delay: Optional[float] = None):
+        """Register `func` to run every `interval` seconds.
+
+        `jitter` is the largest random delay, in seconds, added to each run.
+        The first run happens after `initial_delay`, or one interval when
+        omitted.
+        """
+        if name in self.tasks:
+            raise ValueError(f"Task '{name}' is already registered")
+        if interval <= 0:
+            raise ValueError(f"Task '{name}' needs a positive interval")
+        self.tasks[name] = PeriodicTask(
+            name, interval, func, blocking, jitter,
+            interval if initial_delay is None else initial_delay
+        )
+
+    async def _run_task(self, task: PeriodicTask):
+        due = time.monotonic() + task.initial_delay
+        while True:
+            delay = due - time.monotonic()
+            if task.jitter:
+                delay += random.uniform(0, task.jitter)
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+            started = time.monotonic()
+            try:
+                if task.blocking:
+                    # Shielded so stop() can wait for the thread instead of abandoning it
+                    task.in_flight = asyncio.ensure_future(asyncio.to_thread(task.func))
+                    await asyncio.shield(task.in_flight)
+                else:
+                    result = task.func()
+                    if asyncio.iscoroutine(result):
+                        await result
+                task.last_error = None
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                task.failures += 1
+                task.last_error = str(e)
+                logger.error(f"Scheduled task '{task.name}' failed: {e}")
+            finished = time.monotonic()
+
+            duration = finished - started
+            task.runs += 1
+            task.last_duration = duration
+            task.total_duration += duration
+            task.max_duration = max(task.max_duration, duration)
+            task.durations.record(int(duration * 1e9))
+            task.last_run_at = time.time()
+
+            due += task.interval
+            if finished > due:
+                missed = int((finished - due) // task.interval) + 1
+                task.overruns += 1
+                task.skipped += missed
+                due += missed * task.interval
+                logger.warning(
+                    f"Scheduled task '{task.name}' took {duration:.3f}s, "
+                    f"longer than its {task.interval}s interval; skipped {missed} run(s)"
+                )
+
+    def start(self):
+        self._runners = [asyncio.create_task(self._run_task(task)) for task in self.tasks.values()]
+
+    async def stop(self):
+        """Cancel all jobs and wait for blocking runs already on a worker thread"""
+        for runner in self._runners:
+            runner.cancel()
+        await asyncio.gather(*self._runners, return_exceptions=True)
+        await asyncio.gather(
+            *(task.in_flight for task in self.tasks.values() if task.in_flight),
+            return_exceptions=True
+        )
+        self._runners = []
+
+    def stats(self) -> List[Dict]:
+        return [task.stats() for task in self.tasks.values()]
@@ -0,0 +1,110 @@
+# Copyright (c) 2025 BunkerM
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# You may not use this file except in compliance with the License.
+# http://www.apache.org/licenses/LICENSE-2.0
+# Distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND.
+#
+# stats_stream.py
+import asyncio
+import json
+from typing import AsyncIterator, Dict, Optional, Set
+
+
+class StatsSubscriber:
+    """One stream client with a bounded queue of pre-encoded SSE events"""
+
+    def __init__(self, queue_size: int):
+        self.queue: "asyncio.Queue[bytes]" = asyncio.Queue(maxsize=queue_size)
+        self.dropped = 0
+
+    def offer(self, event: bytes, resync: bytes):
+        """Queue an event without blocking the publisher.
+
+        A subscriber whose queue is full has fallen behind. Its backlog is
+        discarded and replaced by a single full snapshot, so it catches up
+        with one message instead of replaying stale deltas.
+        """
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            while not self.queue.empty():
+                self.queue.get_nowait()
+                self.dropped += 1
+            self.queue.put_nowait(resync)
+
+
+class StatsBroadcaster:
+    """Fans out stats changes published by the background collector.
+
+    Each published version is diffed against the previous one and encoded
+    once as a Server-Sent Event, then shared by every subscriber. Clients
+    first receive a `snapshot` event with the full payload, then `delta`
+    events holding only the top-level fields that changed.
+    """
+
+    def __init__(self, queue_size: int = 16, max_subscribers: int = 100, keepalive: float = 15.0):
+        self.queue_size = queue_size
+        self.max_subscribers = max_subscribers
+        self.keepalive = keepalive
+        self.subscribers: Set[StatsSubscriber] = set()
+        self._version = 0
+        self._stats: Dict = {}
+        self._snapshot_event: Optional[bytes] = None
+
+    @staticmethod
+    def _encode(event: str, version: int, data: Dict) -> bytes:
+        payload = json.dumps(data, separators=(',', ':'))
+        return f"id: {version}\nevent: {event}\ndata: {payload}\n\n".encode()
+
+    def publish(self, version: int, body: bytes):
+        """Push a newly published stats version to all subscribers"""
+        if version == self._version:
+            return
+        stats = json.loads(body)
+        delta = {key: value for key, value in stats.items() if self._stats.get(key) != value}
+        delta.update({key: None for key in self._stats.keys() - stats.keys()})
+
+        self._version = version
+        self._stats = stats
+        self._snapshot_event = self._encode("snapshot", version, stats)
+        if not delta or not self.subscribers:
+            return
+
+        delta_event = self._encode("delta", version, delta)
+        for subscriber in self.subscribers:
+            subscriber.offer(delta_event, self._snapshot_event)
+
+    def is_full(self) -> bool:
+        return len(self.subscribers) >= self.max_subscribers
+
+    def subscribe(self) -> Optional[StatsSubscriber]:
+        """Register a subscriber, or return None when the subscriber limit is reached"""
+        if self.is_full():
+            return None
+        subscriber = StatsSubscriber(self.queue_size)
+        if self._snapshot_event is not None:
+            subscriber.queue.put_nowait(self._snapshot_event)
+        self.subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: StatsSubscriber):
+        self.subscribers.discard(subscriber)
+
+    async def events(self, is_disconnected) -> AsyncIterator[bytes]:
+        """Subscribe and yield the events, with keep-alive comments while idle.
+
+        The subscriber is only registered once the response starts iterating,
+        so a client that leaves before that never holds a slot.
+        """
+        subscriber = self.subscribe()
+        if subscriber is None:
+            return  # the limit was reached after the caller checked is_full()
+        try:
+            while not await is_disconnected():
+                try:
+                    yield await asyncio.wait_for(subscriber.queue.get(), timeout=self.keepalive)
+                except asyncio.TimeoutError:
+                    yield b": keepalive\n\n"
+        finally:
+            self.unsubscribe(subscriber)
@@ -0,0 +1,235 @@
+# Copyright (c) 2025 BunkerM
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# You may not use this file except in compliance with the License.
+# http://www.apache.org/licenses/LICENSE-2.0
+# Distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND.
+#
+# sys_metrics.py
+import re
+import threading
+import time
+from array import array
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+# Leading number of a $SYS payload, e.g. "1234" or "3600 seconds"
+_NUMBER = re.compile(r'^\s*(-?\d+(?:\.\d+)?)')
+
+# Mosquitto $SYS topics known to be cumulative counters
+_COUNTER_TOPICS = re.compile(
+    r'/(bytes|messages)/(received|sent)$'
+    r'|/publish/(bytes|messages)/(received|sent|dropped)$'
+    r'|/uptime$'
+)
+
+# Topics that only move up but are levels rather than counters
+_GAUGE_TOPICS = re.compile(r'/load/|/maximum$|/count$|/current$|/connected$|/active$|/total$')
+
+# Observations needed before a metric without a name hint is classified
+_INFERENCE_SAMPLES = 5
+
+DEFAULT_RESOLUTIONS: Tuple[Tuple[int, int], ...] = (
+    (10, 360),     # 10 seconds for 1 hour
+    (60, 1440),    # 1 minute for 1 day
+    (900, 672),    # 15 minutes for 1 week
+)
+
+
+class MetricRing:
+    """Fixed-size ring of time buckets at one resolution.
+
+    Every field is a preallocated `array`, so a ring costs the same memory
+    however many samples it has absorbed.
+    """
+
+    __slots__ = ("resolution", "size", "bucket_ids", "last", "min", "max", "sum", "count")
+
+    def __init__(self, resolution: int, size: int):
+        self.resolution = resolution
+        self.size = size
+        self.bucket_ids = array('q', [-1]) * size
+        self.last = array('d', [0.0]) * size
+        self.min = array('d', [0.0]) * size
+        self.max = array('d', [0.0]) * size
+        self.sum = array('d', [0.0]) * size
+        self.count = array('l', [0]) * size
+
+    def add(self, timestamp: float, value: float):
+        bucket_id = int(timestamp // self.resolution)
+        i = bucket_id % self.size
+        if self.bucket_ids[i] != bucket_id:
+            self.bucket_ids[i] = bucket_id
+            self.min[i] = self.max[i] = self.sum[i] = value
+            self.count[i] = 1
+        else:
+            if value < self.min[i]:
+                self.min[i] = value
+            if value > self.max[i]:
+                self.max[i] = value
+            self.sum[i] += value
+            self.count[i] += 1
+        self.last[i] = value
+
+    def series(self, start: float, end: float) -> List[Tuple[int, float, float, float, float]]:
+        """Return (bucket_start, last, min, max, avg) for populated buckets in [start, end]"""
+        first_id = max(int(start // self.resolution), int(end // self.resolution) - self.size + 1)
+        rows = []
+        for bucket_id in range(first_id, int(end // self.resolution) + 1):
+            i = bucket_id % self.size
+            if self.bucket_ids[i] == bucket_id:
+                rows.append((
+                    bucket_id * self.resolution,
+                    self.last[i],
+                    self.min[i],
+                    self.max[i],
+                    self.sum[i] / self.count[i]
+                ))
+        return rows
+
+
+class SysMetric:
+    def __init__(self, topic: str, resolutions: Tuple[Tuple[int, int], ...]):
+        self.topic = topic
+        self.name = topic.removeprefix('$SYS/broker/')
+        self.kind = "unknown"
+        if _COUNTER_TOPICS.search(topic):
+            self.kind = "counter"
+        elif _GAUGE_TOPICS.search(topic):
+            self.kind = "gauge"
+        self.rings = [MetricRing(resolution, size) for resolution, size in resolutions]
+        self.value: Optional[float] = None
+        self.text: Optional[str] = None
+        self.updated_at = 0.0
+        self._observations = 0
+        self._decreased = False
+
+    def record(self, timestamp: float, payload: str):
+        match = _NUMBER.match(payload)
+        self.updated_at = timestamp
+        if match is None:
+            # Non-numeric $SYS values such as the broker version
+            self.kind = "info"
+            self.text = payload
+            return
+
+        value = float(match.group(1))
+        if self.value is not None and value < self.value:
+            self._decreased = True
+        self.value = value
+        self._observations += 1
+        if self.kind == "unknown" and self._observations >= _INFERENCE_SAMPLES:
+            self.kind = "gauge" if self._decreased else "counter"
+        for ring in self.rings:
+            ring.add(timestamp, value)
+
+    def describe(self) -> Dict:
+        return {
+            "name": self.name,
+            "topic": self.topic,
+            "type": self.kind,
+            "value": self.text if self.kind == "info" else self.value,
+            "updated_at": datetime.fromtimestamp(self.updated_at, timezone.utc).isoformat().replace('+00:00', 'Z'),
+        }
+
+
+class SysMetricRegistry:
+    """Auto-discovers every `$SYS` topic and keeps its history in ring buffers.
+
+    Each numeric topic gets one MetricRing per resolution. Its type is taken
+    from known Mosquitto topic names when possible, and otherwise inferred
+    from its first samples: a value that never decreases is a counter,
+    anything else is a gauge. Counters are queried as per-second rates.
+    """
+
+    def __init__(self, resolutions: Tuple[Tuple[int, int], ...] = DEFAULT_RESOLUTIONS, max_metrics: int = 500):
+        self.resolutions = tuple(sorted(resolutions))
+        self.max_metrics = max_metrics
+        self.metrics: Dict[str, SysMetric] = {}
+        self._lock = threading.Lock()
+
+    def record(self, topic: str, payload: bytes, timestamp: Optional[float] = None):
+        timestamp = time.time() if timestamp is None else timestamp
+        try:
+            text = payload.decode()
+        except UnicodeDecodeError:
+            return
+        with self._lock:
+            metric = self.metrics.get(topic)
+            if metric is None:
+                if len(self.metrics) >= self.max_metrics:
+                    return
+                metric = self.metrics[topic] = SysMetric(topic, self.resolutions)
+            metric.record(timestamp, text)
+
+    def _lookup(self, name: str) -> Optional[SysMetric]:
+        return self.metrics.get(name) or self.metrics.get(f"$SYS/broker/{name}")
+
+    def value(self, name: str) -> Optional[float]:
+        """Latest numeric value of a metric, or None"""
+        with self._lock:
+            metric = self._lookup(name)
+            if metric is None or metric.kind == "info":
+                return None
+            return metric.value
+
+    def list_metrics(self) -> List[Dict]:
+        with self._lock:
+            return sorted((metric.describe() for metric in self.metrics.values()), key=lambda m: m["name"])
+
+    def latest_values(self) -> List[Tuple[str, str, str, float]]:
+        """Return (name, topic, type, value) of every numeric metric seen so far"""
+        with self._lock:
+            return [
+                (metric.name, metric.topic, metric.kind, metric.value)
+                for metric in self.metrics.values()
+                if metric.kind != "info" and metric.value is not None
+            ]
+
+    def query(self, name: str, seconds: int = 3600, resolution: Optional[int] = None,
+              end: Optional[float] = None) -> Optional[Dict]:
+        """Return a metric's series over the last `seconds`.
+
+        Without an explicit `resolution`, the finest ring that spans the
+        whole range is used.
+        """
+        end = time.time() if end is None else end
+        start = end - seconds
+        with self._lock:
+            metric = self._lookup(name)
+            if metric is None:
+                return None
+            if resolution is None:
+                ring = next(
+                    (r for r in metric.rings if r.resolution * r.size >= seconds),
+                    metric.rings[-1]
+                )
+            else:
+                ring = next((r for r in metric.rings if r.resolution == resolution), None)
+                if ring is None:
+                    raise ValueError(
+                        f"Unknown resolution {resolution}; available: {[r.resolution for r in metric.rings]}"
+                    )
+            rows = ring.series(start, end)
+            info = metric.describe()
+
+        result = {
+            **info,
+            "resolution": ring.resolution,
+            "timestamps": [row[0] for row in rows],
+        }
+        if info["type"] == "counter":
+            # Rate between consecutive buckets; a counter reset yields no value
+            rates = [None]
+            for previous, current in zip(rows, rows[1:]):
+                delta = current[1] - previous[1]
+                elapsed = current[0] - previous[0]
+                rates.append(delta / elapsed if delta >= 0 else None)
+            result["rate"] = rates
+            result["last"] = [row[1] for row in rows]
+        else:
+            result["last"] = [row[1] for row in rows]
+            result["min"] = [row[2] for row in rows]
+            result["max"] = [row[3] for row in rows]
+            result["avg"] = [row[4] for row in rows]
+        return result
@@ -0,0 +1,62 @@
+# Copyright (c) 2025 BunkerM
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# You may not use this file except in compliance with the License.
+# http://www.apache.org/licenses/LICENSE-2.0
+# Distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND.
+#
+# test_data_storage.py
+import os
+import sqlite3
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from data_storage import HistoricalDataStorage  # noqa: E402
+
+
+@pytest.fixture
+def storage(tmp_path):
+    storage = HistoricalDataStorage(db_path=str(tmp_path / "history.db"))
+    yield storage
+    storage.close()
+
+
+def test_aborted_transaction_fails_the_whole_batch(storage):
+    """A write that ends the batch's transaction must not leave any future unresolved"""
+    started, release = threading.Event(), threading.Event()
+
+    def block(cursor):
+        started.set()
+        release.wait(5)
+
+    # Hold the writer thread so the next three requests are drained as one batch
+    blocker = storage._submit_write(block)
+    assert started.wait(5)
+
+    def insert(cursor):
+        cursor.execute("INSERT INTO daily_message_counts (date, count) VALUES ('2025-01-01', 1)")
+
+    def end_transaction_and_fail(cursor):
+        # What SQLite does on IOERR/FULL/NOMEM: the transaction is rolled back under us
+        cursor.execute("ROLLBACK")
+        raise sqlite3.OperationalError("disk I/O error")
+
+    before = storage._submit_write(insert)
+    failing = storage._submit_write(end_transaction_and_fail)
+    after = storage._submit_write(insert)
+    release.set()
+    blocker.result(timeout=5)
+
+    with pytest.raises(sqlite3.OperationalError, match="disk I/O error"):
+        failing.result(timeout=5)
+    for future in (before, after):
+        with pytest.raises(sqlite3.OperationalError, match="Write batch aborted"):
+            future.result(timeout=5)
+
+    # The writer is still usable and nothing from the aborted batch was committed
+    storage.backfill_daily_message_counts({"2025-01-02": 5})
+    assert storage.get_daily_message_counts(days=100000) == {"2025-01-02": 5}
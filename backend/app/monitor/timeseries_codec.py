@@ -0,0 +1,174 @@
+# Copyright (c) 2025 BunkerM
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# You may not use this file except in compliance with the License.
+# http://www.apache.org/licenses/LICENSE-2.0
+# Distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND.
+#
+# timeseries_codec.py
+"""Gorilla-style compression of time series chunks.
+
+Timestamps are stored as delta-of-deltas and values as the XOR of each
+float with its predecessor, both in variable-width bit fields, so a series
+sampled at a steady interval costs about one bit per timestamp. Decoding
+parses the bit stream into integer arrays and then rebuilds a whole chunk
+at once: running sums restore the timestamps, a running XOR restores the
+float bit patterns, and a single buffer cast turns those into floats.
+"""
+import operator
+import struct
+from array import array
+from itertools import accumulate
+from typing import Sequence
+
+_HEADER = struct.Struct(">Iq")  # sample count, first timestamp
+
+# Delta-of-delta buckets: (prefix bits, prefix length, value bits)
+_DOD_BUCKETS = (
+    (0b10, 2, 7),
+    (0b110, 3, 9),
+    (0b1110, 4, 12),
+)
+_DOD_FALLBACK = (0b1111, 4, 32)
+
+
+class _BitWriter:
+    __slots__ = ("out", "acc", "bits")
+
+    def __init__(self):
+        self.out = bytearray()
+        self.acc = 0
+        self.bits = 0
+
+    def write(self, value: int, width: int):
+        self.acc = (self.acc << width) | value
+        self.bits += width
+        while self.bits >= 8:
+            self.bits -= 8
+            self.out.append((self.acc >> self.bits) & 0xFF)
+        self.acc &= (1 << self.bits) - 1
+
+    def getvalue(self) -> bytes:
+        if self.bits:
+            return bytes(self.out) + bytes([(self.acc << (8 - self.bits)) & 0xFF])
+        return bytes(self.out)
+
+
+class _BitReader:
+    __slots__ = ("data", "pos")
+
+    def __init__(self, data: bytes):
+        self.data = data
+        self.pos = 0
+
+    def read(self, width: int) -> int:
+        start, end = self.pos, self.pos + width
+        first_byte, last_byte = start >> 3, (end + 7) >> 3
+        window = int.from_bytes(self.data[first_byte:last_byte], "big")
+        self.pos = end
+        return (window >> ((last_byte << 3) - end)) & ((1 << width) - 1)
+
+    def read_bit(self) -> int:
+        pos = self.pos
+        self.pos = pos + 1
+        return (self.data[pos >> 3] >> (7 - (pos & 7))) & 1
+
+
+def encode_timestamps(timestamps: Sequence[int]) -> bytes:
+    """Encode ascending integer timestamps"""
+    if not timestamps:
+        return _HEADER.pack(0, 0)
+    writer = _BitWriter()
+    previous, previous_delta = timestamps[0], 0
+    for timestamp in timestamps[1:]:
+        delta = timestamp - previous
+        dod = delta - previous_delta
+        if dod == 0:
+            writer.write(0, 1)
+        else:
+            for prefix, prefix_bits, width in _DOD_BUCKETS:
+                half = 1 << (width - 1)
+                if -half < dod <= half:
+                    writer.write(prefix, prefix_bits)
+                    writer.write(dod + half - 1, width)
+                    break
+            else:
+                prefix, prefix_bits, width = _DOD_FALLBACK
+                writer.write(prefix, prefix_bits)
+                writer.write(dod & 0xFFFFFFFF, width)
+        previous, previous_delta = timestamp, delta
+    return _HEADER.pack(len(timestamps), timestamps[0]) + writer.getvalue()
+
+
+def decode_timestamps(data: bytes) -> array:
+    count, first = _HEADER.unpack_from(data)
+    if not count:
+        return array('q')
+    reader = _BitReader(data[_HEADER.size:])
+    dods = []
+    append = dods.append
+    for _ in range(count - 1):
+        if not reader.read_bit():
+            append(0)
+            continue
+        for _, prefix_bits, width in _DOD_BUCKETS:
+            if not reader.read_bit():
+                append(reader.read(width) - (1 << (width - 1)) + 1)
+                break
+        else:
+            dod = reader.read(32)
+            append(dod - (1 << 32) if dod & 0x80000000 else dod)
+    deltas = accumulate(dods, operator.add)
+    return array('q', accumulate(deltas, operator.add, initial=first))
+
+
+def encode_values(values: Sequence[float]) -> bytes:
+    """Encode floats as XORs with their predecessor"""
+    if not values:
+        return b""
+    bits = array('Q', array('d', values).tobytes())
+    writer = _BitWriter()
+    writer.write(bits[0], 64)
+    previous = bits[0]
+    leading, trailing = -1, 0
+    for current in bits[1:]:
+        xor = previous ^ current
+        previous = current
+        if not xor:
+            writer.write(0, 1)
+            continue
+        new_leading = min(64 - xor.bit_length(), 31)
+        new_trailing = (xor & -xor).bit_length() - 1
+        if leading >= 0 and new_leading >= leading and new_trailing >= trailing:
+            # Meaningful bits fit the previous window: reuse it
+            writer.write(0b10, 2)
+            writer.write(xor >> trailing, 64 - leading - trailing)
+        else:
+            leading, trailing = new_leading, new_trailing
+            width = 64 - leading - trailing
+            writer.write(0b11, 2)
+            writer.write(leading, 5)
+            writer.write(width & 0x3F, 6)  # 64 is stored as 0
+            writer.write(xor >> trailing, width)
+    return writer.getvalue()
+
+
+def decode_values(data: bytes, count: int) -> array:
+    if not count:
+        return array('d')
+    reader = _BitReader(data)
+    xors = [reader.read(64)]
+    append = xors.append
+    leading = trailing = width = 0
+    for _ in range(count - 1):
+        if not reader.read_bit():
+            append(0)
+            continue
+        if reader.read_bit():
+            leading = reader.read(5)
+            width = reader.read(6) or 64
+            trailing = 64 - leading - width
+        append(reader.read(width) << trailing)
+    patterns = array('Q', accumulate(xors, operator.xor))
+    return array('d', patterns.tobytes())
+
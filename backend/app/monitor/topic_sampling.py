@@ -0,0 +1,202 @@
+# Copyright (c) 2025 BunkerM
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# You may not use this file except in compliance with the License.
+# http://www.apache.org/licenses/LICENSE-2.0
+# Distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND.
+#
+# topic_sampling.py
+import logging
+import math
+import threading
+import time
+import zlib
+from typing import Dict, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+SAMPLING_MODES = ("off", "hashed", "rotating")
+
+
+class TopicSampler:
+    """Chooses which topic prefixes the monitor subscribes to.
+
+    Prefixes are the first `depth` levels of a topic. They are learned
+    during short discovery windows in which the monitor subscribes to `#`.
+    Outside those windows only a `fraction` of known prefixes is subscribed:
+
+      hashed    a fixed subset, chosen by a stable hash of the prefix
+      rotating  interleaved slices of the prefixes, advancing every period
+
+    Every `period` seconds the traffic of the sampled prefixes is scaled up
+    to an estimate of all traffic. It is a cluster sample, so the estimate
+    comes with a 95% error bound, and it is reported next to the exact
+    total that the broker publishes in `$SYS`.
+    """
+
+    def __init__(self, mode: str = "off", fraction: float = 0.1, depth: int = 1, period: int = 300,
+                 discovery_interval: int = 3600, discovery_seconds: int = 30, max_prefixes: int = 10_000):
+        if mode not in SAMPLING_MODES:
+            raise ValueError(f"Unknown sampling mode '{mode}', expected one of {SAMPLING_MODES}")
+        self.mode = mode
+        self.fraction = min(1.0, max(fraction, 0.001))
+        self.depth = max(1, depth)
+        self.period = period
+        self.discovery_interval = discovery_interval
+        self.discovery_seconds = discovery_seconds
+        self.max_prefixes = max_prefixes
+        self.known: Dict[str, float] = {}  # prefix -> monotonic time last seen
+        self.selected: Set[str] = set()
+        self.discovering = self.enabled
+        self.rotation = 0
+        self.last_period: Optional[Dict] = None
+        self._counts: Dict[str, int] = {}
+        self._sys_total: Optional[int] = None
+        self._sys_delta = 0
+        now = time.monotonic()
+        self._discovery_started = now
+        self._last_discovery = now
+        self._period_started = now
+        self._subscribed: Set[str] = set()
+        self._client = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode != "off"
+
+    def prefix_of(self, topic: str) -> str:
+        end = -1
+        for _ in range(self.depth):
+            end = topic.find('/', end + 1)
+            if end == -1:
+                return topic
+        return topic[:end]
+
+    def accept(self, topic: str) -> bool:
+        """Note a user message; returns whether it belongs to the sample"""
+        prefix = self.prefix_of(topic)
+        with self._lock:
+            if prefix in self.known or len(self.known) < self.max_prefixes:
+                self.known[prefix] = time.monotonic()
+            if prefix not in self.selected:
+                return False
+            self._counts[prefix] = self._counts.get(prefix, 0) + 1
+            return True
+
+    def observe_sys_total(self, total: int) -> int:
+        """Feed the broker's cumulative PUBLISH count; returns messages since the last value"""
+        with self._lock:
+            if self._sys_total is None:
+                delta = 0
+            elif total < self._sys_total:
+                delta = total  # broker restarted
+            else:
+                delta = total - self._sys_total
+            self._sys_total = total
+            self._sys_delta += delta
+            return delta
+
+    def subscriptions(self) -> List[str]:
+        """Topic filters the monitor should hold for user traffic"""
+        if not self.enabled or self.discovering:
+            return ["#"]
+        return sorted(f"{prefix}/#" for prefix in self.selected)
+
+    def _select(self) -> Set[str]:
+        prefixes = sorted(self.known)
+        if self.mode == "hashed":
+            threshold = self.fraction * 0xFFFFFFFF
+            return {p for p in prefixes if zlib.crc32(p.encode()) <= threshold}
+        slices = max(1, math.ceil(1 / self.fraction))
+        current = self.rotation % slices
+        return {p for i, p in enumerate(prefixes) if i % slices == current}
+
+    def _close_period(self, now: float):
+        n = len(self.selected)
+        counts = [self._counts.get(prefix, 0) for prefix in self.selected]
+        sampled = sum(counts)
+        total_prefixes = len(self.known)
+        result = {
+            "seconds": round(now - self._period_started, 1),
+            "sampled_prefixes": n,
+            "known_prefixes": total_prefixes,
+            "sampled_messages": sampled,
+            "sys_messages": self._sys_delta if self._sys_total is not None else None,
+            "estimated_messages": None,
+            "error_bound_95": None,
+            "scale_factor": round(self._sys_delta / sampled, 4) if sampled and self._sys_total is not None else None,
+        }
+        if n:
+            mean = sampled / n
+            variance = sum((c - mean) ** 2 for c in counts) / (n - 1) if n > 1 else 0.0
+            finite_population = max(0.0, 1 - n / total_prefixes) if total_prefixes else 0.0
+            standard_error = total_prefixes * math.sqrt(finite_population * variance / n)
+            result["estimated_messages"] = round(total_prefixes * mean)
+            result["error_bound_95"] = round(1.96 * standard_error)
+        self.last_period = result
+        self._counts = {}
+        self._sys_delta = 0
+        self._period_started = now
+
+    def tick(self, now: Optional[float] = None):
+        """Advance discovery, rotation and estimation periods; re-subscribe on changes"""
+        if not self.enabled:
+            return
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            if self.discovering and now - self._discovery_started >= self.discovery_seconds:
+                self.discovering = False
+                self._last_discovery = now
+                # Forget prefixes that went quiet for several discovery rounds
+                stale = now - 3 * max(self.discovery_interval, self.discovery_seconds)
+                self.known = {p: seen for p, seen in self.known.items() if seen >= stale}
+                self.selected = self._select()
+                logger.info(f"Topic sampling: {len(self.selected)} of {len(self.known)} prefixes selected")
+            elif not self.discovering and now - self._last_discovery >= self.discovery_interval:
+                self.discovering = True
+                self._discovery_started = now
+
+            if now - self._period_started >= self.period:
+                self._close_period(now)
+                if self.mode == "rotating" and not self.discovering:
+                    self.rotation += 1
+                    self.selected = self._select()
+        self.apply()
+
+    def attach(self, client):
+        """Use `client` for subscription changes; call from its on_connect"""
+        with self._lock:
+            self._client = client
+            self._subscribed = set()
+        self.apply()
+
+    def apply(self):
+        client = self._client
+        if client is None:
+            return
+        with self._lock:
+            wanted = set(self.subscriptions())
+            removed = sorted(self._subscribed - wanted)
+            added = sorted(wanted - self._subscribed)
+            self._subscribed = wanted
+        if added:
+            client.subscribe([(topic_filter, 0) for topic_filter in added])
+        if removed:
+            client.unsubscribe(removed)
+
+    def summary(self) -> Dict:
+        with self._lock:
+            return {
+                "mode": self.mode,
+                "fraction": self.fraction if self.enabled else 1.0,
+                "prefix_depth": self.depth,
+                "discovering": self.discovering,
+                "known_prefixes": len(self.known),
+                "sampled_prefixes": len(self.selected) if self.enabled else len(self.known),
+                "period_seconds": self.period,
+                # Multiplier for per-topic counts: hashed prefixes are fully observed,
+                # rotating ones only for one slice of every rotation cycle
+                "topic_scale": math.ceil(1 / self.fraction) if self.mode == "rotating" else 1,
+                "last_period": self.last_period,
+            }
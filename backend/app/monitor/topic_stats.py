@@ -0,0 +1,190 @@
+# Copyright (c) 2025 BunkerM
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# You may not use this file except in compliance with the License.
+# http://www.apache.org/licenses/LICENSE-2.0
+# Distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND.
+#
+# topic_stats.py
+import heapq
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+
+class SpaceSaving:
+    """Weighted Space-Saving summary holding at most `capacity` keys.
+
+    Each monitored key keeps an estimated weight and the error it inherited
+    when it replaced an evicted key, so its true weight lies within
+    [weight - error, weight]. Any key that is not monitored has a true
+    weight of at most `min_weight()`.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.counters: Dict[str, List[float]] = {}  # key -> [weight, error]
+        self._heap: List[Tuple[float, str]] = []  # lazy min-heap of (weight, key)
+
+    def clear(self):
+        self.counters.clear()
+        self._heap.clear()
+
+    def _push(self, weight: float, key: str):
+        heapq.heappush(self._heap, (weight, key))
+        # Stale heap entries accumulate on every update; compact them away
+        if len(self._heap) > self.capacity * 8:
+            self._heap = [(c[0], k) for k, c in self.counters.items()]
+            heapq.heapify(self._heap)
+
+    def _pop_min(self) -> Tuple[str, float]:
+        while True:
+            weight, key = heapq.heappop(self._heap)
+            counter = self.counters.get(key)
+            if counter is not None and counter[0] == weight:
+                return key, weight
+
+    def min_weight(self) -> float:
+        if len(self.counters) < self.capacity:
+            return 0
+        while True:
+            weight, key = self._heap[0]
+            counter = self.counters.get(key)
+            if counter is not None and counter[0] == weight:
+                return weight
+            heapq.heappop(self._heap)
+
+    def add(self, key: str, weight: float = 1):
+        counter = self.counters.get(key)
+        if counter is not None:
+            counter[0] += weight
+            self._push(counter[0], key)
+        elif len(self.counters) < self.capacity:
+            self.counters[key] = [weight, 0]
+            self._push(weight, key)
+        else:
+            evicted, min_weight = self._pop_min()
+            del self.counters[evicted]
+            self.counters[key] = [min_weight + weight, min_weight]
+            self._push(min_weight + weight, key)
+
+
+class _Bucket:
+    __slots__ = ("bucket_id", "messages", "payload_bytes")
+
+    def __init__(self, capacity: int):
+        self.bucket_id = -1
+        self.messages = SpaceSaving(capacity)
+        self.payload_bytes = SpaceSaving(capacity)
+
+
+class TopTopicsTracker:
+    """Tracks heavy-hitter topics by message count and payload bytes.
+
+    Traffic is summarised into a ring of fixed-width time buckets, each with
+    two Space-Saving summaries of `capacity` topics. Memory is therefore
+    fixed at `buckets * 2 * capacity` counters regardless of how many
+    distinct topics are published. Sliding windows are answered by merging
+    the buckets they cover, scaling the oldest, partially covered bucket by
+    its overlap with the window.
+    """
+
+    WINDOWS = {"1m": 60, "15m": 900, "1h": 3600}
+
+    def __init__(self, capacity: int = 100, bucket_seconds: int = 60, max_window: int = 3600):
+        self.capacity = capacity
+        self.bucket_seconds = bucket_seconds
+        # One extra bucket so the partially covered oldest bucket is still held
+        self.num_buckets = max_window // bucket_seconds + 1
+        self._buckets = [_Bucket(capacity) for _ in range(self.num_buckets)]
+        self._lock = threading.Lock()
+
+    def _current_bucket(self, now: float) -> _Bucket:
+        bucket_id = int(now // self.bucket_seconds)
+        bucket = self._buckets[bucket_id % self.num_buckets]
+        if bucket.bucket_id != bucket_id:
+            bucket.bucket_id = bucket_id
+            bucket.messages.clear()
+            bucket.payload_bytes.clear()
+        return bucket
+
+    def record(self, topic: str, payload_size: int, now: Optional[float] = None):
+        """Account one message on `topic` carrying `payload_size` bytes"""
+        if now is None:
+            now = time.monotonic()
+        with self._lock:
+            bucket = self._current_bucket(now)
+            bucket.messages.add(topic, 1)
+            if payload_size:
+                bucket.payload_bytes.add(topic, payload_size)
+
+    def record_batch(self, totals: Dict[str, Tuple[int, int]], now: Optional[float] = None):
+        """Add each topic's totals to the current bucket's message and byte Space-Saving summaries"""
+        if now is None:
+            now = time.monotonic()
+        with self._lock:
+            bucket = self._current_bucket(now)
+            for topic, (messages, payload_bytes) in totals.items():
+                bucket.messages.add(topic, messages)
+                if payload_bytes:
+                    bucket.payload_bytes.add(topic, payload_bytes)
+
+    def top(self, window: str = "15m", limit: int = 10, now: Optional[float] = None) -> Dict:
+        """Return the top topics by messages and by bytes over a sliding window"""
+        window_seconds = self.WINDOWS[window]
+        if now is None:
+            now = time.monotonic()
+        limit = max(1, min(limit, self.capacity))
+        window_start = now - window_seconds
+        current_id = int(now // self.bucket_seconds)
+        oldest_id = int(window_start // self.bucket_seconds)
+
+        merged = {"messages": {}, "payload_bytes": {}}
+        floors = {"messages": 0.0, "payload_bytes": 0.0}
+        with self._lock:
+            for bucket_id in range(oldest_id, current_id + 1):
+                bucket = self._buckets[bucket_id % self.num_buckets]
+                if bucket.bucket_id != bucket_id:
+                    continue
+                bucket_start = bucket_id * self.bucket_seconds
+                overlap = min(1.0, (bucket_start + self.bucket_seconds - window_start) / self.bucket_seconds)
+                for name in merged:
+                    floors[name] += self._merge(merged[name], getattr(bucket, name), overlap)
+
+        return {
+            "window": window,
+            "window_seconds": window_seconds,
+            "by_messages": self._ranked(merged["messages"], floors["messages"], limit),
+            "by_bytes": self._ranked(merged["payload_bytes"], floors["payload_bytes"], limit),
+        }
+
+    @staticmethod
+    def _merge(totals: Dict[str, List[float]], summary: SpaceSaving, scale: float) -> float:
+        """Fold one bucket summary into totals; returns the bucket's scaled floor.
+
+        Each total is [estimate, lower bound, sum of floors of buckets where
+        the key was monitored]. A key missing from a bucket may have had up
+        to that bucket's floor there, which `_ranked` adds to its upper bound.
+        """
+        floor = summary.min_weight() * scale
+        for key, (weight, error) in summary.counters.items():
+            entry = totals.get(key)
+            if entry is None:
+                entry = totals[key] = [0.0, 0.0, 0.0]
+            entry[0] += weight * scale
+            entry[1] += (weight - error) * scale
+            entry[2] += floor
+        return floor
+
+    @staticmethod
+    def _ranked(totals: Dict[str, List[float]], floor_total: float, limit: int) -> List[Dict]:
+        ranked = heapq.nlargest(limit, totals.items(), key=lambda item: item[1][0])
+        return [
+            {
+                "topic": key,
+                "estimate": round(estimate),
+                "lower_bound": round(lower),
+                "upper_bound": round(estimate + floor_total - present_floor),
+            }
+            for key, (estimate, lower, present_floor) in ranked
+        ]
@@ -0,0 +1,179 @@
+# Copyright (c) 2025 BunkerM
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# You may not use this file except in compliance with the License.
+# http://www.apache.org/licenses/LICENSE-2.0
+# Distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND.
+#
+# topic_tree.py
+import heapq
+import threading
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+
+class TopicNode:
+    __slots__ = ("messages", "bytes", "own_messages", "own_bytes", "children", "snap_messages", "snap_bytes")
+
+    def __init__(self):
+        self.messages = 0
+        self.bytes = 0
+        # Traffic published to exactly this topic, as opposed to the subtree totals above
+        self.own_messages = 0
+        self.own_bytes = 0
+        self.children: Dict[str, "TopicNode"] = {}
+        # Totals at the last history snapshot, used to store per-interval deltas
+        self.snap_messages = 0
+        self.snap_bytes = 0
+
+
+class TopicTree:
+    """Aggregates message and byte counts at every level of the topic hierarchy.
+
+    Every node holds the totals of its whole subtree, so a prefix such as
+    `factory/line1` or a `#`-terminated filter is answered without walking
+    its leaves, and separately the traffic published to exactly its topic.
+    The number of nodes is capped by `max_nodes`; once the cap is reached,
+    traffic for new topics is accounted to their deepest existing ancestor.
+    """
+
+    def __init__(self, max_nodes: int = 200_000):
+        self.max_nodes = max_nodes
+        self.root = TopicNode()
+        self.node_count = 1
+        self.truncated = False
+        self.started_at = datetime.now(timezone.utc).isoformat().replace('+00:00', 'Z')
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _split(prefix: str) -> List[str]:
+        return prefix.split('/') if prefix else []
+
+    def _add(self, topic: str, messages: int, payload_bytes: int):
+        node = self.root
+        node.messages += messages
+        node.bytes += payload_bytes
+        for level in topic.split('/'):
+            child = node.children.get(level)
+            if child is None:
+                if self.node_count >= self.max_nodes:
+                    self.truncated = True
+                    return
+                child = node.children[level] = TopicNode()
+                self.node_count += 1
+            node = child
+            node.messages += messages
+            node.bytes += payload_bytes
+        node.own_messages += messages
+        node.own_bytes += payload_bytes
+
+    def record(self, topic: str, payload_size: int):
+        """Account one message on `topic` at every level of its path"""
+        with self._lock:
+            self._add(topic, 1, payload_size)
+
+    def record_batch(self, totals: Dict[str, Tuple[int, int]]):
+        """Add each topic's (messages, bytes) to every node on its path, taking the lock once"""
+        with self._lock:
+            for topic, (messages, payload_bytes) in totals.items():
+                self._add(topic, messages, payload_bytes)
+
+    def _find(self, prefix: str) -> Optional[TopicNode]:
+        node = self.root
+        for level in self._split(prefix):
+            node = node.children.get(level)
+            if node is None:
+                return None
+        return node
+
+    def children(self, prefix: str = "", limit: int = 100, offset: int = 0) -> Optional[Dict]:
+        """Return a node's totals and one page of its direct children, busiest first"""
+        with self._lock:
+            node = self._find(prefix)
+            if node is None:
+                return None
+            # Only rank as far as the requested page, namespaces may have 100k+ children
+            ranked = heapq.nlargest(
+                offset + limit,
+                ((name, child.messages, child.bytes, len(child.children))
+                 for name, child in node.children.items()),
+                key=lambda item: item[1]
+            )
+            total_children = len(node.children)
+            messages, payload_bytes = node.messages, node.bytes
+
+        base = f"{prefix}/" if prefix else ""
+        return {
+            "prefix": prefix,
+            "messages": messages,
+            "bytes": payload_bytes,
+            "total_children": total_children,
+            "offset": offset,
+            "children": [
+                {
+                    "name": name,
+                    "prefix": base + name,
+                    "messages": child_messages,
+                    "bytes": child_bytes,
+                    "has_children": child_count > 0,
+                }
+                for name, child_messages, child_bytes, child_count in ranked[offset:offset + limit]
+            ],
+            "since": self.started_at,
+            "truncated": self.truncated,
+        }
+
+    def match(self, pattern: str) -> Dict:
+        """Sum the traffic of every node matching an MQTT filter such as `factory/+/line3/#`"""
+        levels = self._split(pattern)
+        totals = {"messages": 0, "bytes": 0, "matched_prefixes": 0}
+
+        def visit(node: TopicNode, depth: int):
+            if depth == len(levels):
+                # Without a trailing `#` only the topic itself matches, not its subtopics
+                if node.own_messages:
+                    totals["messages"] += node.own_messages
+                    totals["bytes"] += node.own_bytes
+                    totals["matched_prefixes"] += 1
+                return
+            level = levels[depth]
+            if level == '#':
+                # `#` also matches the parent level itself, whose totals already include the subtree
+                totals["messages"] += node.messages
+                totals["bytes"] += node.bytes
+                totals["matched_prefixes"] += 1
+            elif level == '+':
+                for child in node.children.values():
+                    visit(child, depth + 1)
+            else:
+                child = node.children.get(level)
+                if child is not None:
+                    visit(child, depth + 1)
+
+        with self._lock:
+            if levels:
+                visit(self.root, 0)
+        return {"pattern": pattern, **totals, "since": self.started_at, "truncated": self.truncated}
+
+    def snapshot_deltas(self, max_depth: int) -> List[Tuple[str, int, int, int]]:
+        """Collect (prefix, depth, messages, bytes) traffic since the previous snapshot.
+
+        Only prefixes up to `max_depth` levels deep with new traffic are returned.
+        """
+        rows = []
+        with self._lock:
+            stack = [("", 0, self.root)]
+            while stack:
+                prefix, depth, node = stack.pop()
+                messages = node.messages - node.snap_messages
+                payload_bytes = node.bytes - node.snap_bytes
+                if not messages:
+                    continue
+                rows.append((prefix, depth, messages, payload_bytes))
+                node.snap_messages = node.messages
+                node.snap_bytes = node.bytes
+                if depth < max_depth:
+                    base = f"{prefix}/" if depth else ""
+                    for name, child in node.children.items():
+                        stack.append((base + name, depth + 1, child))
+        return rows